@@ -0,0 +1,101 @@
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             os.path.pardir))
+from DiffEngines import ENGINES  # noqa: E402
+
+
+def source_code(rand, size):
+    """Исходный код: в основном уникальные строки"""
+    return [f"    value_{i} = compute({rand.randint(0, 10 ** 6)})\n"
+            for i in range(size)]
+
+
+def generated_code(rand, size):
+    """Сгенерированный код: много повторяющихся строк"""
+    lines = []
+    while len(lines) < size:
+        lines.extend(["    {\n", f"        \"id\": {len(lines)},\n",
+                      "        \"enabled\": true,\n", "    },\n"])
+    return lines[:size]
+
+
+def lockfile(rand, size):
+    """lock-файл: блоки из повторяющихся полей"""
+    lines = []
+    while len(lines) < size:
+        name = f"package-{rand.randint(0, 10 ** 6)}"
+        lines.extend([f"{name}:\n", "  dependencies:\n",
+                      "    core-js: ^3.0.0\n", "  integrity: sha512\n",
+                      "\n"])
+    return lines[:size]
+
+
+def csv_table(rand, size):
+    """CSV: строки из небольшого набора значений"""
+    return [f"{rand.randint(0, 20)},{rand.choice(['a', 'b', 'c'])},0\n"
+            for _ in range(size)]
+
+
+SHAPES = {
+    "source": source_code,
+    "generated": generated_code,
+    "lockfile": lockfile,
+    "csv": csv_table,
+}
+
+
+def edit(rand, lines, changes):
+    """Случайные вставки, удаления и замены строк"""
+    edited = list(lines)
+    for _ in range(changes):
+        position = rand.randrange(len(edited))
+        action = rand.random()
+        if action < 0.3:
+            del edited[position]
+        elif action < 0.6:
+            edited.insert(position, f"inserted {rand.random()}\n")
+        else:
+            edited[position] = f"replaced {rand.random()}\n"
+    return edited
+
+
+def run(lines, changes, engines, repeat):
+    print(f"{'shape':<10} {'engine':<10} {'seconds':>9} {'changed':>9}")
+    for shape, make in SHAPES.items():
+        rand = random.Random(0)
+        old = make(rand, lines)
+        new = edit(rand, old, changes)
+        for engine in engines:
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                opcodes = ENGINES[engine](old, new)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            changed = sum(i2 - i1 + j2 - j1
+                          for _, i1, i2, j1, j2 in opcodes)
+            print(f"{shape:<10} {engine:<10} {best:>9.3f} {changed:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Comparison of diff engines on typical file shapes")
+    parser.add_argument("--lines", type=int, default=20000,
+                        help="lines in a file")
+    parser.add_argument("--changes", type=int, default=500,
+                        help="edited lines")
+    parser.add_argument("--engines", nargs='+', default=list(ENGINES),
+                        choices=list(ENGINES))
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="runs of each engine, the best time is shown")
+    args = parser.parse_args()
+    run(args.lines, args.changes, args.engines, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
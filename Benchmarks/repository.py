@@ -0,0 +1,356 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import itertools
+import statistics
+import subprocess
+import tempfile
+
+CVS = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                   os.path.pardir, "CVS.py"))
+# оси, вдоль которых генерируются репозитории, и значения по умолчанию
+AXES = {
+    "files": 200,
+    "depth": 2,
+    "file_size": 4096,
+    "edit_density": 0.1,
+    "history": 5,
+    "branches": 2,
+}
+COMMANDS = ("init", "add", "commit", "status", "switch", "branch", "checkout",
+            "reset")
+# длина строки в генерируемых файлах
+LINE = 64
+# столько файлов примерно лежит в одной папке нижнего уровня
+FILES_IN_FOLDER = 8
+
+# запуск CVS.py, после которого процесс сам записывает в файл
+# пиковую память и число прочитанных и записанных байт
+BOOTSTRAP = r'''
+import os, sys, json, atexit, runpy
+stats_file, script = sys.argv[1], sys.argv[2]
+def report():
+    stats = {}
+    try:
+        with open("/proc/self/io") as f:
+            io = dict(line.split(": ") for line in f.read().splitlines())
+        stats["read_bytes"] = int(io["rchar"])
+        stats["write_bytes"] = int(io["wchar"])
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    stats["peak_rss"] = int(line.split()[1]) * 1024
+    except OSError:
+        try:
+            import resource
+        except ImportError:
+            resource = None
+        if resource is not None:
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            scale = 1 if sys.platform == "darwin" else 1024
+            stats["peak_rss"] = usage.ru_maxrss * scale
+            stats["read_bytes"] = usage.ru_inblock * 512
+            stats["write_bytes"] = usage.ru_oublock * 512
+    with open(stats_file, "w") as f:
+        json.dump(stats, f)
+atexit.register(report)
+sys.argv = sys.argv[2:]
+sys.path.insert(0, os.path.dirname(script))
+runpy.run_path(script, run_name="__main__")
+'''
+
+
+class BenchmarkException(Exception):
+    def __init__(self, message):
+        if message:
+            self.message = message
+
+    def __str__(self):
+        if self.message:
+            return f'Benchmark exception: {self.message}'
+        return 'Benchmark exception'
+
+
+class RepositoryBenchmark:
+    """
+    Репозиторий, сгенерированный по значениям осей config, и замеры
+    команд CVS над ним: время, пиковая память, прочитанные и записанные
+    байты каждого запуска
+    """
+    def __init__(self, path, config, seed=0):
+        self.path = path
+        self.config = config
+        self.rand = random.Random(seed)
+        self.samples = {command: [] for command in COMMANDS}
+        self._files = []
+        self._created = 0
+
+    def run(self, *arguments):
+        """Запуск команды CVS.py с замером, вывод команды возвращается"""
+        command = arguments[0]
+        with tempfile.NamedTemporaryFile(suffix=".json",
+                                         delete=False) as stats:
+            stats_file = stats.name
+        try:
+            start = time.perf_counter()
+            result = subprocess.run(
+                [sys.executable, "-c", BOOTSTRAP, stats_file, CVS,
+                 *arguments, self.path],
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+            wall = time.perf_counter() - start
+            with open(stats_file) as f:
+                sample = json.load(f)
+        finally:
+            os.remove(stats_file)
+        # команды CVS сообщают об ошибках в выводе, а не кодом возврата
+        failed = ("Incorrect input" in result.stdout or
+                  "exception" in result.stdout.lower() or
+                  "choose an empty folder" in result.stdout)
+        if result.returncode != 0 or failed:
+            raise BenchmarkException(
+                f"{' '.join(arguments)} failed:\n{result.stdout}")
+        sample["wall"] = wall
+        self.samples[command].append(sample)
+        return result.stdout
+
+    def _folder(self, number):
+        """Папка файла с номером number на глубине depth"""
+        depth = self.config["depth"]
+        if depth == 0:
+            return ''
+        folders = max(1, self.config["files"] // FILES_IN_FOLDER)
+        width = max(2, round(folders ** (1 / depth)))
+        return os.path.join(*(f"d{(number // width ** level) % width}"
+                              for level in range(depth)))
+
+    def _line(self):
+        return f"{self.rand.getrandbits(200):0{LINE - 1}x}"[:LINE - 1] + "\n"
+
+    def _new_file(self):
+        file = os.path.join(self._folder(self._created),
+                            f"file{self._created}.txt")
+        self._created += 1
+        absolute = os.path.join(self.path, file)
+        os.makedirs(os.path.dirname(absolute), exist_ok=True)
+        lines = max(1, self.config["file_size"] // LINE)
+        with open(absolute, 'w') as f:
+            f.writelines(self._line() for _ in range(lines))
+        self._files.append(file)
+
+    def generate(self):
+        for _ in range(self.config["files"]):
+            self._new_file()
+
+    def edit(self):
+        """
+        Изменение доли edit_density файлов: в каждом заменяется строка
+        на каждые 1024 байта, ещё один файл удаляется и один добавляется
+        """
+        count = max(1, round(len(self._files) * self.config["edit_density"]))
+        for file in self.rand.sample(self._files, min(count,
+                                                      len(self._files))):
+            absolute = os.path.join(self.path, file)
+            with open(absolute) as f:
+                lines = f.readlines()
+            for _ in range(max(1, len(lines) * LINE // 1024)):
+                lines[self.rand.randrange(len(lines))] = self._line()
+            with open(absolute, 'w') as f:
+                f.writelines(lines)
+        if len(self._files) > 1:
+            removed = self._files.pop(self.rand.randrange(len(self._files)))
+            os.remove(os.path.join(self.path, removed))
+        self._new_file()
+
+    def save_state(self, tag):
+        self.run("add")
+        self.run("commit", "-t", tag)
+
+    def scenario(self):
+        """
+        init, первый коммит, history - 1 коммитов с изменениями, status
+        чистой и изменённой папки, switch в начало истории и обратно,
+        branches веток от предпоследнего коммита с checkout на main
+        и reset к началу истории
+        """
+        history = self.config["history"]
+        self.run("init")
+        self.generate()
+        self.save_state("v0")
+        for i in range(1, history):
+            self.edit()
+            self.save_state(f"v{i}")
+        self.run("status")
+        self.edit()
+        self.run("status")
+        self.save_state(f"v{history}")
+        self.run("switch", "-t", "v0")
+        self.run("switch", "-t", f"v{history}")
+        for branch in range(self.config["branches"]):
+            self.run("checkout", "-b", "main")
+            self.run("switch", "-1")
+            self.run("branch", "-b", f"branch{branch}")
+            self._files = self._tracked_files()
+            self.edit()
+            self.save_state(f"b{branch}")
+        self.run("checkout", "-b", "main")
+        self.run("reset", "-t", "v0")
+
+    def _tracked_files(self):
+        files = []
+        for folder, dirs, names in os.walk(self.path):
+            if folder == self.path:
+                dirs.remove("repository")
+            files.extend(os.path.relpath(os.path.join(folder, name),
+                                         self.path) for name in names)
+        return sorted(files)
+
+    def summary(self):
+        """Медианы времени и байт и наибольшая память по командам"""
+        summary = {}
+        for command, samples in self.samples.items():
+            if not samples:
+                continue
+            summary[command] = {
+                "runs": len(samples),
+                "wall": statistics.median(x["wall"] for x in samples),
+                "peak_rss": max(x.get("peak_rss", 0) for x in samples),
+                "read_bytes": statistics.median(
+                    x.get("read_bytes", 0) for x in samples),
+                "write_bytes": statistics.median(
+                    x.get("write_bytes", 0) for x in samples),
+            }
+        return summary
+
+
+def configurations(axes):
+    """Все сочетания значений осей"""
+    names = list(axes)
+    for values in itertools.product(*(axes[name] for name in names)):
+        yield dict(zip(names, values))
+
+
+def run_benchmarks(axes, seed):
+    results = []
+    for config in configurations(axes):
+        path = tempfile.mkdtemp(prefix="cvs-benchmark-")
+        try:
+            benchmark = RepositoryBenchmark(path, config, seed)
+            benchmark.scenario()
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+        results.append({"config": config, "summary": benchmark.summary(),
+                        "samples": benchmark.samples})
+        print_summary(config, benchmark.summary())
+    return {"machine": {"python": platform.python_version(),
+                        "platform": platform.platform(),
+                        "cpus": os.cpu_count()},
+            "results": results}
+
+
+def config_key(config):
+    return tuple(sorted(config.items()))
+
+
+def print_summary(config, summary):
+    print(", ".join(f"{name}={value}" for name, value in config.items()))
+    print(f"  {'command':<10} {'runs':>5} {'wall, s':>9} {'rss, MB':>9} "
+          f"{'read, KB':>10} {'write, KB':>10}")
+    for command, row in summary.items():
+        print(f"  {command:<10} {row['runs']:>5} {row['wall']:>9.3f} "
+              f"{row['peak_rss'] / 2 ** 20:>9.1f} "
+              f"{row['read_bytes'] / 1024:>10.1f} "
+              f"{row['write_bytes'] / 1024:>10.1f}")
+
+
+def compare(results, baseline, threshold):
+    """
+    Отношения медиан к базовым замерам для одинаковых конфигураций,
+    список регрессий: отношение времени или памяти больше threshold
+    """
+    base = {config_key(x["config"]): x["summary"]
+            for x in baseline["results"]}
+    regressions = []
+    for result in results["results"]:
+        old = base.get(config_key(result["config"]))
+        if old is None:
+            continue
+        print(", ".join(f"{name}={value}"
+                        for name, value in result["config"].items()))
+        print(f"  {'command':<10} {'wall':>7} {'rss':>7} {'read':>7} "
+              f"{'write':>7}")
+        for command, row in result["summary"].items():
+            if command not in old:
+                continue
+            ratios = {metric: row[metric] / old[command][metric]
+                      if old[command][metric] else 1.0
+                      for metric in ("wall", "peak_rss", "read_bytes",
+                                     "write_bytes")}
+            print(f"  {command:<10} {ratios['wall']:>7.2f} "
+                  f"{ratios['peak_rss']:>7.2f} "
+                  f"{ratios['read_bytes']:>7.2f} "
+                  f"{ratios['write_bytes']:>7.2f}")
+            for metric in ("wall", "peak_rss"):
+                if ratios[metric] > threshold:
+                    regressions.append(
+                        f"{command} {metric} x{ratios[metric]:.2f} "
+                        f"at {dict(result['config'])}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Timing of CVS commands on generated repositories. "
+                    "Every combination of axis values is measured")
+    parser.add_argument("--files", type=int, nargs='+',
+                        default=[AXES["files"]], help="files in the folder")
+    parser.add_argument("--depth", type=int, nargs='+',
+                        default=[AXES["depth"]], help="depth of folders")
+    parser.add_argument("--file-size", type=int, nargs='+',
+                        default=[AXES["file_size"]], help="bytes in a file")
+    parser.add_argument("--edit-density", type=float, nargs='+',
+                        default=[AXES["edit_density"]],
+                        help="part of files changed by each commit")
+    parser.add_argument("--history", type=int, nargs='+',
+                        default=[AXES["history"]],
+                        help="commits on the main branch, at least 2")
+    parser.add_argument("--branches", type=int, nargs='+',
+                        default=[AXES["branches"]],
+                        help="branches from one commit")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON file for the results")
+    parser.add_argument("--results", help="JSON file with saved results "
+                                          "to compare instead of running")
+    parser.add_argument("--baseline", help="JSON file with results "
+                                           "to compare with")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="ratio of wall time or memory to the baseline "
+                             "reported as a regression")
+    args = parser.parse_args()
+
+    if args.results is not None:
+        with open(args.results) as f:
+            results = json.load(f)
+    else:
+        axes = {name: getattr(args, name) for name in AXES}
+        if min(axes["history"]) < 2:
+            parser.error("history must be at least 2")
+        results = run_benchmarks(axes, args.seed)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print("Regression:", regression)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
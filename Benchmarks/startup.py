@@ -0,0 +1,89 @@
+import os
+import sys
+import tempfile
+import argparse
+import subprocess
+
+CVS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                   os.path.pardir, "CVS.py")
+# допустимое время загрузки модулей при запуске команды, мс
+BUDGETS = {
+    "log": 100,
+    "branch": 100,
+    "config": 100,
+    "status": 150,
+}
+# модули сравнения файлов, которые не нужны командам без сравнения
+HEAVY_MODULES = ("Comparers", "DiffEngines", "DeltasFormat", "difflib",
+                 "filecmp", "multiprocessing")
+LIGHT_COMMANDS = ("log", "branch", "config")
+
+
+def import_times(command, path):
+    """
+    Модули, загруженные при запуске команды, по данным -X importtime:
+    имя модуля -> собственное время загрузки в микросекундах
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", CVS, command, path],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_time, _, name = line[len("import time:"):].split("|")
+        if self_time.strip().isdigit():
+            times[name.strip()] = int(self_time)
+    return times
+
+
+def startup_time(command, path, repeat):
+    """
+    Наименьшее за repeat запусков суммарное время загрузки модулей
+    в миллисекундах и модули последнего запуска
+    """
+    best = None
+    for _ in range(repeat):
+        times = import_times(command, path)
+        total = sum(times.values()) / 1000
+        best = total if best is None else min(best, total)
+    return best, times
+
+
+def check(commands, repeat):
+    """Сообщения о превышении бюджета и лишних модулях, таблица времени"""
+    problems = []
+    with tempfile.TemporaryDirectory() as path:
+        subprocess.run([sys.executable, CVS, "init", path],
+                       stdout=subprocess.DEVNULL, check=True)
+        print(f"{'command':<10} {'ms':>7} {'budget':>7}")
+        for command in commands:
+            total, times = startup_time(command, path, repeat)
+            print(f"{command:<10} {total:>7.1f} {BUDGETS[command]:>7}")
+            if total > BUDGETS[command]:
+                problems.append(f"{command}: imports take {total:.1f} ms, "
+                                f"budget is {BUDGETS[command]} ms")
+            if command in LIGHT_COMMANDS:
+                heavy = [x for x in HEAVY_MODULES if x in times]
+                if heavy:
+                    problems.append(f"{command}: loads {', '.join(heavy)}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time of module imports on CVS.py start, "
+                    "fails if it is over the budget")
+    parser.add_argument("--commands", nargs='+', default=list(BUDGETS),
+                        choices=list(BUDGETS))
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="runs of each command, the best time is shown")
+    args = parser.parse_args()
+    problems = check(args.commands, args.repeat)
+    for problem in problems:
+        print(problem)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == '__main__':
+    main()
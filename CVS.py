@@ -1,14 +1,17 @@
 import argparse
+import os
 import sys
-import Commands
+import Daemon
 
 
-def parse_args():
+def parse_args(argv=None):
     parser = argparse.ArgumentParser(
         description="CVS version control system.\n"
                     "Commands:\n"
                     "* init - initializes a repository in an empty folder\n"
                     "* add - checks folder changes\n"
+                    "\twith key -j N compares changed files in N processes, "
+                    "-j 0 - in one process per CPU\n"
                     "* commit - saves added changes\n"
                     "\ttag on key -t - tag to turn to the commit\n"
                     "\tcomment on key -c - just your comment\n"
@@ -29,11 +32,35 @@ def parse_args():
                     "* checkout - turns to a head commit of branch on key -b\n"
                     "* log - prints information about commit changes\n"
                     "* clearlog - deletes information about commit changes\n"
+                    "* config - without arguments shows repository settings\n"
+                    "\twith name=value sets a setting:\n"
+                    "\tsnapshot_interval - commits between folder snapshots, "
+                    "0 - only when deltas outgrow the folder\n"
+                    "\tcompression - none, zlib or lzma, "
+                    "compression_level - from 0 to 9\n"
+                    "\ttraversal_threads - threads reading folders "
+                    "while comparing\n"
+                    "\tdiff_engine - histogram, myers or difflib\n"
+                    "* recompress - rewrites saved changes "
+                    "with the compression from settings\n"
+                    "* migrate - updates a repository created by "
+                    "an older version\n"
+                    "* watch - records changed files until Ctrl+C, "
+                    "so other commands\n"
+                    "\tdo not walk the whole folder\n"
+                    "* daemon - serves commands until Ctrl+C, keeping "
+                    "repository data in memory,\n"
+                    "\tother calls of CVS.py send commands to it\n"
                     "You can put a CVSignore.txt file in root folder (where "
                     "repository initializes)\n"
                     "and write there regular expressions line by line "
                     "to describe files\n"
-                    "which you don't want to track.",
+                    "which you don't want to track.\n"
+                    "A pattern ending with / matches a folder, "
+                    "a pattern starting with / matches a path "
+                    "from the root folder.\n"
+                    "Keys --trace, --trace-json and --profile show where "
+                    "a command spends time.",
         formatter_class=argparse.RawTextHelpFormatter)
     parser.add_argument("command", nargs='+', help="CVS command")
     parser.add_argument("path", help="path to a folder with repository")
@@ -41,24 +68,41 @@ def parse_args():
                                                    "to create/checkout")
     parser.add_argument("-c", "--comment", help="comment for new commit")
     parser.add_argument("-t", "--tag", help="tag of the commit")
-    return parser.parse_args()
+    # число обязательно: необязательное значение ключа забирало бы
+    # путь к папке в "add -j path"
+    parser.add_argument("-j", "--jobs", type=int, metavar="N",
+                        help="number of processes comparing changed files "
+                             "in add, 0 - CPU count")
+    parser.add_argument("--trace", action="store_true",
+                        help="print time and counters of command phases")
+    parser.add_argument("--trace-json", metavar="FILE",
+                        help="write command phases to FILE "
+                             "in Chrome trace format")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="write cProfile statistics of the command "
+                             "to FILE")
+    args = parser.parse_args(argv)
+    if args.jobs == 0:
+        args.jobs = os.cpu_count()
+    return args
 
 
 def main():
     args = parse_args()
     if len(args.command) > 2:
         sys.exit("Input is wrong, please check it again.")
-    if not Commands.RepositoryInfo.does_dir_exist(args.path):
+    if not os.path.isdir(args.path):
         sys.exit(f"Given directory {args.path} does not exist.")
+    # файлы трассировки пишет и демон, у которого другая рабочая папка
+    for output in ("trace_json", "profile"):
+        if getattr(args, output) is not None:
+            setattr(args, output, os.path.abspath(getattr(args, output)))
+    if Daemon.run_in_daemon(args):
+        return
 
-    try:
-        if args.command[0] == 'RepositoryInfo':
-            raise AttributeError('Incorrect command input')
-        command = getattr(Commands, args.command[0])
-        command(args)
-    except Exception as e:
-        print(e)
-        print("Incorrect input. Call -h or --help to read manual.")
+    # команды загружаются, только если их не выполнил демон
+    import Commands
+    Commands.execute(args)
 
 
 if __name__ == '__main__':
@@ -1,169 +1,123 @@
 import queue
-from CommitInfo import CommitInfo
 
 
 class CommitsPathSeeker:
-    class PathStep:
-        def __init__(self, prev_step, commit, moving_back=None):
-            self.prev_step = prev_step
-            self.commit = commit
-            self.is_back = moving_back
-
     def __init__(self, switch_repository):
         self.repo = switch_repository
 
     def get_switch_back_track_by_steps(self, track, current, steps):
         """
         Добавление в очередь коммитов для прохождения
-        на steps шагов назад по ветке
+        на steps шагов назад по ветке.
+        Первый коммит репозитория не отменяется: без него
+        у папки не остаётся головного коммита
         """
-        if steps == 0:
-            return
-        if steps > 0 and current is None:
+        self._check_steps(steps)
+        commits = []
+        if current is not None:
+            commits = self._ancestors(current, steps + 1)
+        if len(commits) <= steps:
             raise self.repo.SwitchingException("You put a greater number "
                                                "than the commits amount.\n"
                                                "Rollback is impossible.")
-        track.put(current)
-        prev_commit = self.repo.get_commit_info(current).prev_commit
-        self.get_switch_back_track_by_steps(track, prev_commit, steps - 1)
+        for commit in commits[:steps]:
+            track.put(commit)
 
     def get_switch_forward_track_by_steps(self, track, current, branch, steps):
         """
         Добавление в очередь коммитов для прохождения
-        на steps шагов вперёд по ветке branch
+        на steps шагов вперёд по ветке branch.
+        Коммиты берутся с пути от current к головному коммиту ветки,
+        если current - его предок, иначе по ссылкам коммитов на следующие
         """
-        if steps == 0:
-            return
-        commit_info = self.repo.get_commit_info(current)
-        if commit_info.branch == branch:
-            next_commit = commit_info.next_on_branch
-        else:
-            next_commit = commit_info.branches_next[branch]
-        if steps > 0 and next_commit is None:
+        self._check_steps(steps)
+        branch_head = self.repo.get_branch_head_commit(branch)
+        commits = None
+        if branch_head is not None:
+            back, forward = self._path(current, branch_head)
+            if not back:
+                commits = forward[:steps]
+        if commits is None:
+            commits = self._next_commits_on_branch(current, branch, steps)
+        if len(commits) < steps:
             raise self.repo.SwitchingException("You put a greater number "
                                                "than the commits amount.\n"
                                                "Switching is impossible.")
-        track.put(next_commit)
-        self.get_switch_forward_track_by_steps(track, next_commit,
-                                               branch, steps - 1)
+        for commit in commits:
+            track.put(commit)
 
-    def get_paths_through_branches(self, start_commit, finish_commit_info):
-        """
-        Возвращает список пар:
-        1. Путь от коммита до коммита между разветвлениями;
-        2. Флаг движения назад по истории.
-        """
-        commits_to_check = queue.Queue()
-        finish_step = self.PathStep(None, finish_commit_info.commit)
-        self.add_nearest_commits_to_queue(commits_to_check, finish_step,
-                                          finish_commit_info)
-        while not commits_to_check.empty():
-            checking = commits_to_check.get()
-            if checking.commit == start_commit:
-                return self.get_paths_by_link(checking)
-            checking_info = self.repo.get_commit_info(checking.commit)
-            self.add_nearest_commits_to_queue(commits_to_check, checking,
-                                              checking_info)
+    def _check_steps(self, steps):
+        if steps < 1:
+            raise self.repo.SwitchingException("Put a positive amount "
+                                               "of steps.")
 
-    def add_nearest_commits_to_queue(self, queue, step, commit_info):
-        """
-        Добавление в очередь следующего коммита,
-        на который ссылается данный commit_info
-        """
-        if step.prev_step is None or \
-                (commit_info.prev_commit is not None and
-                 commit_info.prev_commit != step.prev_step.commit):
-            back_step = self.PathStep(step, commit_info.prev_commit, False)
-            if back_step is not None:
-                queue.put(back_step)
-        for next_commit in commit_info.get_all_next_commits():
-            if step.prev_step is None or \
-                    next_commit != step.prev_step.commit:
-                next_step = self.PathStep(step, next_commit, True)
-                queue.put(next_step)
+    def _next_commits_on_branch(self, current, branch, steps):
+        """Не больше steps следующих коммитов ветки branch после current"""
+        commits = []
+        while len(commits) < steps:
+            commit_info = self.repo.get_commit_info(current)
+            if commit_info.branch == branch:
+                current = commit_info.next_on_branch
+            else:
+                current = commit_info.branches_next.get(branch)
+            if current is None:
+                break
+            commits.append(current)
+        return commits
 
-    def get_path_on_branch(self, branch, start_commit, finish_commit_info):
+    def get_track_back_to(self, track, current, final):
         """
-        Возвращает две переменных: путь-очередь коммитов
-        и флаг движения изменений назад по истории.
+        Добавление в очередь коммитов, которые нужно отменить,
+        чтобы от коммита current вернуться назад к его предку final
         """
-        commits_to_check = queue.Queue()
-        finish = CommitInfo()
-        finish.commit = finish_commit_info.commit
-        back = self.prev_on_branch(finish_commit_info.prev_commit, finish)
-        next = self.next_on_branch(
-            finish_commit_info.get_next_commit_on_branch(branch),
-            finish)
-        commits_to_check.put(back)
-        commits_to_check.put(next)
-        while not commits_to_check.empty():
-            checking = commits_to_check.get()
-            if checking.commit is not None:
-                if checking.commit == start_commit:
-                    return self.get_commits_track_and_head_by_linked(checking)
-                checking_info = self.repo.get_commit_info(checking.commit)
-                if checking.next_on_branch is None:
-                    next = self.next_on_branch(
-                        checking_info.get_next_commit_on_branch(branch),
-                        checking)
-                    commits_to_check.put(next)
-                else:
-                    back = self.prev_on_branch(checking_info.prev_commit,
-                                               checking)
-                    commits_to_check.put(back)
+        back, forward = self._path(current, final)
+        if forward:
+            raise self.repo.SwitchingException(
+                f"Commit {final} is not behind commit {current}.")
+        for commit in back:
+            track.put(commit)
 
-    @staticmethod
-    def get_paths_by_link(path_step):
+    def get_paths_through_branches(self, start_commit, finish_commit_info):
         """
-        По односвязному списку шагов возвращает список путей
-        с соответствующим им направлениям.
+        Возвращает список пар:
+        1. Путь от коммита до коммита между разветвлениями;
+        2. Флаг движения назад по истории.
+        Путь идёт назад до общего предка коммитов и от него вперёд.
         """
+        back, forward = self._path(start_commit, finish_commit_info.commit)
         paths = []
-        path_queue = queue.Queue()
-        is_back = path_step.is_back
-        while path_step is not None:
-            if path_step.is_back != is_back and path_step.is_back is not None:
-                paths.append([path_queue, is_back])
-                path_queue = queue.Queue()
-                is_back = path_step.is_back
-            path_queue.put(path_step.commit)
-            path_step = path_step.prev_step
-        paths.append([path_queue, is_back])
+        if back:
+            paths.append([self._to_queue(back), True])
+        if forward:
+            paths.append([self._to_queue(forward), False])
         return paths
 
-    @staticmethod
-    def get_commits_track_and_head_by_linked(commit_info):
+    def _path(self, start_commit, finish_commit):
         """
-        По односвязному списку от элемента commit_info
-        возвращает очередь-путь и направление движения по истории коммитов.
+        Коммиты, отменяемые от start_commit до общего предка,
+        и коммиты, применяемые от него до finish_commit, по графу коммитов
         """
-        track = queue.Queue()
-        is_back = True
-        if commit_info.next_on_branch is None:
-            while commit_info.prev_commit is not None:
-                track.put(commit_info.commit)
-                commit_info = commit_info.prev_commit
-        else:
-            is_back = False
-            commit_info = commit_info.next_on_branch
-            while commit_info.next_on_branch is not None:
-                track.put(commit_info.commit)
-                commit_info = commit_info.next_on_branch
-            track.put(commit_info.commit)
-        return track, is_back
+        return self._query_graph(lambda graph: graph.path(start_commit,
+                                                          finish_commit))
 
-    @staticmethod
-    def prev_on_branch(prev_commit, current):
-        """Возвращает имя предыдущего коммита"""
-        prev = CommitInfo()
-        prev.commit = prev_commit
-        prev.next_on_branch = current
-        return prev
+    def _ancestors(self, commit, count):
+        return self._query_graph(lambda graph: graph.ancestors(commit, count))
+
+    def _query_graph(self, query):
+        """Запрос к графу коммитов, граф строится, если коммита в нём нет"""
+        store = self.repo.metadata_store
+        try:
+            return query(store.graph)
+        except KeyError:
+            # граф коммитов появился позже репозитория
+            commits = [(info.commit, info.prev_commit)
+                       for info in store.iter_commits()]
+            store.graph.rebuild(commits)
+            return query(store.graph)
 
     @staticmethod
-    def next_on_branch(next_commit, current):
-        """Возвращает имя следующего коммита"""
-        next = CommitInfo()
-        next.commit = next_commit
-        next.prev_commit = current
-        return next
+    def _to_queue(commits):
+        track = queue.Queue()
+        for commit in commits:
+            track.put(commit)
+        return track
@@ -0,0 +1,134 @@
+import io
+import os
+from Comparers import FilesComparer, BinaryComparer, BlockDelta
+import Tracing
+
+
+class DeltasComposer:
+    """
+    Складывает изменения нескольких коммитов в итоговое изменение
+    каждого файла, папка изменяется только в flush,
+    каждый файл записывается не больше одного раза.
+    """
+    ABSENT, BLOB, LINES, BYTES = range(4)
+
+    def __init__(self, repo):
+        self.repo = repo
+        self._states = {}
+
+    def next_state(self, deltas):
+        """Переход на один набор изменений вперёд"""
+        for file in deltas.deleted:
+            self._states[file] = (self.ABSENT, None)
+        for file, content in deltas.added.items():
+            self._states[file] = self._content_state(content)
+        for file, delta in deltas.changed.items():
+            file = self._relative(file)
+            if isinstance(delta, BlockDelta):
+                data = BinaryComparer.apply(self._bytes(file), delta.forward)
+                self._states[file] = (self.BYTES, data)
+                continue
+            lines = FilesComparer.next_file_version(self._lines(file), delta)
+            self._states[file] = (self.LINES, lines)
+
+    def previous_state(self, deltas):
+        """Откат на один набор изменений назад"""
+        for file in deltas.added:
+            self._states[file] = (self.ABSENT, None)
+        for file, content in deltas.deleted.items():
+            self._states[file] = self._content_state(content)
+        for file, delta in deltas.changed.items():
+            file = self._relative(file)
+            if isinstance(delta, BlockDelta):
+                data = BinaryComparer.apply(self._bytes(file), delta.backward)
+                self._states[file] = (self.BYTES, data)
+                continue
+            lines = FilesComparer.previous_file_version(self._lines(file),
+                                                        delta)
+            self._states[file] = (self.LINES, lines)
+
+    def restore_snapshot(self, manifest, tree_index):
+        """
+        Переход к сохранённому снимку папки от состояния,
+        записанного в индексе last_state
+        """
+        for file in tree_index:
+            if file not in manifest:
+                self._states[file] = (self.ABSENT, None)
+        for file, (digest, _) in manifest.items():
+            if file not in tree_index or tree_index.digest(file) != digest:
+                self._states[file] = (self.BLOB, digest)
+
+    @property
+    def affected_files(self):
+        return list(self._states)
+
+    def flush(self):
+        """Запись итогового состояния изменённых файлов в папку"""
+        for file, (kind, value) in sorted(self._states.items()):
+            absolute_file = os.path.join(self.repo.path, file)
+            if kind == self.ABSENT:
+                if os.path.lexists(absolute_file):
+                    self.repo._delete_files(self.repo.path, [file])
+                    Tracing.count("files_deleted")
+                continue
+            Tracing.count("files_written")
+            file_dir_path = os.path.dirname(absolute_file)
+            if not os.path.exists(file_dir_path):
+                os.makedirs(file_dir_path)
+            if kind == self.BLOB:
+                self.repo.object_store.copy_to(value, absolute_file)
+            elif kind == self.BYTES:
+                with open(absolute_file, 'wb') as f:
+                    f.write(value)
+                Tracing.count("bytes_written", len(value))
+            else:
+                with open(absolute_file, 'w') as f:
+                    f.writelines(value)
+                    Tracing.count("bytes_written", f.tell())
+        self._states = {}
+
+    def _relative(self, file):
+        """
+        Относительный путь файла, в изменениях старых коммитов
+        пути к изменённым файлам абсолютные
+        """
+        return os.path.relpath(os.path.join(self.repo.path, file),
+                               self.repo.path)
+
+    def _content_state(self, content):
+        """В коммитах старого формата вместо хэша хранятся строки файла"""
+        if isinstance(content, str):
+            return self.BLOB, content
+        return self.LINES, content
+
+    def _lines(self, file):
+        """Текущие строки файла с учётом уже сложенных изменений"""
+        if file in self._states:
+            kind, value = self._states[file]
+            if kind == self.LINES:
+                return value
+            if kind == self.BYTES:
+                return io.TextIOWrapper(io.BytesIO(value)).readlines()
+            if kind == self.BLOB:
+                with open(self.repo.object_store.path(value), 'r') as f:
+                    return f.readlines()
+        with open(os.path.join(self.repo.path, file), 'r') as f:
+            return f.readlines()
+
+    def _bytes(self, file):
+        """Текущее содержимое двоичного файла с учётом сложенных изменений"""
+        if file in self._states:
+            kind, value = self._states[file]
+            if kind == self.BYTES:
+                return value
+            if kind == self.LINES:
+                buffer = io.BytesIO()
+                text = io.TextIOWrapper(buffer)
+                text.writelines(value)
+                text.flush()
+                return buffer.getvalue()
+            if kind == self.BLOB:
+                return self.repo.object_store.read(value)
+        with open(os.path.join(self.repo.path, file), 'rb') as f:
+            return f.read()
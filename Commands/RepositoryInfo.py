@@ -1,7 +1,11 @@
 import os
 import sys
-import pickle
 from CommitInfo import CommitInfo
+from IgnorePatterns import IgnoreMatcher
+from Storages import ObjectStore, MetadataStore, Settings, TreeIndex
+from Journal import DirtyJournal
+import Tracing
+from .RepositorySession import RepositorySession
 
 
 class RepositoryInfo:
@@ -35,23 +39,66 @@ class RepositoryInfo:
                 return f'Commit exception: {self.message}'
             return 'Commit exception'
 
+    # кэш метаданных, общий для команд одного процесса,
+    # включается демоном, который выполняет много команд подряд
+    shared_cache = None
+
     def __init__(self, path):
         self.path = path
         self.last_state = os.path.join(path, "repository", "last_state")
         self.objects = os.path.join(path, "repository", "objects")
+        self.blobs = os.path.join(path, "repository", "blobs")
+        self.object_store = ObjectStore(self.blobs)
         self.branches = os.path.join(path, "repository", "branches.dat")
         self.commits = os.path.join(path, "repository", "commits.dat")
+        self.metadata = os.path.join(path, "repository", "metadata.db")
+        self.metadata_store = self._shared(
+            "metadata_store", [self.metadata],
+            lambda: MetadataStore(self.metadata))
         self._head_file = os.path.join(path, "repository", "head.txt")
+        self.session = self._shared(
+            "session", [self.metadata, self._head_file, self.branches],
+            lambda: RepositorySession(self))
         self.index = os.path.join(path, "repository", "index.dat")
+        self.tree_index = os.path.join(path, "repository", "tree_index.dat")
+        self.config = os.path.join(path, "repository", "config.ini")
+        self._settings = None
         self.logs = os.path.join(path, "repository", "logs.txt")
         self.tags = os.path.join(path, "repository", "tags.dat")
-        self.ignore_patterns = None
-        if os.path.isfile(os.path.join(path, 'CVSignore.txt')):
-            with open(os.path.join(path, 'CVSignore.txt'), 'r') as ignore:
-                self.ignore_patterns = ignore.read().split('\n')
+        self.journal = DirtyJournal(os.path.join(path, "repository"))
+        ignore_file = os.path.join(path, 'CVSignore.txt')
+        self.ignore_patterns = self._shared(
+            "ignore_patterns", [ignore_file],
+            lambda: self.read_ignore_patterns(ignore_file))
         self.repo_files = \
-            [self.branches, self.commits, self._head_file,
-             self.index, self.logs, self.tags]
+            [self.branches, self.metadata, self._head_file,
+             self.index, self.logs, self.tree_index]
+
+    def _shared(self, name, files, load):
+        """
+        Значение из общего кэша, если он включён и файлы files
+        не менялись, иначе load()
+        """
+        if self.shared_cache is None:
+            return load()
+        return self.shared_cache.get((os.path.abspath(self.path), name),
+                                     files, load)
+
+    @staticmethod
+    def read_ignore_patterns(ignore_file):
+        """Шаблоны игнорируемых файлов, None, если CVSignore.txt нет"""
+        if not os.path.isfile(ignore_file):
+            return None
+        with open(ignore_file, 'r') as ignore:
+            return IgnoreMatcher(ignore.read().split('\n'))
+
+    def load_tree_index(self):
+        """Индекс last_state, None, если файла индекса нет"""
+        tree_index = self._shared("tree_index", [self.tree_index],
+                                  lambda: TreeIndex.load(self.tree_index))
+        if tree_index is None or self.shared_cache is None:
+            return tree_index
+        return tree_index.copy()
 
     @staticmethod
     def is_dir_empty(path):
@@ -68,9 +115,30 @@ class RepositoryInfo:
     @property
     def head(self):
         """Имя головного коммита"""
-        with open(self._head_file, 'r') as f:
-            head = f.read()
-        return head
+        return self.session.head
+
+    @property
+    def settings(self):
+        """Настройки репозитория"""
+        if self._settings is None:
+            self._settings = self._shared("settings", [self.config],
+                                          lambda: Settings(self.config))
+        return self._settings
+
+    @property
+    def compression(self):
+        """Способ и уровень сжатия новых файлов изменений"""
+        return (self.settings.get("compression"),
+                self.settings.get_int("compression_level"))
+
+    def commit_size(self, commit):
+        """Размер файла изменений коммита в байтах"""
+        return os.path.getsize(os.path.join(self.objects, commit + ".dat"))
+
+    def flush(self):
+        """Запись изменённых за команду метаданных репозитория"""
+        with Tracing.span("flush"):
+            self.session.flush()
 
     def check_repository(self):
         """Проверка существования служебных файлов репозитория"""
@@ -80,60 +148,54 @@ class RepositoryInfo:
                                                    "initialized, call 'init' "
                                                    "in an empty folder "
                                                    "to do it.")
+        if self.is_legacy_layout():
+            raise self.RepositoryCheckingException("Repository has an old "
+                                                   "format, call 'migrate' "
+                                                   "to update it.")
         objects = RepositoryInfo.does_dir_exist(self.objects)
-        last_state = RepositoryInfo.does_dir_exist(self.last_state)
-        if not (objects and last_state):
+        blobs = RepositoryInfo.does_dir_exist(self.blobs)
+        if not (objects and blobs):
             raise self.RepositoryCheckingException("Repository is damaged")
         for file in self.repo_files:
             if not self.check_file(file):
                 raise self.RepositoryCheckingException("Repository is damaged")
 
+    def is_legacy_layout(self):
+        """
+        Хранит ли репозиторий last_state полной копией папки,
+        информацию о коммитах одним словарём в commits.dat
+        или тэги списком в tags.dat
+        """
+        return (self.does_dir_exist(self.last_state) or
+                self.check_file(self.commits) or
+                self.check_file(self.tags))
+
     def get_tag_commit(self, tag):
         """Имя коммита по тэгу, None, если тэга не существует"""
-        with open(self.tags, 'rb') as tags:
-            while True:
-                try:
-                    pair = pickle.load(tags)
-                    if tag == pair.tag:
-                        return pair.commit
-                except EOFError:
-                    return None
+        return self.session.get_tag_commit(tag)
+
+    def get_commit_tags(self, commit):
+        """Список тэгов коммита"""
+        return self.session.get_commit_tags(commit)
 
     def get_branch_head_commit(self, branch):
         """Имя головного коммита ветки, None, если ветки не существует"""
-        with open(self.branches, 'rb') as branches:
-            try:
-                branches_dict = pickle.load(branches)
-                if branch in branches_dict:
-                    return branches_dict[branch]
-                else:
-                    return None
-            except EOFError:
-                sys.exit("Make your first commit to setup branches.")
+        branches_dict = self.session.branches
+        if branches_dict is None:
+            sys.exit("Make your first commit to setup branches.")
+        return branches_dict.get(branch)
 
     def rewrite_head(self, commit):
         """Установка головного коммита"""
-        with open(self._head_file, 'w') as head:
-            head.write(commit)
+        self.session.set_head(commit)
 
     def rewrite_branch_head(self, commit_info):
         """Установка головного коммита ветки"""
-        branches_dict = {}
-        with open(self.branches, 'rb') as branches:
-            try:
-                branches_dict = pickle.load(branches)
-            except EOFError:
-                pass
-        branches_dict[commit_info.branch] = commit_info.commit
-        with open(self.branches, 'wb') as branches:
-            pickle.dump(branches_dict, branches)
+        self.session.set_branch_head(commit_info.branch, commit_info.commit)
 
     def get_commit_info(self, commit):
         """Информация о коммите по его имени"""
-        with open(self.commits, 'rb') as commits:
-            commits_dict = pickle.load(commits)
-            commit_info = commits_dict[commit]
-        return commit_info
+        return self.session.get_commit(commit)
 
     def get_head_commit_info(self):
         head = self.head
@@ -144,15 +206,7 @@ class RepositoryInfo:
 
     def add_commit_info(self, commit_info):
         """Обновление информации о коммите"""
-        commits_dict = {}
-        with open(self.commits, 'rb') as commits:
-            try:
-                commits_dict = pickle.load(commits)
-            except EOFError:
-                pass
-        commits_dict[commit_info.commit] = commit_info
-        with open(self.commits, 'wb') as commits:
-            pickle.dump(commits_dict, commits)
+        self.session.put_commit(commit_info)
 
     def set_new_commit(self, commit_index):
         """
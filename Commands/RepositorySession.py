@@ -0,0 +1,100 @@
+import os
+import pickle
+import Tracing
+
+# головной коммит ещё не прочитан, None - допустимое значение головы
+_NOT_READ = object()
+
+
+class RepositorySession:
+    """
+    Метаданные репозитория на время одной команды: головной коммит,
+    ветки, тэги и информация о коммитах читаются один раз по требованию,
+    изменения копятся в памяти и записываются в flush.
+    """
+    def __init__(self, repo):
+        self._repo = repo
+        self._head = _NOT_READ
+        self._head_dirty = False
+        self._branches = None
+        self._branches_dirty = False
+        self._tags = {}
+        self._new_tags = {}
+        self._commits = {}
+        self._dirty_commits = {}
+
+    @property
+    def head(self):
+        if self._head is _NOT_READ:
+            with open(self._repo._head_file, 'r') as f:
+                self._head = f.read()
+        return self._head
+
+    def set_head(self, commit):
+        self._head = commit
+        self._head_dirty = True
+
+    @property
+    def branches(self):
+        """Словарь ветка - головной коммит, None, если веток ещё нет"""
+        if self._branches is None and \
+                os.path.getsize(self._repo.branches) > 0:
+            with open(self._repo.branches, 'rb') as branches:
+                self._branches = pickle.load(branches)
+            Tracing.count("pickle_loads")
+        return self._branches
+
+    def set_branch_head(self, branch, commit):
+        if self.branches is None:
+            self._branches = {}
+        self._branches[branch] = commit
+        self._branches_dirty = True
+
+    def get_tag_commit(self, tag):
+        if tag not in self._tags:
+            self._tags[tag] = self._repo.metadata_store.get_tag_commit(tag)
+        return self._tags[tag]
+
+    def get_commit_tags(self, commit):
+        tags = self._repo.metadata_store.get_commit_tags(commit)
+        tags.extend(tag for tag, tagged in self._new_tags.items()
+                    if tagged == commit)
+        return sorted(tags)
+
+    def add_tag(self, tag, commit):
+        self._tags[tag] = commit
+        self._new_tags[tag] = commit
+
+    def get_commit(self, commit):
+        if commit not in self._commits:
+            self._commits[commit] = \
+                self._repo.metadata_store.get_commit(commit)
+        return self._commits[commit]
+
+    def put_commit(self, commit_info):
+        self._commits[commit_info.commit] = commit_info
+        self._dirty_commits[commit_info.commit] = commit_info
+
+    @property
+    def is_dirty(self):
+        """Есть ли изменения, ещё не записанные flush"""
+        return bool(self._dirty_commits or self._branches_dirty or
+                    self._new_tags or self._head_dirty)
+
+    def flush(self):
+        """Запись изменённых метаданных"""
+        if self._dirty_commits:
+            self._repo.metadata_store.put_commits(
+                self._dirty_commits.values())
+            self._dirty_commits = {}
+        if self._branches_dirty:
+            with open(self._repo.branches, 'wb') as branches:
+                pickle.dump(self._branches, branches)
+            self._branches_dirty = False
+        if self._new_tags:
+            self._repo.metadata_store.put_tags(self._new_tags)
+            self._new_tags = {}
+        if self._head_dirty:
+            with open(self._repo._head_file, 'w') as head:
+                head.write(self._head)
+            self._head_dirty = False
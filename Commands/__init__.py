@@ -1,10 +1,68 @@
-from .RepositoryInfo import RepositoryInfo
-from .add import add
-from .branch import branch
-from .checkout import checkout
-from .commit import commit
-from .init import init
-from .log import log, clearlog
-from .reset import reset
-from .status import status
-from .switch import switch
+import sys
+import importlib
+import Tracing
+
+# команда -> модуль пакета Commands и функция команды в нём,
+# модуль загружается только при вызове команды
+COMMANDS = {
+    "add": ("add", "add"),
+    "branch": ("branch", "branch"),
+    "checkout": ("checkout", "checkout"),
+    "clearlog": ("log", "clearlog"),
+    "commit": ("commit", "commit"),
+    "config": ("config", "config"),
+    "daemon": ("daemon", "daemon"),
+    "init": ("init", "init"),
+    "log": ("log", "log"),
+    "migrate": ("migrate", "migrate"),
+    "recompress": ("recompress", "recompress"),
+    "reset": ("reset", "reset"),
+    "status": ("status", "status"),
+    "switch": ("switch", "switch"),
+    "watch": ("watch", "watch"),
+}
+
+
+def load_command(name):
+    """Функция команды по имени, KeyError, если такой команды нет"""
+    module, function = COMMANDS[name]
+    return getattr(importlib.import_module(f".{module}", __name__),
+                   function)
+
+
+def execute(args):
+    """
+    Выполнение команды args.command[0] с разобранными аргументами.
+    С ключами trace и trace_json выводятся время и счётчики участков
+    команды, с ключом profile записывается профиль cProfile
+    """
+    trace = getattr(args, 'trace', False)
+    trace_json = getattr(args, 'trace_json', None)
+    profile = getattr(args, 'profile', None)
+    if trace or trace_json is not None:
+        Tracing.start()
+    profiler = None
+    if profile is not None:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        if args.command[0] not in COMMANDS:
+            raise AttributeError(f"Unknown command {args.command[0]}")
+        with Tracing.span(args.command[0]):
+            with Tracing.span("import"):
+                command = load_command(args.command[0])
+            command(args)
+    except Exception as e:
+        print(e)
+        print("Incorrect input. Call -h or --help to read manual.")
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile)
+        if Tracing.is_enabled():
+            Tracing.stop()
+            if trace:
+                print(Tracing.summary(), file=sys.stderr)
+            if trace_json is not None:
+                Tracing.write_chrome_trace(trace_json)
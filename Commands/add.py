@@ -1,43 +1,104 @@
 from .RepositoryInfo import RepositoryInfo
 import os
-import pickle
 import shutil
-from pathlib import Path
 from Comparers import DirContentComparer, Deltas
+from DeltasFormat import DeltasAppender
+import Tracing
 
 
 class AddRepo(RepositoryInfo):
-    def add_info(self, info):
-        """Запись информации об изменениях в виде Deltas в файл index"""
-        with open(self.index, 'ab') as index:
-            pickle.dump(info, index)
+    def add_changes(self, dir_comparer, tree_index, jobs=None):
+        """
+        Запись изменений в файл index по мере сравнения файлов,
+        набор изменений целиком в памяти не собирается
+        """
+        with Tracing.span("add.write_changes"), \
+                DeltasAppender(self.index, *self.compression) as appender:
+            for kind, file, value in Deltas.iter_changes(
+                    self.path, self, dir_comparer, tree_index, jobs):
+                appender.write_change(kind, file, value)
+                if kind == 'added':
+                    # добавленный файл уже в хранилище, update_last_state
+                    # не будет читать его ещё раз
+                    dir_comparer.digests[file] = value
+
+    def compare_with_last_state(self, tree_index=None, changed_paths=None,
+                                use_journal=True):
+        """
+        Сравнение основной папки с last_state по индексу.
+        changed_paths - пути, которые команда изменила сама
+        в папке, совпадавшей с last_state, проверяются только они.
+        С use_journal=False журнал наблюдателя не читается и сверка
+        в нём не отмечается
+        """
+        if tree_index is None:
+            tree_index = self.load_tree_index()
+        dir_comparer = DirContentComparer(
+            self.path, self.ignore_patterns, tree_index,
+            self.settings.get_int("traversal_threads"),
+            self.journal if use_journal else None)
+        dir_comparer.compare(changed_paths=changed_paths)
+        return dir_comparer
 
     def is_last_state_relevant(self, dir_comparer=None):
         """Проверка совпадения состояния основной папки и last_state"""
         if dir_comparer is None:
-            dir_comparer = DirContentComparer(self.path, self.ignore_patterns)
-            dir_comparer.compare()
-        return (len(dir_comparer.added) == 0 and
-                len(dir_comparer.changed) == 0 and
-                len(dir_comparer.deleted) == 0)
+            dir_comparer = self.compare_with_last_state()
+        relevant = (len(dir_comparer.added) == 0 and
+                    len(dir_comparer.changed) == 0 and
+                    len(dir_comparer.deleted) == 0)
+        if relevant:
+            self.journal.mark_clean(dir_comparer.journal_position)
+        return relevant
+
+    def update_last_state(self, dir_comparer=None, tree_index=None,
+                          changed_paths=None, use_journal=True):
+        """
+        Сохранение состояния основной папки в хранилище
+        и обновление индекса last_state.
+        dir_comparer - уже выполненное сравнение папки с индексом
+        tree_index, папка заново не обходится.
+        changed_paths - пути, изменённые командой после проверки,
+        что папка совпадает с last_state, сверяются только они.
+        use_journal=False - пути из журнала наблюдателя не добавляются,
+        если папка могла не совпадать с last_state
+        """
+        with Tracing.span("update_last_state"):
+            if dir_comparer is None:
+                tree_index = self.load_tree_index()
+                dir_comparer = self.compare_with_last_state(
+                    tree_index, changed_paths, use_journal)
+            self._update_last_state(dir_comparer, tree_index)
 
-    def update_last_state(self):
-        """Копирование состояния основной папки в last_state"""
-        comparer = DirContentComparer(self.path, self.ignore_patterns)
-        comparer.compare()
-        self._delete_files(self.last_state, comparer.deleted)
+    def _update_last_state(self, comparer, tree_index):
+        released = set()
+        for file in comparer.deleted:
+            released.add(tree_index.digest(file))
+            tree_index.remove(file)
+        for file in comparer.changed:
+            released.add(tree_index.digest(file))
         for file in comparer.added:
-            to_add = os.path.join(self.path, file)
-            copy_path = os.path.join(self.last_state, file)
-            copy_dir_path = os.path.dirname(copy_path)
-            if not os.path.exists(copy_dir_path):
-                os.makedirs(copy_dir_path)
-            Path(copy_path).touch()
-            shutil.copyfile(to_add, copy_path)
+            if file in comparer.digests and file in comparer.stats:
+                tree_index.update(file, comparer.stats[file],
+                                  comparer.digests[file])
+            else:
+                self._store_file(tree_index, file)
         for file in comparer.changed:
-            changed = os.path.join(self.path, file)
-            copy_path = os.path.join(self.last_state, file)
-            shutil.copyfile(changed, copy_path)
+            self._store_file(tree_index, file)
+        for file in comparer.refreshed:
+            tree_index.update(file, comparer.stats[file],
+                              comparer.digests[file])
+        tree_index.save()
+        self.journal.mark_clean(comparer.journal_position)
+        for digest in released - tree_index.digests():
+            self.object_store.release(digest)
+
+    def _store_file(self, tree_index, file):
+        """Сохранение файла основной папки в хранилище и в индекс"""
+        absolute_file = os.path.join(self.path, file)
+        stat = os.stat(absolute_file)
+        tree_index.update(file, stat,
+                          self.object_store.put_file(absolute_file))
 
     @staticmethod
     def _delete_files(path, to_delete):
@@ -60,14 +121,14 @@ def add(args):
     print("Repository is OK, start comparing.")
     print()
 
-    dir_comparer = DirContentComparer(args.path, repo.ignore_patterns)
-    dir_comparer.compare()
+    tree_index = repo.load_tree_index()
+    dir_comparer = repo.compare_with_last_state(tree_index)
     if repo.is_last_state_relevant(dir_comparer):
         print("Adding finished, no changes.")
         return
 
     dir_comparer.status_console_log()
-    repo.add_info(Deltas(args.path, repo, dir_comparer))
-    repo.update_last_state()
+    repo.add_changes(dir_comparer, tree_index, args.jobs)
+    repo.update_last_state(dir_comparer, tree_index)
     print()
     print("Adding finished")
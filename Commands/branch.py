@@ -1,5 +1,4 @@
 from .RepositoryInfo import RepositoryInfo
-import pickle
 
 
 class BranchRepo(RepositoryInfo):
@@ -16,12 +15,13 @@ class BranchRepo(RepositoryInfo):
     def print_all_branches(self):
         current_branch = ''
         print("Branches:")
-        with open(self.branches, 'rb') as branches:
-            branches_dict = pickle.load(branches)
-            for branch in branches_dict:
-                print("\t" + branch)
-                if branches_dict[branch] == self.head:
-                    current_branch = branch
+        branches_dict = self.session.branches
+        if branches_dict is None:
+            branches_dict = {}
+        for branch in branches_dict:
+            print("\t" + branch)
+            if branches_dict[branch] == self.head:
+                current_branch = branch
         print("Current branch:", current_branch)
 
     def add_branch(self, branch):
@@ -33,11 +33,7 @@ class BranchRepo(RepositoryInfo):
 
     def _add_branch_to_branches(self, branch_commit):
         """Добавление ветки и её головного коммита в список веток"""
-        with open(self.branches, 'rb') as branches:
-            branches_dict = pickle.load(branches)
-        branches_dict[branch_commit.branch] = branch_commit.commit
-        with open(self.branches, 'wb') as branches:
-            pickle.dump(branches_dict, branches)
+        self.rewrite_branch_head(branch_commit)
 
 
 def branch(args):
@@ -51,4 +47,5 @@ def branch(args):
         repo.print_all_branches()
     else:
         repo.add_branch(args.branchname)
+        repo.flush()
         print('Branch added')
@@ -1,5 +1,7 @@
 from .switch import SwitchingRepo
 from .branch import BranchRepo
+from .CommitsPathSeeker import CommitsPathSeeker
+import Tracing
 
 
 class CheckoutRepo(SwitchingRepo, BranchRepo):
@@ -25,9 +27,18 @@ def checkout(args):
         return
     branch_head = repo.get_branch_head_commit(args.branchname)
     branch_head_info = repo.get_commit_info(branch_head)
-    new_head = repo.switch_between_branches(branch_head_info)
+    new_head = repo.head
+    if branch_head != repo.head:
+        with Tracing.span("switch.seek_path"):
+            paths = CommitsPathSeeker(repo).get_paths_through_branches(
+                repo.head, branch_head_info)
+        new_head = repo.switch_between_branches(paths, repo.head)
     repo.rewrite_head(new_head)
-    repo.update_last_state()
+    # папка перед checkout не проверяется, несохранённые изменения
+    # вне записанных файлов остаются видны в status
+    repo.update_last_state(changed_paths=repo.applied_files,
+                           use_journal=False)
+    repo.flush()
     _log_checkout(repo, args.branchname)
     print("Branch switching finished.")
 
@@ -1,15 +1,9 @@
 from .add import AddRepo
 import os
 import shutil
-import pickle
 
 
 class CommitRepo(AddRepo):
-    class TagPair:
-        def __init__(self, tag, commit):
-            self.tag = tag
-            self.commit = commit
-
     def commit_checks(self, tag):
         """
         Осуществляет проверки до создания коммита,
@@ -37,14 +31,7 @@ class CommitRepo(AddRepo):
 
     def is_tag_in_repo_tree(self, tag):
         """Проверка существования тэга"""
-        with open(self.tags, 'rb') as tags:
-            while True:
-                try:
-                    pair = pickle.load(tags)
-                    if tag == pair.tag:
-                        return True
-                except EOFError:
-                    return False
+        return self.get_tag_commit(tag) is not None
 
     def is_current_branch_free(self):
         """
@@ -60,11 +47,39 @@ class CommitRepo(AddRepo):
         with open(self.index, 'wb'):
             pass
 
+    def is_snapshot_needed(self, commit):
+        """
+        Нужен ли снимок папки на коммите: от последнего снимка прошло
+        snapshot_interval коммитов или изменения с него заняли больше
+        места, чем сама папка.
+        """
+        interval = self.settings.get_int("snapshot_interval")
+        tree_size = self.load_tree_index().total_size()
+        commits_count = 0
+        delta_bytes = 0
+        while commit is not None:
+            if self.metadata_store.has_snapshot(commit):
+                return False
+            commits_count += 1
+            delta_bytes += self.commit_size(commit)
+            if 0 < interval <= commits_count or delta_bytes > tree_size:
+                return True
+            commit = self.get_commit_info(commit).prev_commit
+        return False
+
+    def write_snapshot(self, commit):
+        """Сохранение снимка папки: хэшей и размеров всех файлов"""
+        tree_index = self.load_tree_index()
+        manifest = {}
+        for file in tree_index:
+            digest = tree_index.digest(file)
+            self.object_store.pin(digest)
+            manifest[file] = (digest, tree_index.size(file))
+        self.metadata_store.put_snapshot(commit, manifest)
+
     def add_tag(self, tag, tagged_commit):
         """Добавление коммита в список по тэгу"""
-        with open(self.tags, 'ab') as tags:
-            tag_pair = self.TagPair(tag, tagged_commit)
-            pickle.dump(tag_pair, tags)
+        self.session.add_tag(tag, tagged_commit)
 
 
 def commit(args):
@@ -84,6 +99,9 @@ def commit(args):
 
     if args.tag is not None:
         repo.add_tag(args.tag, commit_index)
+    repo.flush()
+    if repo.is_snapshot_needed(commit_index):
+        repo.write_snapshot(commit_index)
 
     _log_commit(repo, repo.get_head_commit_info(), args.tag, args.comment)
     if args.tag is not None:
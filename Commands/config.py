@@ -0,0 +1,28 @@
+from .RepositoryInfo import RepositoryInfo
+
+
+def config(args):
+    repo = RepositoryInfo(args.path)
+    try:
+        repo.check_repository()
+    except repo.RepositoryCheckingException as e:
+        print(e)
+        return
+    if len(args.command) == 1:
+        for name, value in repo.settings.items():
+            print(f"{name} = {value}")
+        return
+    name, _, value = args.command[1].partition('=')
+    try:
+        repo.settings.set(name.strip(), value.strip())
+    except KeyError:
+        print(f"Unknown setting {name}.")
+        return
+    except ValueError:
+        choices = repo.settings.CHOICES.get(name.strip())
+        if choices is None:
+            print(f"Setting {name} must be a number.")
+        else:
+            print(f"Setting {name} must be one of: {', '.join(choices)}.")
+        return
+    print("Setting saved.")
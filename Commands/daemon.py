@@ -0,0 +1,59 @@
+from .RepositoryInfo import RepositoryInfo
+import os
+import sys
+import signal
+import threading
+from Daemon import CommandServer
+from Storages import SignatureCache
+from Watcher import watch_folder
+
+
+class DaemonRepo(RepositoryInfo):
+    def serve(self, execute):
+        """
+        Выполнение команд клиентов с общим кэшем метаданных.
+        Если наблюдатель за папкой ещё не запущен, демон ведёт
+        журнал изменений сам
+        """
+        cache = SignatureCache()
+        RepositoryInfo.shared_cache = cache
+        stopped = threading.Event()
+        watcher = None
+        if not os.path.exists(self.journal.file):
+            output = sys.stdout
+            watcher = threading.Thread(
+                target=watch_folder,
+                args=(self.path, self.journal,
+                      os.path.join(self.path, "CVSignore.txt")),
+                kwargs={"log": lambda x: print(x, file=output),
+                        "stopped": stopped},
+                daemon=True)
+            watcher.start()
+        try:
+            CommandServer(self.path, execute, cache).serve()
+        finally:
+            stopped.set()
+            if watcher is not None:
+                watcher.join()
+            RepositoryInfo.shared_cache = None
+
+
+def daemon(args):
+    from . import execute
+    repo = DaemonRepo(args.path)
+    try:
+        repo.check_repository()
+    except repo.RepositoryCheckingException as e:
+        print(e)
+        return
+    print("Repository is OK, serving commands, press Ctrl+C to stop.")
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit())
+    try:
+        repo.serve(execute)
+    except CommandServer.DaemonException as e:
+        print(e)
+        return
+    except KeyboardInterrupt:
+        pass
+    print()
+    print("Daemon finished.")
@@ -7,7 +7,7 @@ class RepoInit(RepositoryInfo):
     def init(self):
         os.mkdir(os.path.join(self.path, "repository"))
         os.mkdir(self.objects)
-        os.mkdir(self.last_state)
+        os.mkdir(self.blobs)
         for file in self.repo_files:
             Path(file).touch()
         print("Repository initialized.")
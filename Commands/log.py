@@ -7,6 +7,12 @@ def log(args):
     with open(repo.logs, 'r') as logsfile:
         logs = logsfile.read()
     print(logs)
+    head = repo.head
+    if head != '':
+        print(f"Current commit: {head}")
+        tags = repo.get_commit_tags(head)
+        if tags:
+            print(f"Tags: {', '.join(tags)}")
     print('Logs printing finished.')
 
 
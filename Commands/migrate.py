@@ -0,0 +1,103 @@
+from .add import AddRepo
+import os
+import pickle
+import shutil
+from DeltasFormat import is_deltas_file, append_deltas, read_legacy_deltas, \
+    convert_legacy_deltas
+from Storages import TreeIndex
+
+
+class MigrateRepo(AddRepo):
+    class TagPair:
+        def __init__(self, tag, commit):
+            self.tag = tag
+            self.commit = commit
+
+    class TagsUnpickler(pickle.Unpickler):
+        """Загрузка тэгов, сохранённых старыми версиями CommitRepo"""
+        def find_class(self, module, name):
+            if name.endswith('TagPair'):
+                return MigrateRepo.TagPair
+            return super().find_class(module, name)
+
+    def migrate_last_state(self):
+        """Перенос полной копии папки last_state в хранилище по хэшу"""
+        os.makedirs(self.blobs, exist_ok=True)
+        tree_index = TreeIndex(self.tree_index)
+        for root, dirs, files in os.walk(self.last_state):
+            for file in files:
+                absolute_file = os.path.join(root, file)
+                relative_file = os.path.relpath(absolute_file,
+                                                self.last_state)
+                digest = self.object_store.put_file(absolute_file)
+                tree_index.update(relative_file, os.stat(absolute_file),
+                                  digest)
+        tree_index.save()
+        shutil.rmtree(self.last_state)
+
+    def migrate_commits(self):
+        """Перенос информации о коммитах из commits.dat в metadata.db"""
+        commits_dict = {}
+        with open(self.commits, 'rb') as commits:
+            try:
+                commits_dict = pickle.load(commits)
+            except EOFError:
+                pass
+        self.metadata_store.put_commits(commits_dict.values())
+        self.metadata_store.close()
+        os.remove(self.commits)
+
+    def migrate_tags(self):
+        """Перенос тэгов из tags.dat в metadata.db"""
+        tag_to_commit = {}
+        with open(self.tags, 'rb') as tags:
+            unpickler = self.TagsUnpickler(tags)
+            while True:
+                try:
+                    pair = unpickler.load()
+                    tag_to_commit[pair.tag] = pair.commit
+                except EOFError:
+                    break
+        self.metadata_store.put_tags(tag_to_commit)
+        self.metadata_store.close()
+        os.remove(self.tags)
+
+    def legacy_deltas_files(self):
+        """Файлы изменений, записанные pickle"""
+        files = [os.path.join(self.objects, x)
+                 for x in os.listdir(self.objects)]
+        files.append(self.index)
+        return [x for x in files if not is_deltas_file(x)]
+
+    def migrate_deltas_file(self, deltas_file):
+        """Перевод файла изменений из pickle в формат изменений"""
+        converted = [convert_legacy_deltas(x, self.path, self.object_store)
+                     for x in read_legacy_deltas(deltas_file)]
+        tmp_file = deltas_file + ".tmp"
+        for deltas in converted:
+            append_deltas(tmp_file, deltas, *self.compression)
+        if len(converted) == 0:
+            open(tmp_file, 'wb').close()
+        os.replace(tmp_file, deltas_file)
+
+
+def migrate(args):
+    repo = MigrateRepo(args.path)
+    if not repo.does_dir_exist(os.path.join(args.path, "repository")):
+        print("Repository is not initialized, nothing to migrate.")
+        return
+    if repo.does_dir_exist(repo.last_state):
+        repo.migrate_last_state()
+        print("last_state moved to the object store.")
+    if repo.check_file(repo.commits):
+        repo.migrate_commits()
+        print("Commits information moved to metadata.db.")
+    if repo.check_file(repo.tags):
+        repo.migrate_tags()
+        print("Tags moved to metadata.db.")
+    legacy_files = repo.legacy_deltas_files()
+    for deltas_file in legacy_files:
+        repo.migrate_deltas_file(deltas_file)
+    if len(legacy_files) > 0:
+        print(f"{len(legacy_files)} files of changes converted.")
+    print("Migration finished.")
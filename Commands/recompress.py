@@ -0,0 +1,42 @@
+from .RepositoryInfo import RepositoryInfo
+import os
+from DeltasFormat import rewrite_deltas
+
+
+class RecompressRepo(RepositoryInfo):
+    def deltas_files(self):
+        """Файлы изменений коммитов и index.dat"""
+        files = [os.path.join(self.objects, x)
+                 for x in sorted(os.listdir(self.objects))]
+        files.append(self.index)
+        return files
+
+    def recompress(self):
+        """
+        Перезапись файлов изменений со сжатием из настроек репозитория,
+        возвращает размеры файлов до и после перезаписи
+        """
+        codec, level = self.compression
+        size_before = 0
+        size_after = 0
+        for deltas_file in self.deltas_files():
+            size_before += os.path.getsize(deltas_file)
+            rewrite_deltas(deltas_file, codec, level)
+            size_after += os.path.getsize(deltas_file)
+        return size_before, size_after
+
+
+def recompress(args):
+    repo = RecompressRepo(args.path)
+    try:
+        repo.check_repository()
+    except repo.RepositoryCheckingException as e:
+        print(e)
+        return
+    print("Repository is OK, start recompressing.")
+    print()
+    size_before, size_after = repo.recompress()
+    codec, level = repo.compression
+    print(f"Changes are stored with {codec} compression, level {level}: "
+          f"{size_before} -> {size_after} bytes.")
+    print("Recompressing finished.")
@@ -1,4 +1,5 @@
 from .switch import SwitchingRepo
+from .CommitsPathSeeker import CommitsPathSeeker
 import queue
 
 
@@ -8,11 +9,9 @@ class ResetRepo(SwitchingRepo):
         Добавляет в очередь коммиты, которые нужно пройти
         назад по ветке до коммита с заданным тэгом.
         """
-        if current == final:
-            return
-        track.put(current)
-        prev_commit = self.get_commit_info(current).prev_commit
-        self.get_resets_track_by_tag(track, prev_commit, final)
+        if final is None:
+            raise self.TagException("Commit with this tag does not exist")
+        CommitsPathSeeker(self).get_track_back_to(track, current, final)
 
     def cut_branch_after_head(self):
         head_info = self.get_head_commit_info()
@@ -42,19 +41,20 @@ def reset(args):
             tag_commit = repo.get_tag_commit(tag)
             repo.get_resets_track_by_tag(resets_track, repo.head, tag_commit)
         elif steps_back is not None:
-            repo.get_switch_back_track_by_steps(resets_track, repo.head,
-                                                int(steps_back))
+            CommitsPathSeeker(repo).get_switch_back_track_by_steps(
+                resets_track, repo.head, int(steps_back))
         else:
             raise repo.SwitchingException("Put a tag or an amount of steps "
                                           "to reset")
-    except repo.SwitchingException as e:
+    except (repo.SwitchingException, repo.TagException) as e:
         print(e)
         return
 
     new_head = repo.go_through_commits_return_current(resets_track, True)
     repo.rewrite_head(new_head)
     repo.cut_branch_after_head()
-    repo.update_last_state()
+    repo.update_last_state(changed_paths=repo.applied_files)
+    repo.flush()
     _log_reset(repo, tag, steps_back)
     print('Resetting finished.')
 
@@ -65,6 +65,10 @@ def _log_reset(repo, tag, steps):
         logs.write(f"Reset on commit {repo.head}\n")
         if tag is not None:
             logs.write(f"With tag {tag}\n")
+        else:
+            tags = repo.get_commit_tags(repo.head)
+            if tags:
+                logs.write(f"Tags: {', '.join(tags)}\n")
         if steps is not None:
             logs.write(f"{str(steps)} steps back\n")
         logs.write("\n")
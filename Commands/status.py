@@ -1,6 +1,5 @@
 from .add import AddRepo
 import os
-from Comparers import DirContentComparer
 
 
 def status(args):
@@ -10,9 +9,8 @@ def status(args):
     except repo.RepositoryCheckingException as e:
         print(e)
         return
-    dir_comparer = DirContentComparer(args.path, repo.ignore_patterns)
-    dir_comparer.compare()
-    no_changes = repo.is_last_state_relevant(args.path, repo, dir_comparer)
+    dir_comparer = repo.compare_with_last_state()
+    no_changes = repo.is_last_state_relevant(dir_comparer)
     if no_changes:
         if os.path.getsize(repo.index) == 0:
             print("Current state of folder is saved.\n"
@@ -20,16 +18,16 @@ def status(args):
         else:
             print("All tracked changes are added, commit them.")
     else:
-        status_console_log(args.path, dir_comparer)
+        status_console_log(dir_comparer)
 
 
-def status_console_log(path, comparer):
+def status_console_log(comparer):
     print("Added files:")
-    log_paths(path, comparer.added)
+    log_paths(comparer.added)
     print("Deleted files:")
-    log_paths(path, comparer.deleted)
+    log_paths(comparer.deleted)
     print("Changed files:")
-    log_paths(path, comparer.changed)
+    log_paths(comparer.changed)
 
 
 def log_paths(to_log):
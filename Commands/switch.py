@@ -1,10 +1,10 @@
 from .add import AddRepo
 from Commands.CommitsPathSeeker import CommitsPathSeeker
+from Commands.DeltasComposer import DeltasComposer
 import os
 import queue
-import pickle
-from pathlib import Path
-from Comparers import FilesComparer
+from DeltasFormat import is_deltas_file, iter_deltas, read_legacy_deltas
+import Tracing
 
 
 class SwitchingRepo(AddRepo):
@@ -18,6 +18,12 @@ class SwitchingRepo(AddRepo):
                 return f'Switching exception: {self.message}'
             return 'Switching exception'
 
+    def __init__(self, path):
+        super().__init__(path)
+        # файлы папки, записанные при переходах, после перехода
+        # в индексе last_state сверяются только они
+        self.applied_files = set()
+
     def checks_before_switching(self):
         """
         Проверки на целостность репозитория
@@ -27,7 +33,8 @@ class SwitchingRepo(AddRepo):
         print("Repository is OK, start checking last commit.")
         print()
 
-        relevant = self.is_last_state_relevant()
+        with Tracing.span("check_last_state"):
+            relevant = self.is_last_state_relevant()
         if (not relevant) or os.path.getsize(self.index) > 0:
             raise self.CommitException("Your folder has uncommitted changes, "
                                        "commit them before switching state.")
@@ -39,78 +46,107 @@ class SwitchingRepo(AddRepo):
         Переход состояния папки вперёд или назад по истории коммитов
         внутри ветки
         """
-        step_commit = None
-        while not commits_track.empty():
-            step_commit = commits_track.get()
-            commit_file = os.path.join(self.objects, step_commit + ".dat")
-            with open(commit_file, 'rb') as commit:
-                while True:
-                    try:
-                        deltas_info = pickle.load(commit)
-                        if is_back:
-                            self.go_to_previous_state(deltas_info)
-                        else:
-                            self.go_to_next_state(deltas_info)
-                    except EOFError:
-                        break
-        if is_back:
-            info = self.get_commit_info(step_commit)
-            return info.prev_commit
-        else:
-            return step_commit
+        return self.switch_between_branches([[commits_track, is_back]],
+                                            self.head)
 
-    def switch_between_branches(self, paths):
+    def switch_between_branches(self, paths, start_commit):
         """
         Совершает переход к заданному коммиту, находящемуся на другой ветке,
         возвращает коммит, ставший головным.
+        Изменения всех участков пути складываются и записываются один раз.
+        Если восстановить ближайший к цели снимок папки и пройти от него
+        дешевле, чем пройти весь путь, переход идёт через снимок.
         """
-        for path_pair in paths:
-            switching_track = path_pair[0]
-            is_back = path_pair[1]
-            new_head = self.go_through_commits_return_current(switching_track,
-                                                              is_back)
+        tracks = [[self._track_to_list(path_pair[0]), path_pair[1]]
+                  for path_pair in paths]
+        new_head = start_commit
+        replay_bytes = 0
+        for track, is_back in tracks:
+            if len(track) == 0:
+                continue
+            replay_bytes += sum(self.commit_size(x) for x in track)
+            if is_back:
+                new_head = self.get_commit_info(track[-1]).prev_commit
+            else:
+                new_head = track[-1]
+
+        composer = DeltasComposer(self)
+        snapshot_plan = None
+        if new_head is not None:
+            with Tracing.span("switch.plan"):
+                snapshot_plan = self.plan_from_snapshot(new_head,
+                                                        replay_bytes)
+        with Tracing.span("switch.compose"):
+            if snapshot_plan is None:
+                for track, is_back in tracks:
+                    self._compose_track(composer, track, is_back)
+            else:
+                manifest, forward_track = snapshot_plan
+                composer.restore_snapshot(manifest,
+                                          self.load_tree_index())
+                self._compose_track(composer, forward_track, False)
+        self.applied_files.update(composer.affected_files)
+        with Tracing.span("switch.write"):
+            composer.flush()
         return new_head
 
-    def go_to_previous_state(self, deltas):
-        """Откат состояния папки на один коммит назад"""
-        self._delete_files(self.path, deltas.added.keys())
-        self._add_files(self.path, deltas.deleted)
-        for file in deltas.changed:
-            with open(file, 'r') as f:
-                file_lines = f.readlines()
-            prev_lines = FilesComparer().previous_file_version(
-                file_lines, deltas.changed[file])
-            with open(file, 'w') as f:
-                f.writelines(prev_lines)
-
-    def go_to_next_state(self, deltas):
-        """Переход состояния папки на один коммит вперёд"""
-        self._delete_files(self.path, deltas.deleted.keys())
-        self._add_files(self.path, deltas.added)
-        for file in deltas.changed:
-            with open(file, 'r') as f:
-                file_lines = f.readlines()
-            next_lines = FilesComparer().next_file_version(file_lines,
-                                                           deltas.changed[
-                                                               file])
-            with open(file, 'w') as f:
-                f.writelines(next_lines)
+    def plan_from_snapshot(self, target, replay_bytes):
+        """
+        Ищет снимок папки среди предков коммита target. Возвращает снимок
+        и коммиты от снимка до target, если через снимок нужно прочитать
+        меньше байт, чем replay_bytes, иначе None.
+        """
+        forward_track = []
+        delta_bytes = 0
+        commit = target
+        while commit is not None and delta_bytes < replay_bytes:
+            snapshot_size = self.metadata_store.snapshot_size(commit)
+            if snapshot_size is not None:
+                if delta_bytes + snapshot_size >= replay_bytes:
+                    return None
+                manifest = self.metadata_store.get_snapshot(commit)
+                tree_index = self.load_tree_index()
+                blobs_bytes = sum(
+                    size for file, (digest, size) in manifest.items()
+                    if file not in tree_index or
+                    tree_index.digest(file) != digest)
+                if delta_bytes + snapshot_size + blobs_bytes >= replay_bytes:
+                    return None
+                forward_track.reverse()
+                return manifest, forward_track
+            forward_track.append(commit)
+            delta_bytes += self.commit_size(commit)
+            commit = self.get_commit_info(commit).prev_commit
+        return None
+
+    def _compose_track(self, composer, track, is_back):
+        """Сложение изменений коммитов пути в composer"""
+        for step_commit in track:
+            commit_deltas = self.read_commit_deltas(step_commit)
+            if is_back:
+                for deltas_info in reversed(list(commit_deltas)):
+                    composer.previous_state(deltas_info)
+            else:
+                for deltas_info in commit_deltas:
+                    composer.next_state(deltas_info)
 
     @staticmethod
-    def _add_files(path, file_to_content):
+    def _track_to_list(commits_track):
+        track = []
+        while not commits_track.empty():
+            track.append(commits_track.get())
+        return track
+
+    def read_commit_deltas(self, commit):
         """
-        Добавление файлов в папку
-        и их заполнение соответствующим содержимым
+        Изменения Deltas, сохранённые в коммите, в порядке записи,
+        сжатый файл распаковывается по мере чтения,
+        коммиты старого формата записаны pickle
         """
-        for file in file_to_content:
-            content = file_to_content[file]
-            absolute_file = os.path.join(path, file)
-            file_dir_path = os.path.dirname(absolute_file)
-            if not os.path.exists(file_dir_path):
-                os.makedirs(file_dir_path)
-            Path(absolute_file).touch()
-            with open(absolute_file, 'w') as f:
-                f.writelines(content)
+        commit_file = os.path.join(self.objects, commit + ".dat")
+        if is_deltas_file(commit_file):
+            return iter_deltas(commit_file)
+        return read_legacy_deltas(commit_file)
 
 
 def switch(args):
@@ -146,7 +182,8 @@ def switch(args):
 
     repo.rewrite_head(new_head)
     _log_switching(repo)
-    repo.update_last_state()
+    repo.update_last_state(changed_paths=repo.applied_files)
+    repo.flush()
     print('Switching finished.')
 
 
@@ -157,17 +194,18 @@ def _step_switching(repo, steps_back, steps_forward, switching_track):
     """
     is_back = True
     seeker = CommitsPathSeeker(repo)
-    if steps_back is not None:
-        seeker.get_switch_back_track_by_steps(switching_track, repo.head,
-                                              int(steps_back))
-    elif steps_forward is not None:
-        branch = repo.get_head_commit_info().branch
-        seeker.get_switch_forward_track_by_steps(switching_track, repo.head,
-                                                 branch, int(steps_forward))
-        is_back = False
-    else:
-        raise repo.SwitchingException("Put a tag or an amount of steps "
-                                      "to switch.")
+    with Tracing.span("switch.seek_path"):
+        if steps_back is not None:
+            seeker.get_switch_back_track_by_steps(switching_track, repo.head,
+                                                  int(steps_back))
+        elif steps_forward is not None:
+            branch = repo.get_head_commit_info().branch
+            seeker.get_switch_forward_track_by_steps(
+                switching_track, repo.head, branch, int(steps_forward))
+            is_back = False
+        else:
+            raise repo.SwitchingException("Put a tag or an amount of steps "
+                                          "to switch.")
     new_head = repo.go_through_commits_return_current(switching_track, is_back)
     return new_head
 
@@ -177,20 +215,15 @@ def _tag_switching(repo, tag):
     if tagged_commit is None:
         raise repo.TagException("Commit with this tag does not exist")
 
+    if tagged_commit == repo.head:
+        return tagged_commit
     tagged_info = repo.get_commit_info(tagged_commit)
-    head_info = repo.get_head_commit_info()
-    seeker = CommitsPathSeeker(repo)
-
-    if (head_info.branch in tagged_info.all_commit_branches() or
-            tagged_info.branch in head_info.all_commit_branches()):
-        switching_track, is_back = seeker.get_path_on_branch(
-            head_info.branch, head_info.commit, tagged_info)
-        new_head = repo.go_through_commits_return_current(switching_track,
-                                                          is_back)
-    else:
-        paths = seeker.get_paths_through_branches(repo.head, tagged_info)
-        new_head = repo.switch_between_branches(paths)
-    return new_head
+    # даже на одной ветке путь может идти назад и вперёд:
+    # после reset на ветке появляются коммиты вместо отрезанных
+    with Tracing.span("switch.seek_path"):
+        paths = CommitsPathSeeker(repo).get_paths_through_branches(
+            repo.head, tagged_info)
+    return repo.switch_between_branches(paths, repo.head)
 
 
 def _log_switching(repo):
@@ -199,4 +232,7 @@ def _log_switching(repo):
         head = repo.get_head_commit_info()
         logs.write(f"Switch on commit {head.commit}\n")
         logs.write(f"On branch {head.branch}\n")
+        tags = repo.get_commit_tags(head.commit)
+        if tags:
+            logs.write(f"Tags: {', '.join(tags)}\n")
         logs.write('\n')
@@ -0,0 +1,33 @@
+from .RepositoryInfo import RepositoryInfo
+import os
+import sys
+import signal
+from Watcher import watch_folder
+
+
+class WatchRepo(RepositoryInfo):
+    def watch(self):
+        """
+        Ведение журнала изменений основной папки, по нему status, add,
+        commit и switch проверяют только изменённые пути
+        """
+        watch_folder(self.path, self.journal,
+                     os.path.join(self.path, "CVSignore.txt"))
+
+
+def watch(args):
+    repo = WatchRepo(args.path)
+    try:
+        repo.check_repository()
+    except repo.RepositoryCheckingException as e:
+        print(e)
+        return
+    print("Repository is OK, press Ctrl+C to stop watching.")
+    # при завершении по сигналу журнал тоже удаляется
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit())
+    try:
+        repo.watch()
+    except KeyboardInterrupt:
+        pass
+    print()
+    print("Watching finished.")
@@ -3,7 +3,11 @@ class CommitInfo:
     commit = None
     prev_commit = None
     next_on_branch = None
-    branches_next = {}
+
+    def __init__(self):
+        # у каждого коммита свой словарь, общий словарь класса
+        # накапливал бы ветки всех коммитов процесса
+        self.branches_next = {}
 
     def __getstate__(self):
         attributes = self.__dict__.copy()
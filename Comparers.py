@@ -1,40 +1,106 @@
-import copy
+import io
 import os
-import filecmp
-import difflib
 import re
+import mmap
+import zlib
+import codecs
+import locale
+import filecmp
+import hashlib
+from collections import deque
+from math import isqrt
+# ProcessPoolExecutor загружает multiprocessing, поэтому берётся из пакета
+# только при сравнении в нескольких процессах
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from Storages import file_digest, MMAP_THRESHOLD
+from IgnorePatterns import IgnoreMatcher
+from DiffEngines import ENGINES
+import Tracing
 
+HUNK_HEADER = re.compile(r'@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
 
-class Deltas:
-    def __init__(self, path, repo, dir_comparer):
-        files_to_compare = [[os.path.join(repo.last_state, x),
-                             os.path.join(path, x)]
-                            for x in dir_comparer.changed]
-        files_comparer = FilesComparer(files_to_compare)
-        self.changed = files_comparer.compareFiles()
-        self.deleted = self._file_to_content(repo.last_state,
-                                             dir_comparer.deleted)
-        self.added = self._file_to_content(path, dir_comparer.added)
 
+class Hunk:
+    """
+    Участок изменений: строки old_lines с номера old_start заменяются
+    строками new_lines с номера new_start, нумерация с единицы
+    """
+    __slots__ = ('old_start', 'old_count', 'new_start', 'new_count',
+                 'old_lines', 'new_lines')
+
+    def __init__(self, old_start, old_count, new_start, new_count,
+                 old_lines, new_lines):
+        self.old_start = old_start
+        self.old_count = old_count
+        self.new_start = new_start
+        self.new_count = new_count
+        self.old_lines = old_lines
+        self.new_lines = new_lines
+
+
+class BlockDelta:
+    """
+    Изменение двоичного файла: forward - операции построения новой версии
+    по старой, backward - старой по новой.
+    Операция - (COPY, смещение, длина) в исходной версии или (INSERT, байты).
+    """
+    COPY, INSERT = range(2)
+    __slots__ = ('forward', 'backward')
+
+    def __init__(self, forward, backward):
+        self.forward = forward
+        self.backward = backward
+
+
+class Deltas:
     @staticmethod
-    def _file_to_content(path, deleted_files):
+    def iter_changes(path, repo, dir_comparer, tree_index, jobs=None):
         """
-        Возвращает словарь относительный путь к файлу,
-        т.е. содержимое в виде массива строк
+        Изменения по одному файлу: вид изменения (deleted, added
+        или changed), относительный путь к файлу и хэш содержимого
+        или изменения файла. В памяти одновременно находятся
+        только сравниваемые файлы.
         """
-        file_to_content = {}
-        for file in deleted_files:
-            abs_path = os.path.join(path, file)
-            os.chmod(abs_path, 0o777)
-            with open(abs_path, 'r') as f:
-                file_to_content[file] = f.readlines()
-        return file_to_content
+        store = repo.object_store
+        for file in dir_comparer.deleted:
+            digest = tree_index.digest(file)
+            store.pin(digest)
+            yield 'deleted', file, digest
+        for file in dir_comparer.added:
+            yield 'added', file, store.put_file(os.path.join(path, file),
+                                                pin=True)
+        files_to_compare = [[store.path(tree_index.digest(x)),
+                             os.path.join(path, x)]
+                            for x in dir_comparer.changed]
+        files_comparer = FilesComparer(files_to_compare, jobs,
+                                       repo.settings.get("diff_engine"))
+        for file, delta in files_comparer.iter_compare():
+            yield 'changed', os.path.relpath(file, path), delta
+
+    @classmethod
+    def from_parts(cls, added, deleted, changed):
+        """Набор изменений из готовых словарей"""
+        deltas = cls()
+        deltas.added = added
+        deltas.deleted = deleted
+        deltas.changed = changed
+        return deltas
 
 
 class DirContentComparer:
-    def __init__(self, path, ignore_patterns=None):
+    def __init__(self, path, ignore_patterns=None, tree_index=None,
+                 threads=1, journal=None):
         self._root = path
+        if not isinstance(ignore_patterns, IgnoreMatcher):
+            ignore_patterns = IgnoreMatcher(ignore_patterns or [])
         self._ignore = ignore_patterns
+        self._index = tree_index
+        # число потоков, одновременно читающих папки при обходе
+        self._threads = threads
+        # журнал наблюдателя за папкой, позволяет не обходить всю папку
+        self._journal = journal
+        self.journal_position = None
         self._repository = os.path.join(self._root, "repository")
         self._last_state = os.path.join(self._repository, "last_state")
         self._files = None
@@ -42,24 +108,213 @@ class DirContentComparer:
         self.added = []
         self.deleted = []
         self.changed = []
+        # stat и хэши файлов, прочитанных при сравнении по индексу
+        self.stats = {}
+        self.digests = {}
+        self.refreshed = []
 
-    def compare(self, files=None):
+    def compare(self, files=None, changed_paths=None):
+        """
+        changed_paths - пути, изменённые после того, как папка совпадала
+        с индексом, сравниваются только они и пути из журнала
+        """
         if files is not None and len(files) > 0:
             self._files = self._full_paths_to_files(self._root, files)
+        if self._index is not None:
+            dirty_paths = None
+            if self._journal is not None:
+                with Tracing.span("journal.snapshot"):
+                    dirty_paths, self.journal_position = \
+                        self._journal.snapshot()
+            if changed_paths is not None:
+                if dirty_paths is None:
+                    # журнал не знает, что ещё менялось в папке,
+                    # сверка не отмечается в нём
+                    dirty_paths = set()
+                    self.journal_position = None
+                dirty_paths = dirty_paths | set(changed_paths)
+            with Tracing.span("compare.tree"):
+                self.index_compare(dirty_paths)
+            return
         last_state = os.path.join(self._repository, "last_state")
-        self.full_closure_compare(last_state, self._root)
+        with Tracing.span("compare.tree"):
+            self.full_closure_compare(last_state, self._root)
         self._first_iter = True
 
+    def index_compare(self, dirty_paths=None):
+        """
+        Сравнение основной папки с индексом last_state: файлы с неизменной
+        сигнатурой stat пропускаются, остальные сверяются по хэшу.
+        Если известны пути, изменённые после последней сверки,
+        проверяются только они, иначе обходится вся папка.
+        """
+        requested = None if self._files is None else set(self._files)
+        seen = set()
+        indexed = self._index
+        if dirty_paths is not None:
+            Tracing.count("dirty_paths", len(dirty_paths))
+            tree, indexed = self._dirty_tree(dirty_paths)
+        elif self._threads > 1:
+            tree = self._parallel_walk_tree()
+        else:
+            tree = self._walk_tree(self._root, '')
+        for file, stat in tree:
+            seen.add(file)
+            if requested is not None and \
+                    os.path.join(self._root, file) not in requested:
+                continue
+            if file not in self._index:
+                self.added.append(file)
+                self.stats[file] = stat
+                continue
+            if self._index.is_stat_clean(file, stat):
+                continue
+            self.stats[file] = stat
+            digest = file_digest(os.path.join(self._root, file))
+            self.digests[file] = digest
+            if digest == self._index.digest(file):
+                self.refreshed.append(file)
+            else:
+                self.changed.append(file)
+        for file in sorted(indexed):
+            if file in seen or self._is_index_ignored(file):
+                continue
+            if requested is not None and \
+                    os.path.join(self._root, file) not in requested:
+                continue
+            self.deleted.append(file)
+
+    def _dirty_tree(self, dirty_paths):
+        """
+        Файлы изменённых путей (пары относительный путь - stat в порядке
+        обхода _walk_tree) и файлы индекса, лежащие по этим путям
+        """
+        files = {}
+        for path in dirty_paths:
+            if not self._is_walked(path):
+                continue
+            absolute = os.path.join(self._root, path)
+            if os.path.isdir(absolute) and not os.path.islink(absolute):
+                if not self._ignore.is_dir_ignored(path):
+                    files.update(self._walk_tree(absolute, path))
+                continue
+            if os.path.basename(path) == "CVSignore.txt" or \
+                    self._ignore.is_file_ignored(path):
+                continue
+            try:
+                files[path] = os.stat(absolute)
+            except OSError:
+                pass
+        indexed = [file for file in self._index
+                   if self._is_dirty(file, dirty_paths) and
+                   not self._is_index_ignored(file)]
+        tree = sorted(files.items(), key=lambda x: x[0].split(os.sep))
+        return tree, indexed
+
+    def _is_walked(self, path):
+        """Не лежит ли путь в папке, пропускаемой при обходе"""
+        parts = path.split(os.sep)
+        if parts[0] == "repository":
+            return False
+        for i in range(1, len(parts)):
+            if self._ignore.is_dir_ignored(os.sep.join(parts[:i])):
+                return False
+        return True
+
+    def _is_index_ignored(self, file):
+        """
+        Игнорируется ли файл индекса: такой файл не виден при обходе,
+        но и не считается удалённым
+        """
+        return not self._is_walked(file) or \
+            self._ignore.is_file_ignored(file)
+
+    @staticmethod
+    def _is_dirty(file, dirty_paths):
+        """Лежит ли файл по одному из изменённых путей"""
+        while file:
+            if file in dirty_paths:
+                return True
+            file = os.path.dirname(file)
+        return False
+
+    def _walk_tree(self, path, relative):
+        """Обход файлов папки: пары относительный путь - stat"""
+        entries = self._scan_dir(path, relative)
+        self._count_scanned(entries)
+        for file, entry_path, stat in entries:
+            if stat is None:
+                yield from self._walk_tree(entry_path, file)
+            else:
+                yield file, stat
+
+    def _parallel_walk_tree(self):
+        """
+        Обход файлов папки, подпапки читаются одновременно
+        не более чем в self._threads потоках.
+        Порядок файлов такой же, как при обходе _walk_tree
+        """
+        scanned = {}
+        with ThreadPoolExecutor(max_workers=self._threads) as executor:
+            pending = {executor.submit(self._scan_dir, self._root, ''): ''}
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    entries = future.result()
+                    # счётчики участка есть только у потока, начавшего обход
+                    self._count_scanned(entries)
+                    scanned[pending.pop(future)] = entries
+                    for file, entry_path, stat in entries:
+                        if stat is None:
+                            subdir = executor.submit(self._scan_dir,
+                                                     entry_path, file)
+                            pending[subdir] = file
+        return self._scanned_files(scanned, '')
+
+    def _scanned_files(self, scanned, relative):
+        for file, _, stat in scanned[relative]:
+            if stat is None:
+                yield from self._scanned_files(scanned, file)
+            else:
+                yield file, stat
+
+    @staticmethod
+    def _count_scanned(entries):
+        Tracing.count("folders_scanned")
+        Tracing.count("files_scanned", len(entries))
+
+    def _scan_dir(self, path, relative):
+        """
+        Содержимое одной папки в порядке имён:
+        относительный путь, полный путь и stat, для подпапок stat - None
+        """
+        with os.scandir(path) as it:
+            entries = sorted(it, key=lambda x: x.name)
+        content = []
+        for entry in entries:
+            if entry.name == "CVSignore.txt":
+                continue
+            if relative == '' and entry.name == "repository":
+                continue
+            file = os.path.join(relative, entry.name)
+            if entry.is_dir(follow_symlinks=False):
+                if not self._ignore.is_dir_ignored(file):
+                    content.append((file, entry.path, None))
+            elif not self._ignore.is_file_ignored(file):
+                content.append((file, entry.path, entry.stat()))
+        return content
+
+    def _is_ignored(self, path):
+        """Игнорируется ли файл или папка, path - полный путь"""
+        relative = os.path.relpath(path, self._root)
+        if os.path.isdir(path):
+            return self._ignore.is_dir_ignored(relative)
+        return self._ignore.is_file_ignored(relative)
+
     def full_closure_compare(self, repo, orig):
         ignore_list = ["repository", "CVSignore.txt"]
-        if self._ignore is not None:
-            for file in os.listdir(orig):
-                if os.path.isfile(os.path.join(orig, file)):
-                    for pattern in self._ignore:
-                        a = re.fullmatch(pattern, file)
-                        if re.fullmatch(pattern, file) is not None:
-                            ignore_list.append(file)
-                            break
+        ignore_list.extend(file for file in os.listdir(orig)
+                           if self._is_ignored(os.path.join(orig, file)))
         cmp = filecmp.dircmp(repo, orig, ignore=ignore_list)
         relative_repo_folder = os.path.relpath(repo, self._last_state)
         if relative_repo_folder == '.':
@@ -74,14 +329,20 @@ class DirContentComparer:
         if len(added_dirs) > 0:
             self._add_files_in_new_dirs(added_dirs)
 
-        changed_files = self._full_paths_to_files(orig, cmp.diff_files)
+        # dircmp сравнивает файлы только по сигнатуре stat,
+        # совпадающие размер и mtime не гарантируют равенства содержимого
+        diff_files = filecmp.cmpfiles(repo, orig, cmp.common_files,
+                                      shallow=False)[1]
+        changed_files = self._full_paths_to_files(orig, diff_files)
         requested_changed = self._requested_files_from_dir(changed_files)
         self.changed.extend(self._relative_paths_to_files(requested_changed))
 
-        subdirs = [file.path for file in os.scandir(orig) if file.is_dir()]
+        subdirs = [file.path for file in os.scandir(orig) if file.is_dir()
+                   and not self._is_ignored(file.path)]
         if self._first_iter:
             self._first_iter = False
-            subdirs.remove(self._repository)
+            if self._repository in subdirs:
+                subdirs.remove(self._repository)
         for subdir in subdirs:
             if subdir in added_dirs:
                 continue
@@ -117,7 +378,9 @@ class DirContentComparer:
 
     def _add_files_in_new_dirs(self, dirs):
         for new_dir in dirs:
-            dir_content = os.listdir(new_dir)
+            dir_content = [file for file in os.listdir(new_dir)
+                           if not self._is_ignored(
+                               os.path.join(new_dir, file))]
             new_dirs, new_files = self._split_dirs_and_files(
                 self._full_paths_to_files(new_dir, dir_content))
             requested_added = self._requested_files_from_dir(new_files)
@@ -139,23 +402,154 @@ class DirContentComparer:
 
 
 class FilesComparer:
-    def __init__(self, file_pairs=None):
+    # по первым BINARY_PROBE байтам определяется, двоичный ли файл
+    BINARY_PROBE = 8000
+
+    def __init__(self, file_pairs=None, jobs=None, engine="histogram"):
         self.files = file_pairs
+        self.jobs = jobs
+        # алгоритм построчного сравнения из DiffEngines.ENGINES
+        self.engine = engine
         self.deltas = {}
 
     def compareFiles(self):
-        for pair in self.files:
-            file1 = open(pair[0], 'r')
-            file2 = open(pair[1], 'r')
-            self.compare(file1.readlines(), file2.readlines(), pair[1])
-            file1.close()
-            file2.close()
+        for file, delta in self.iter_compare():
+            self.deltas[file] = delta
         return self.deltas
 
-    def compare(self, file1, file2, name):
-        diff = difflib.unified_diff(file1, file2, n=0)
-        diff_str = [x for x in diff]
-        self.deltas[name] = diff_str
+    def iter_compare(self):
+        """
+        Изменения файлов по одному, большие файлы сравниваются первыми.
+        При jobs > 1 пары распределяются по процессам, одновременно
+        сравнивается не больше 2 * jobs пар, результаты выдаются
+        в том же порядке, что и без процессов
+        """
+        by_size = sorted(self.files, key=self._pair_size, reverse=True)
+        Tracing.count("files_compared", len(by_size))
+        if self.jobs is None or self.jobs < 2 or len(self.files) < 2:
+            for pair in by_size:
+                yield pair[1], _pair_delta(pair, self.engine)
+            return
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.jobs) as executor:
+            window = deque()
+            for pair in by_size:
+                window.append((pair[1], executor.submit(_pair_delta, pair,
+                                                        self.engine)))
+                if len(window) >= 2 * self.jobs:
+                    file, future = window.popleft()
+                    yield file, future.result()
+            while window:
+                file, future = window.popleft()
+                yield file, future.result()
+
+    @staticmethod
+    def _pair_size(pair):
+        return os.path.getsize(pair[0]) + os.path.getsize(pair[1])
+
+    def compare_pair(self, pair):
+        """Изменения файла pair[1] относительно pair[0]"""
+        if self.is_binary(pair[0]) or self.is_binary(pair[1]):
+            self.compare_binary(pair[0], pair[1], pair[1])
+            return
+        try:
+            if min(os.path.getsize(pair[0]),
+                   os.path.getsize(pair[1])) >= MMAP_THRESHOLD:
+                with MappedTextPair(pair[0], pair[1]) as mapped:
+                    middle = mapped.middle_lines()
+                if middle is not None:
+                    offset, lines1, lines2 = middle
+                    self.compare(lines1, lines2, pair[1], offset)
+                    return
+            with open(pair[0], 'r') as file1, open(pair[1], 'r') as file2:
+                lines1 = file1.readlines()
+                lines2 = file2.readlines()
+        except UnicodeDecodeError:
+            self.compare_binary(pair[0], pair[1], pair[1])
+            return
+        self.compare(lines1, lines2, pair[1])
+
+    @classmethod
+    def is_binary(cls, path):
+        """Файл считается двоичным, если в его начале есть нулевой байт"""
+        with open(path, 'rb') as f:
+            return b'\0' in f.read(cls.BINARY_PROBE)
+
+    def compare_binary(self, path1, path2, name):
+        with open(path1, 'rb') as file1, open(path2, 'rb') as file2:
+            data1 = file1.read()
+            data2 = file2.read()
+        self.deltas[name] = BlockDelta(
+            BinaryComparer.block_delta(data1, data2),
+            BinaryComparer.block_delta(data2, data1))
+
+    def compare(self, file1, file2, name, offset=0):
+        """
+        Изменения строк file2 относительно file1, offset - число
+        общих строк перед сравниваемыми строками обоих файлов
+        """
+        hunks = []
+        Tracing.count("lines_compared", len(file1) + len(file2))
+        for tag, i1, i2, j1, j2 in ENGINES[self.engine](file1, file2):
+            # нумерация как в unified diff: при нулевой длине
+            # указывается строка перед изменением
+            hunks.append(Hunk(offset + (i1 + 1 if i2 > i1 else i1), i2 - i1,
+                              offset + (j1 + 1 if j2 > j1 else j1), j2 - j1,
+                              file1[i1:i2], file2[j1:j2]))
+        self.deltas[name] = hunks
+
+    @staticmethod
+    def hunks(deltas):
+        """Участки изменений, дельты старого формата разбираются"""
+        if len(deltas) > 0 and isinstance(deltas[0], str):
+            return FilesComparer.parse_hunks(deltas)
+        return deltas
+
+    @staticmethod
+    def parse_hunks(deltas):
+        """Разбор unified diff с нулевым контекстом в список Hunk"""
+        hunks = []
+        i = 0
+        while i < len(deltas):
+            header = HUNK_HEADER.match(deltas[i])
+            if header is None:
+                i += 1
+                continue
+            old_start, old_count, new_start, new_count = header.groups()
+            old_count = 1 if old_count is None else int(old_count)
+            new_count = 1 if new_count is None else int(new_count)
+            old_end = i + 1 + old_count
+            new_end = old_end + new_count
+            hunks.append(Hunk(int(old_start), old_count,
+                              int(new_start), new_count,
+                              [line[1:] for line in deltas[i + 1:old_end]],
+                              [line[1:] for line in deltas[old_end:new_end]]))
+            i = new_end
+        return hunks
+
+    @staticmethod
+    def apply_hunks(lines, hunks, reverse=False):
+        """
+        Применение изменений к строкам файла за один проход.
+        При reverse=True по последующей версии строится предыдущая.
+        """
+        result = []
+        position = 0
+        Tracing.count("hunks_applied", len(hunks))
+        for hunk in hunks:
+            if reverse:
+                start, count, replacement = \
+                    hunk.new_start, hunk.new_count, hunk.old_lines
+            else:
+                start, count, replacement = \
+                    hunk.old_start, hunk.old_count, hunk.new_lines
+            # при нулевой длине номер указывает на строку перед изменением
+            start_index = start if count == 0 else start - 1
+            result.extend(lines[position:start_index])
+            result.extend(replacement)
+            position = start_index + count
+        result.extend(lines[position:])
+        return result
 
     @staticmethod
     def previous_file_version(str_file2, deltas):
@@ -163,57 +557,212 @@ class FilesComparer:
         По дельте и файлу последующей версии
         возвращает предыдущую версию файла
         """
-        new_file = copy.deepcopy(str_file2)
-        count_rem_str = 0
-        for i in range(2, len(deltas)):
-            if re.match(r'@@', deltas[i]) is None:
-                continue
-            add_str = re.search(r'@@ -([,\d]+) \+([,\d]+) @@',
-                                deltas[i])[2].split(',')
-            add_start_index = int(add_str[0])
-            add_count = 1 if len(add_str) == 1 else int(add_str[1])
-            for k in range(add_start_index, add_start_index + add_count):
-                new_file.pop(k - count_rem_str - 1)
-                count_rem_str += 1
-        for i in range(2, len(deltas)):
-            if re.match(r'@@', deltas[i]) is None:
-                continue
-            rem_str = re.search(r'@@ -([,\d]+) \+([,\d]+) @@',
-                                deltas[i])[1].split(',')
-            rem_start_index = int(rem_str[0])
-            rem_count = 1 if len(rem_str) == 1 else int(rem_str[1])
-            for k in range(rem_start_index, rem_start_index + rem_count):
-                new_file.insert(k - 1, deltas[i + k - rem_start_index + 1][1:])
-        return new_file
+        return FilesComparer.apply_hunks(
+            str_file2, FilesComparer.hunks(deltas), reverse=True)
 
     @staticmethod
     def next_file_version(str_file_1, deltas):
         """
         По дельте и файлу предыдущей версии возвращает последующую версию файла
         """
-        new_file = copy.deepcopy(str_file_1)
-        count_rem_str = 0
-        for i in range(2, len(deltas)):
-            if re.match(r'@@', deltas[i]) is None:
+        return FilesComparer.apply_hunks(
+            str_file_1, FilesComparer.hunks(deltas))
+
+
+class MappedTextPair:
+    """
+    Пара больших текстовых файлов, отображённых в память. Общие начало
+    и конец файлов находятся сравнением байтов по частям, декодируется
+    и разбивается на строки только отличающаяся середина.
+    """
+    CHUNK = 1024 * 1024
+
+    def __init__(self, path1, path2):
+        self._paths = (path1, path2)
+        self._files = []
+        self._maps = []
+
+    def __enter__(self):
+        for path in self._paths:
+            f = open(path, 'rb')
+            self._files.append(f)
+            self._maps.append(mmap.mmap(f.fileno(), 0,
+                                        access=mmap.ACCESS_READ))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for mapped in self._maps:
+            mapped.close()
+        for f in self._files:
+            f.close()
+
+    def middle_lines(self):
+        """
+        Число общих строк в начале и строки отличающейся середины
+        обоих файлов. None, если в общих частях есть одиночные \\r,
+        которые текстовый режим считает концом строки,
+        UnicodeDecodeError, если файл не текстовый
+        """
+        first, second = self._maps
+        prefix = self._common_prefix()
+        suffix = self._common_suffix(min(len(first), len(second)) - prefix)
+        # общие части должны состоять из целых строк
+        prefix = first.rfind(b'\n', 0, prefix) + 1
+        if suffix > 0 and not (self._is_line_start(first, suffix) and
+                               self._is_line_start(second, suffix)):
+            line_end = first.find(b'\n', len(first) - suffix)
+            suffix = 0 if line_end == -1 else len(first) - line_end - 1
+        common = [(0, prefix), (len(first) - suffix, len(first))]
+        lines_before = 0
+        decoder = codecs.getincrementaldecoder(
+            locale.getpreferredencoding(False))()
+        for start, end in common:
+            for chunk_start in range(start, end, self.CHUNK):
+                chunk = first[chunk_start:min(chunk_start + self.CHUNK, end)]
+                if chunk.count(b'\r') != chunk.count(b'\r\n'):
+                    return None
+                decoder.decode(chunk)
+                if start == 0:
+                    lines_before += chunk.count(b'\n')
+        decoder.decode(b'', final=True)
+        return (lines_before,
+                self._lines(first[prefix:len(first) - suffix]),
+                self._lines(second[prefix:len(second) - suffix]))
+
+    @staticmethod
+    def _lines(data):
+        """Строки как при чтении файла в текстовом режиме"""
+        return io.TextIOWrapper(io.BytesIO(data)).readlines()
+
+    @staticmethod
+    def _is_line_start(mapped, suffix):
+        start = len(mapped) - suffix
+        return start == 0 or mapped[start - 1] == ord('\n')
+
+    def _common_prefix(self):
+        """Длина общего начала файлов в байтах"""
+        first, second = self._maps
+        limit = min(len(first), len(second))
+        position = 0
+        while position < limit:
+            end = min(position + self.CHUNK, limit)
+            if first[position:end] == second[position:end]:
+                position = end
                 continue
-            rem_str = re.search(r'@@ -([,\d]+) \+([,\d]+) @@',
-                                deltas[i])[1].split(',')
-            rem_start_index = int(rem_str[0])
-            rem_count = 1 if len(rem_str) == 1 else int(rem_str[1])
-            for k in range(rem_start_index, rem_start_index + rem_count):
-                new_file.pop(k - count_rem_str - 1)
-                count_rem_str += 1
-        for i in range(2, len(deltas)):
-            if re.match(r'@@', deltas[i]) is None:
+            low, high = position, end
+            while high - low > 1:
+                middle = (low + high) // 2
+                if first[low:middle] == second[low:middle]:
+                    low = middle
+                else:
+                    high = middle
+            return low
+        return limit
+
+    def _common_suffix(self, limit):
+        """Длина общего конца файлов в байтах, не больше limit"""
+        first, second = self._maps
+        first_end, second_end = len(first), len(second)
+        length = 0
+        while length < limit:
+            step = min(self.CHUNK, limit - length)
+            if first[first_end - length - step:first_end - length] == \
+                    second[second_end - length - step:second_end - length]:
+                length += step
                 continue
-            rem_str = re.search(r'@@ -([,\d]+) \+([,\d]+) @@',
-                                deltas[i])[1].split(',')
-            rem_count = 1 if len(rem_str) == 1 else int(rem_str[1])
-            add_str = re.search(r'@@ -([,\d]+) \+([,\d]+) @@',
-                                deltas[i])[2].split(',')
-            add_start = int(add_str[0])
-            add_count = 1 if len(add_str) == 1 else int(add_str[1])
-            for k in range(add_start, add_start + add_count):
-                new_file.insert(k - 1,
-                                deltas[rem_count + i + k - add_start + 1][1:])
-        return new_file
+            low, high = length, length + step
+            while high - low > 1:
+                middle = (low + high) // 2
+                if first[first_end - middle:first_end - low] == \
+                        second[second_end - middle:second_end - low]:
+                    low = middle
+                else:
+                    high = middle
+            return low
+        return limit
+
+
+def _pair_delta(pair, engine):
+    """Сравнение пары файлов, в том числе в процессе пула FilesComparer"""
+    comparer = FilesComparer(engine=engine)
+    comparer.compare_pair(pair)
+    return comparer.deltas[pair[1]]
+
+
+class BinaryComparer:
+    """
+    Блочные изменения двоичных файлов по схеме rsync: исходная версия
+    делится на блоки, по новой версии скользит окно со слабой
+    кольцевой контрольной суммой adler32, совпадения проверяются по md5
+    """
+    MIN_BLOCK = 2048
+    MOD_ADLER = 65521
+
+    @classmethod
+    def block_size(cls, basis_size):
+        return max(cls.MIN_BLOCK, isqrt(basis_size))
+
+    @classmethod
+    def block_delta(cls, basis, target):
+        """Операции BlockDelta построения target по basis"""
+        size = cls.block_size(len(basis))
+        blocks = {}
+        for offset in range(0, len(basis) - size + 1, size):
+            block = basis[offset:offset + size]
+            strong = blocks.setdefault(zlib.adler32(block), {})
+            strong.setdefault(hashlib.md5(block).digest(), offset)
+
+        ops = []
+        literal_start = 0
+        position = 0
+        weak = None
+        while position + size <= len(target):
+            if weak is None:
+                weak = zlib.adler32(target[position:position + size])
+                a, b = weak & 0xffff, weak >> 16
+            candidates = blocks.get(weak)
+            if candidates is not None:
+                window = target[position:position + size]
+                offset = candidates.get(hashlib.md5(window).digest())
+                if offset is not None:
+                    if literal_start < position:
+                        ops.append((BlockDelta.INSERT,
+                                    target[literal_start:position]))
+                    cls._append_copy(ops, offset, size)
+                    position += size
+                    literal_start = position
+                    weak = None
+                    continue
+            if position + size == len(target):
+                break
+            # сдвиг окна на байт: пересчёт adler32 без чтения всего окна
+            old_byte = target[position]
+            new_byte = target[position + size]
+            a = (a - old_byte + new_byte) % cls.MOD_ADLER
+            b = (b - size * old_byte + a - 1) % cls.MOD_ADLER
+            weak = (b << 16) | a
+            position += 1
+        if literal_start < len(target):
+            ops.append((BlockDelta.INSERT, target[literal_start:]))
+        return ops
+
+    @staticmethod
+    def _append_copy(ops, offset, length):
+        """Копирование, продолжающее предыдущее, объединяется с ним"""
+        if ops and ops[-1][0] == BlockDelta.COPY and \
+                ops[-1][1] + ops[-1][2] == offset:
+            ops[-1] = (BlockDelta.COPY, ops[-1][1], ops[-1][2] + length)
+        else:
+            ops.append((BlockDelta.COPY, offset, length))
+
+    @staticmethod
+    def apply(basis, ops):
+        """Построение новой версии по исходной и операциям"""
+        result = io.BytesIO()
+        Tracing.count("block_ops_applied", len(ops))
+        for op in ops:
+            if op[0] == BlockDelta.COPY:
+                result.write(basis[op[1]:op[1] + op[2]])
+            else:
+                result.write(op[1])
+        return result.getvalue()
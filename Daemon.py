@@ -0,0 +1,140 @@
+import io
+import os
+import sys
+import json
+import socket
+import argparse
+import contextlib
+
+# команды, которые клиент всегда выполняет сам
+LOCAL_COMMANDS = ("init", "daemon", "watch")
+
+
+def socket_file(path):
+    """Сокет демона репозитория в папке path"""
+    return os.path.join(path, "repository", "daemon.sock")
+
+
+def _receive(connection):
+    chunks = []
+    while True:
+        chunk = connection.recv(64 * 1024)
+        if not chunk:
+            return b''.join(chunks)
+        chunks.append(chunk)
+
+
+def run_in_daemon(args):
+    """
+    Выполнение команды демоном репозитория, если он запущен.
+    False, если демона нет и команду нужно выполнить самому
+    """
+    if args.command[0] in LOCAL_COMMANDS or not hasattr(socket, 'AF_UNIX'):
+        return False
+    file = socket_file(args.path)
+    if not os.path.exists(file):
+        return False
+    request = dict(vars(args), path=os.path.abspath(args.path))
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.connect(file)
+        except OSError:
+            return False
+        # после отправки команда уже могла выполниться,
+        # повторять её самому нельзя
+        try:
+            client.sendall(json.dumps(request).encode())
+            client.shutdown(socket.SHUT_WR)
+            reply = json.loads(_receive(client))
+        except (OSError, ValueError):
+            sys.exit("Connection to the repository daemon is lost, "
+                     "check the repository state.")
+    if reply.get("local"):
+        return False
+    sys.stdout.write(reply["output"])
+    if reply["exit"] != 0:
+        sys.exit(reply["exit"])
+    return True
+
+
+class CommandServer:
+    """
+    Демон репозитория: выполняет команды клиентов по одной. Метаданные,
+    шаблоны игнорирования и индекс last_state остаются в памяти в кэше
+    cache между командами, пока не изменятся их файлы
+    """
+    class DaemonException(Exception):
+        def __init__(self, message):
+            if message:
+                self.message = message
+
+        def __str__(self):
+            if self.message:
+                return f'Daemon exception: {self.message}'
+            return 'Daemon exception'
+
+    def __init__(self, path, execute, cache):
+        self._path = os.path.realpath(path)
+        self._file = socket_file(path)
+        self._execute = execute
+        self._cache = cache
+
+    def serve(self):
+        """Приём команд, пока процесс не прервут"""
+        if not hasattr(socket, 'AF_UNIX'):
+            raise self.DaemonException("Unix sockets are not supported "
+                                       "on this system.")
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+            self._bind(server)
+            try:
+                server.listen()
+                while True:
+                    connection, _ = server.accept()
+                    with connection:
+                        self._handle(connection)
+            finally:
+                os.remove(self._file)
+
+    def _bind(self, server):
+        if os.path.exists(self._file):
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                try:
+                    probe.connect(self._file)
+                except OSError:
+                    # сокет остался от демона, завершившегося аварийно
+                    os.remove(self._file)
+                else:
+                    raise self.DaemonException("Daemon is already running.")
+        server.bind(self._file)
+
+    def _handle(self, connection):
+        try:
+            request = json.loads(_receive(connection))
+        except (OSError, ValueError):
+            return
+        if os.path.realpath(request["path"]) != self._path:
+            connection.sendall(json.dumps({"local": True}).encode())
+            return
+        output = io.StringIO()
+        code = 0
+        with contextlib.redirect_stdout(output), \
+                contextlib.redirect_stderr(output):
+            try:
+                self._execute(argparse.Namespace(**request))
+            except SystemExit as e:
+                code = 0 if e.code is None else e.code
+            except Exception as e:
+                print(e)
+                code = 1
+        if code != 0:
+            self._cache.clear()
+        else:
+            # метаданные, изменённые командой, но не записанные,
+            # не должны достаться следующей команде
+            self._cache.discard(lambda value: getattr(value, "is_dirty",
+                                                      False))
+        try:
+            connection.sendall(json.dumps({"output": output.getvalue(),
+                                           "exit": code}).encode())
+        except OSError:
+            pass
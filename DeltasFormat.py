@@ -0,0 +1,524 @@
+import io
+import os
+import lzma
+import zlib
+import struct
+import pickle
+import shutil
+from Comparers import Deltas, FilesComparer, Hunk, BlockDelta
+import Tracing
+
+# Формат файла изменений (index.dat и коммиты в objects):
+#   MAGIC VERSION, затем наборы изменений Deltas, каждый - это записи
+#   и признак конца набора END.
+#   Запись: вид записи (1 байт), путь к файлу, содержимое.
+#   ADDED, DELETED - хэш содержимого в хранилище,
+#   CHANGED - число участков, заголовки всех участков (код операции,
+#   начало и длина в старой и новой версии), затем старые строки
+#   всех участков подряд и новые строки всех участков подряд.
+#   BINARY - операции построения новой версии двоичного файла по старой
+#   и старой по новой: число операций, затем операции - COPY со смещением
+#   и длиной или INSERT с длиной и байтами.
+# Строки хранятся склеенными, если все строки, кроме последней,
+# заканчиваются переводом строки (JOINED), иначе - каждая со своей длиной.
+# Сжатый файл - последовательность частей: COMPRESSED_MAGIC, способ сжатия
+# (1 байт), длина сжатых данных, сжатые данные. Распакованные части подряд
+# образуют файл изменений в описанном выше формате.
+MAGIC = b'CVSD'
+VERSION = 2
+ADDED, DELETED, CHANGED, BINARY, END = b'A', b'D', b'C', b'B', b'E'
+REPLACE, DELETE, INSERT = b'r', b'd', b'i'
+JOINED, SEPARATE = b'J', b'S'
+COMPRESSED_MAGIC = b'CVSZ'
+CODECS = {'none': b'n', 'zlib': b'z', 'lzma': b'x'}
+DEFAULT_LEVEL = 6
+READ_CHUNK = 64 * 1024
+# длина части записывается в 4 байта, длинный поток делится на части
+MEMBER_LIMIT = 1 << 30
+
+_UINT = struct.Struct('<I')
+_ULONG = struct.Struct('<Q')
+_COPY, _INSERT = b'c', b'i'
+_HUNK_FORMAT = 'cIIII'
+_MEMBER_HEADER = struct.Struct('<4scI')
+
+
+class DeltasFormatException(Exception):
+    def __init__(self, message):
+        if message:
+            self.message = message
+
+    def __str__(self):
+        if self.message:
+            return f'Deltas format exception: {self.message}'
+        return 'Deltas format exception'
+
+
+class DeltasWriter:
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write_header(self):
+        self._stream.write(MAGIC + bytes([VERSION]))
+
+    def write_deltas(self, deltas):
+        """Запись набора изменений Deltas"""
+        for file, digest in deltas.deleted.items():
+            self.write_deleted(file, digest)
+        for file, digest in deltas.added.items():
+            self.write_added(file, digest)
+        for file, delta in deltas.changed.items():
+            self.write_changed(file, delta)
+        self.write_end()
+
+    def write_deleted(self, file, digest):
+        self._write_record(DELETED, file)
+        self._write_bytes(digest.encode())
+
+    def write_added(self, file, digest):
+        self._write_record(ADDED, file)
+        self._write_bytes(digest.encode())
+
+    def write_changed(self, file, delta):
+        if isinstance(delta, BlockDelta):
+            self._write_record(BINARY, file)
+            self._write_block_ops(delta.forward)
+            self._write_block_ops(delta.backward)
+        else:
+            self._write_record(CHANGED, file)
+            self._write_hunks(delta)
+
+    def write_end(self):
+        """Признак конца набора изменений"""
+        self._stream.write(END)
+
+    def _write_record(self, kind, file):
+        self._stream.write(kind)
+        self._write_bytes(file.encode('utf-8', 'surrogateescape'))
+
+    def _write_bytes(self, data):
+        self._stream.write(_UINT.pack(len(data)))
+        self._stream.write(data)
+
+    def _write_hunks(self, hunks):
+        self._stream.write(_UINT.pack(len(hunks)))
+        headers = []
+        old_lines = []
+        new_lines = []
+        for hunk in hunks:
+            if hunk.old_count == 0:
+                opcode = INSERT
+            elif hunk.new_count == 0:
+                opcode = DELETE
+            else:
+                opcode = REPLACE
+            headers.extend((opcode, hunk.old_start, hunk.old_count,
+                            hunk.new_start, hunk.new_count))
+            old_lines.extend(hunk.old_lines)
+            new_lines.extend(hunk.new_lines)
+        self._stream.write(struct.pack('<' + _HUNK_FORMAT * len(hunks),
+                                       *headers))
+        self._write_lines(old_lines)
+        self._write_lines(new_lines)
+
+    def _write_block_ops(self, ops):
+        self._stream.write(_UINT.pack(len(ops)))
+        for op in ops:
+            if op[0] == BlockDelta.COPY:
+                self._stream.write(_COPY + _ULONG.pack(op[1]) +
+                                   _ULONG.pack(op[2]))
+            else:
+                self._stream.write(_INSERT + _ULONG.pack(len(op[1])))
+                self._stream.write(op[1])
+
+    @staticmethod
+    def _is_joinable(lines):
+        """Можно ли восстановить строки по их склейке"""
+        for line in lines[:-1]:
+            if not line.endswith('\n') or line.find('\n') != len(line) - 1:
+                return False
+        return len(lines) == 0 or \
+            (lines[-1] != '' and '\n' not in lines[-1][:-1])
+
+    def _write_lines(self, lines):
+        if self._is_joinable(lines):
+            self._stream.write(JOINED)
+            self._write_bytes(
+                ''.join(lines).encode('utf-8', 'surrogateescape'))
+            return
+        self._stream.write(SEPARATE)
+        self._stream.write(_UINT.pack(len(lines)))
+        for line in lines:
+            self._write_bytes(line.encode('utf-8', 'surrogateescape'))
+
+
+class DeltasReader:
+    def __init__(self, stream):
+        self._stream = stream
+
+    def read_header(self):
+        header = self._stream.read(len(MAGIC) + 1)
+        if header[:len(MAGIC)] != MAGIC:
+            raise DeltasFormatException("File is not a deltas file.")
+        if header[len(MAGIC)] > VERSION:
+            raise DeltasFormatException(f"Unknown format version "
+                                        f"{header[len(MAGIC)]}.")
+
+    def __iter__(self):
+        """Наборы изменений Deltas в порядке записи"""
+        added, deleted, changed = {}, {}, {}
+        while True:
+            kind = self._stream.read(1)
+            if kind == b'':
+                return
+            if kind == END:
+                yield Deltas.from_parts(added, deleted, changed)
+                added, deleted, changed = {}, {}, {}
+                continue
+            file = self._read_bytes().decode('utf-8', 'surrogateescape')
+            if kind == ADDED:
+                added[file] = self._read_bytes().decode()
+            elif kind == DELETED:
+                deleted[file] = self._read_bytes().decode()
+            elif kind == CHANGED:
+                changed[file] = self._read_hunks()
+            elif kind == BINARY:
+                changed[file] = BlockDelta(self._read_block_ops(),
+                                           self._read_block_ops())
+            else:
+                raise DeltasFormatException(f"Unknown record {kind!r}.")
+
+    def _read_exactly(self, size):
+        data = self._stream.read(size)
+        if len(data) != size:
+            raise DeltasFormatException("Unexpected end of file.")
+        return data
+
+    def _read_uint(self):
+        return _UINT.unpack(self._read_exactly(_UINT.size))[0]
+
+    def _read_bytes(self):
+        return self._read_exactly(self._read_uint())
+
+    def _read_ulong(self):
+        return _ULONG.unpack(self._read_exactly(_ULONG.size))[0]
+
+    def _read_block_ops(self):
+        ops = []
+        for _ in range(self._read_uint()):
+            op = self._read_exactly(1)
+            if op == _COPY:
+                offset = self._read_ulong()
+                ops.append((BlockDelta.COPY, offset, self._read_ulong()))
+            elif op == _INSERT:
+                ops.append((BlockDelta.INSERT,
+                            self._read_exactly(self._read_ulong())))
+            else:
+                raise DeltasFormatException(f"Unknown block operation "
+                                            f"{op!r}.")
+        return ops
+
+    def _read_hunks(self):
+        count = self._read_uint()
+        headers_format = struct.Struct('<' + _HUNK_FORMAT * count)
+        headers = headers_format.unpack(
+            self._read_exactly(headers_format.size))
+        old_lines = self._read_lines()
+        new_lines = self._read_lines()
+        hunks = []
+        old_position = 0
+        new_position = 0
+        for i in range(0, len(headers), 5):
+            _, old_start, old_count, new_start, new_count = headers[i:i + 5]
+            hunks.append(Hunk(
+                old_start, old_count, new_start, new_count,
+                old_lines[old_position:old_position + old_count],
+                new_lines[new_position:new_position + new_count]))
+            old_position += old_count
+            new_position += new_count
+        return hunks
+
+    def _read_lines(self):
+        encoding = self._read_exactly(1)
+        if encoding == JOINED:
+            text = self._read_bytes().decode('utf-8', 'surrogateescape')
+            if text == '':
+                return []
+            lines = [line + '\n' for line in text.split('\n')]
+            if text.endswith('\n'):
+                lines.pop()
+            else:
+                lines[-1] = lines[-1][:-1]
+            return lines
+        return [self._read_bytes().decode('utf-8', 'surrogateescape')
+                for _ in range(self._read_uint())]
+
+
+class CompressedStream(io.RawIOBase):
+    """
+    Поток распакованных данных сжатого файла изменений,
+    читается по частям
+    """
+    def __init__(self, raw):
+        self._raw = raw
+        self._decompressor = None
+        self._member_left = 0
+        self._buffer = b''
+        self._offset = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while self._offset == len(self._buffer):
+            if not self._fill():
+                return 0
+        size = min(len(b), len(self._buffer) - self._offset)
+        b[:size] = self._buffer[self._offset:self._offset + size]
+        self._offset += size
+        return size
+
+    def _fill(self):
+        """Распаковка следующей порции данных, False в конце файла"""
+        if self._member_left == 0:
+            header = self._raw.read(_MEMBER_HEADER.size)
+            if header == b'':
+                return False
+            if len(header) != _MEMBER_HEADER.size:
+                raise DeltasFormatException("Unexpected end of file.")
+            magic, codec, self._member_left = _MEMBER_HEADER.unpack(header)
+            if magic != COMPRESSED_MAGIC:
+                raise DeltasFormatException("Compressed part is damaged.")
+            self._decompressor = _decompressor(codec)
+        chunk = self._raw.read(min(self._member_left, READ_CHUNK))
+        if chunk == b'':
+            raise DeltasFormatException("Unexpected end of file.")
+        self._member_left -= len(chunk)
+        self._buffer = self._decompressor(chunk)
+        self._offset = 0
+        return True
+
+
+class CompressedMemberWriter:
+    """
+    Запись сжатых частей файла изменений по мере поступления данных,
+    длина части записывается в её заголовок, когда часть закончена
+    """
+    def __init__(self, raw, codec, level=DEFAULT_LEVEL):
+        self._raw = raw
+        if codec not in CODECS:
+            raise DeltasFormatException(f"Unknown compression {codec}.")
+        self._codec = codec
+        self._level = level
+        self._header_position = None
+        self._compressor = None
+        self._size = 0
+
+    def write(self, data):
+        if self._header_position is None:
+            self._start_member()
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        self._raw.write(data)
+        self._size += len(data)
+        if self._size >= MEMBER_LIMIT:
+            self._finish_member()
+
+    def close(self):
+        """Завершение последней части, файл raw остаётся открытым"""
+        if self._header_position is not None:
+            self._finish_member()
+
+    def _start_member(self):
+        self._header_position = self._raw.tell()
+        self._size = 0
+        self._raw.write(_MEMBER_HEADER.pack(COMPRESSED_MAGIC,
+                                            CODECS[self._codec], 0))
+        if self._codec == 'zlib':
+            self._compressor = zlib.compressobj(self._level)
+        elif self._codec == 'lzma':
+            self._compressor = lzma.LZMACompressor(preset=self._level)
+
+    def _finish_member(self):
+        if self._compressor is not None:
+            data = self._compressor.flush()
+            self._raw.write(data)
+            self._size += len(data)
+        end = self._raw.tell()
+        self._raw.seek(self._header_position)
+        self._raw.write(_MEMBER_HEADER.pack(
+            COMPRESSED_MAGIC, CODECS[self._codec], self._size))
+        self._raw.seek(end)
+        self._header_position = None
+
+
+class DeltasAppender:
+    """
+    Дописывание одного набора изменений в конец файла изменений
+    по одной записи, без сборки набора в памяти.
+    Записи собираются во временном файле рядом и переносятся в файл
+    изменений только после успешного завершения, прерванная запись
+    не оставляет в файле изменений неполный набор.
+    Сжатие пустого файла определяется codec, в сжатый файл
+    набор дописывается отдельной сжатой частью.
+    """
+    def __init__(self, path, codec='none', level=DEFAULT_LEVEL):
+        self.path = path
+        self._part_path = path + ".part"
+        self._codec = codec
+        self._level = level
+        self._part = None
+        self._member = None
+        self._writer = None
+
+    def __enter__(self):
+        is_new = not os.path.isfile(self.path) or \
+            os.path.getsize(self.path) == 0
+        compressed = self._codec != 'none' if is_new \
+            else is_compressed(self.path)
+        self._part = open(self._part_path, 'w+b')
+        stream = self._part
+        if compressed:
+            self._member = CompressedMemberWriter(self._part, self._codec,
+                                                  self._level)
+            stream = self._member
+        self._writer = DeltasWriter(stream)
+        if is_new:
+            self._writer.write_header()
+        return self
+
+    def write_change(self, kind, file, value):
+        """Запись изменения одного файла, kind - added, deleted или changed"""
+        if kind == 'added':
+            self._writer.write_added(file, value)
+        elif kind == 'deleted':
+            self._writer.write_deleted(file, value)
+        else:
+            self._writer.write_changed(file, value)
+
+    def write_deltas(self, deltas):
+        """Запись всех изменений набора Deltas"""
+        for kind in ('deleted', 'added', 'changed'):
+            for file, value in getattr(deltas, kind).items():
+                self.write_change(kind, file, value)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self._writer.write_end()
+                if self._member is not None:
+                    self._member.close()
+                Tracing.count("bytes_written", self._part.tell())
+                self._part.seek(0)
+                with open(self.path, 'ab') as f:
+                    shutil.copyfileobj(self._part, f, READ_CHUNK)
+        finally:
+            self._part.close()
+            os.remove(self._part_path)
+
+
+def _decompressor(codec):
+    """Функция распаковки очередной порции данных части файла"""
+    if codec == CODECS['none']:
+        return bytes
+    if codec == CODECS['zlib']:
+        return zlib.decompressobj().decompress
+    if codec == CODECS['lzma']:
+        return lzma.LZMADecompressor().decompress
+    raise DeltasFormatException(f"Unknown compression {codec!r}.")
+
+
+def is_deltas_file(path):
+    """True, если файл пуст или записан в формате изменений"""
+    with open(path, 'rb') as f:
+        head = f.read(len(MAGIC))
+    return head in (b'', MAGIC, COMPRESSED_MAGIC)
+
+
+def is_compressed(path):
+    with open(path, 'rb') as f:
+        return f.read(len(COMPRESSED_MAGIC)) == COMPRESSED_MAGIC
+
+
+def append_deltas(path, deltas, codec='none', level=DEFAULT_LEVEL):
+    """Дописывание набора изменений Deltas в конец файла изменений"""
+    with DeltasAppender(path, codec, level) as appender:
+        appender.write_deltas(deltas)
+
+
+def iter_deltas(path):
+    """
+    Наборы изменений из файла по одному,
+    сжатый файл распаковывается по частям
+    """
+    with open(path, 'rb') as f:
+        head = f.read(len(MAGIC))
+        if head == b'':
+            return
+        f.seek(0)
+        stream = f
+        if head == COMPRESSED_MAGIC:
+            stream = io.BufferedReader(CompressedStream(f), READ_CHUNK)
+        reader = DeltasReader(stream)
+        reader.read_header()
+        for deltas in reader:
+            Tracing.count("deltas_read")
+            yield deltas
+        Tracing.count("bytes_read", f.tell())
+
+
+def read_deltas(path):
+    """Список наборов изменений из файла"""
+    return list(iter_deltas(path))
+
+
+def rewrite_deltas(path, codec, level=DEFAULT_LEVEL):
+    """Перезапись файла изменений одной частью с заданным сжатием"""
+    tmp_file = path + ".tmp"
+    with open(tmp_file, 'wb') as f:
+        stream = f
+        if codec != 'none':
+            stream = CompressedMemberWriter(f, codec, level)
+        writer = DeltasWriter(stream)
+        for i, deltas in enumerate(iter_deltas(path)):
+            if i == 0:
+                writer.write_header()
+            writer.write_deltas(deltas)
+        if codec != 'none':
+            stream.close()
+    os.replace(tmp_file, path)
+
+
+def read_legacy_deltas(path):
+    """Список наборов изменений Deltas, записанных pickle подряд"""
+    commit_deltas = []
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                commit_deltas.append(pickle.load(f))
+            except EOFError:
+                break
+    return commit_deltas
+
+
+def convert_legacy_deltas(deltas, root, object_store):
+    """
+    Перевод изменений старого формата: строки добавленных и удалённых
+    файлов сохраняются в хранилище, unified diff разбирается на участки,
+    абсолютные пути изменённых файлов становятся относительными
+    """
+    converted = {}
+    for kind in ('added', 'deleted'):
+        files = {}
+        for file, content in getattr(deltas, kind).items():
+            if not isinstance(content, str):
+                data = ''.join(content).encode('utf-8', 'surrogateescape')
+                content = object_store.put_bytes(data, pin=True)
+            files[file] = content
+        converted[kind] = files
+    changed = {}
+    for file, delta in deltas.changed.items():
+        relative_file = os.path.relpath(os.path.join(root, file), root)
+        changed[relative_file] = FilesComparer.hunks(delta)
+    return Deltas.from_parts(converted['added'], converted['deleted'],
+                             changed)
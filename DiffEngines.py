@@ -0,0 +1,214 @@
+import difflib
+
+# Алгоритмы построчного сравнения. Каждый возвращает список отличающихся
+# участков (тег, i1, i2, j1, j2) в терминах SequenceMatcher.get_opcodes:
+# строки a[i1:i2] заменяются строками b[j1:j2].
+# myers и histogram сравнивают не строки, а их номера в общем словаре,
+# одинаковые строки получают одинаковый номер.
+
+# строки, встречающиеся в участке чаще, не выбираются опорными
+# в histogram, участок без опорных строк сравнивается myers
+MAX_CHAIN = 64
+# после стольких шагов поиска средней змейки myers делит участок
+# по самой дальней достигнутой точке, результат может быть не минимальным
+MAX_COST = 256
+
+
+def difflib_opcodes(a, b):
+    matcher = difflib.SequenceMatcher(None, a, b)
+    return [x for x in matcher.get_opcodes() if x[0] != 'equal']
+
+
+def myers_opcodes(a, b):
+    a, b = _intern(a, b)
+    matches = []
+    _myers(a, b, 0, len(a), 0, len(b), matches)
+    return _opcodes(matches, len(a), len(b))
+
+
+def histogram_opcodes(a, b):
+    a, b = _intern(a, b)
+    matches = []
+    tasks = [(0, len(a), 0, len(b))]
+    while tasks:
+        a_lo, a_hi, b_lo, b_hi = tasks.pop()
+        a_lo, a_hi, b_lo, b_hi = _trim(a, b, a_lo, a_hi, b_lo, b_hi,
+                                       matches)
+        if a_lo == a_hi or b_lo == b_hi:
+            continue
+        anchor = _histogram_anchor(a, b, a_lo, a_hi, b_lo, b_hi)
+        if anchor is None:
+            _myers(a, b, a_lo, a_hi, b_lo, b_hi, matches)
+            continue
+        i, j, size = anchor
+        matches.append((i, j, size))
+        tasks.append((a_lo, i, b_lo, j))
+        tasks.append((i + size, a_hi, j + size, b_hi))
+    return _opcodes(matches, len(a), len(b))
+
+
+ENGINES = {
+    "difflib": difflib_opcodes,
+    "myers": myers_opcodes,
+    "histogram": histogram_opcodes,
+}
+
+
+def _intern(a, b):
+    """Замена строк их номерами в общем словаре"""
+    ids = {}
+    return ([ids.setdefault(line, len(ids)) for line in a],
+            [ids.setdefault(line, len(ids)) for line in b])
+
+
+def _trim(a, b, a_lo, a_hi, b_lo, b_hi, matches):
+    """Отбрасывание общих начала и конца участка, они записываются в matches"""
+    start = a_lo
+    while a_lo < a_hi and b_lo < b_hi and a[a_lo] == b[b_lo]:
+        a_lo += 1
+        b_lo += 1
+    if a_lo > start:
+        matches.append((start, b_lo - (a_lo - start), a_lo - start))
+    end = a_hi
+    while a_lo < a_hi and b_lo < b_hi and a[a_hi - 1] == b[b_hi - 1]:
+        a_hi -= 1
+        b_hi -= 1
+    if a_hi < end:
+        matches.append((a_hi, b_hi, end - a_hi))
+    return a_lo, a_hi, b_lo, b_hi
+
+
+def _histogram_anchor(a, b, a_lo, a_hi, b_lo, b_hi):
+    """
+    Общий участок (i, j, длина), содержащий строку, которая реже
+    остальных встречается в a[a_lo:a_hi], None, если все общие строки
+    встречаются чаще MAX_CHAIN раз
+    """
+    positions = {}
+    for i in range(a_lo, a_hi):
+        positions.setdefault(a[i], []).append(i)
+    best = None
+    best_count = MAX_CHAIN + 1
+    j = b_lo
+    while j < b_hi:
+        occurrences = positions.get(b[j])
+        if occurrences is None or len(occurrences) > best_count:
+            j += 1
+            continue
+        next_j = j + 1
+        for i in occurrences:
+            start_i, start_j = i, j
+            while start_i > a_lo and start_j > b_lo and \
+                    a[start_i - 1] == b[start_j - 1]:
+                start_i -= 1
+                start_j -= 1
+            end_i, end_j = i + 1, j + 1
+            while end_i < a_hi and end_j < b_hi and a[end_i] == b[end_j]:
+                end_i += 1
+                end_j += 1
+            size = end_i - start_i
+            if best is None or len(occurrences) < best_count or \
+                    size > best[2]:
+                best = (start_i, start_j, size)
+                best_count = len(occurrences)
+            next_j = max(next_j, end_j)
+        j = next_j
+    return best
+
+
+def _myers(a, b, a_lo, a_hi, b_lo, b_hi, matches):
+    """
+    Алгоритм Майерса O(ND) с линейной памятью: участок делится средней
+    змейкой на два, пока участки не станут пустыми
+    """
+    tasks = [(a_lo, a_hi, b_lo, b_hi)]
+    while tasks:
+        a_lo, a_hi, b_lo, b_hi = tasks.pop()
+        a_lo, a_hi, b_lo, b_hi = _trim(a, b, a_lo, a_hi, b_lo, b_hi,
+                                       matches)
+        if a_lo == a_hi or b_lo == b_hi:
+            continue
+        if set(a[a_lo:a_hi]).isdisjoint(b[b_lo:b_hi]):
+            continue
+        x, y, u, v = _middle_snake(a, b, a_lo, a_hi, b_lo, b_hi)
+        if u > x:
+            matches.append((x, y, u - x))
+        tasks.append((a_lo, x, b_lo, y))
+        tasks.append((u, a_hi, v, b_hi))
+
+
+def _middle_snake(a, b, a_lo, a_hi, b_lo, b_hi):
+    """
+    Средняя змейка кратчайшего пути правок: (x, y, u, v) - диагональ
+    от a[x], b[y] до a[u], b[v], абсолютные индексы.
+    Если змейка не найдена за MAX_COST шагов, возвращается
+    самая дальняя точка прямого поиска
+    """
+    n = a_hi - a_lo
+    m = b_hi - b_lo
+    delta = n - m
+    odd = delta % 2 != 0
+    offset = min(n + m, MAX_COST) + 1
+    forward = [0] * (2 * offset + 1)
+    backward = [0] * (2 * offset + 1)
+    for d in range((n + m + 1) // 2 + 1):
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and
+                           forward[offset + k - 1] < forward[offset + k + 1]):
+                x = forward[offset + k + 1]
+            else:
+                x = forward[offset + k - 1] + 1
+            y = x - k
+            start_x, start_y = x, y
+            while x < n and y < m and a[a_lo + x] == b[b_lo + y]:
+                x += 1
+                y += 1
+            forward[offset + k] = x
+            if odd and delta - (d - 1) <= k <= delta + (d - 1) and \
+                    x + backward[offset + delta - k] >= n:
+                return (a_lo + start_x, b_lo + start_y, a_lo + x, b_lo + y)
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and
+                           backward[offset + k - 1] <
+                           backward[offset + k + 1]):
+                x = backward[offset + k + 1]
+            else:
+                x = backward[offset + k - 1] + 1
+            y = x - k
+            start_x, start_y = x, y
+            while x < n and y < m and \
+                    a[a_hi - 1 - x] == b[b_hi - 1 - y]:
+                x += 1
+                y += 1
+            backward[offset + k] = x
+            if not odd and -d <= delta - k <= d and \
+                    x + forward[offset + delta - k] >= n:
+                return (a_hi - x, b_hi - y,
+                        a_hi - start_x, b_hi - start_y)
+        if d >= MAX_COST:
+            # только диагонали, пройденные прямым поиском и лежащие
+            # внутри участка, точка на них не выходит за участок
+            points = [(x, x - k) for k, x in
+                      ((k, min(max(forward[offset + k], k, 0), n, m + k))
+                       for k in range(max(-d, -m), min(d, n) + 1)
+                       if (k + d) % 2 == 0)]
+            x, y = max(points, key=sum)
+            if (x, y) in ((0, 0), (n, m)):
+                x, y = n // 2, m // 2
+            return (a_lo + x, b_lo + y, a_lo + x, b_lo + y)
+    raise AssertionError("Middle snake is not found")
+
+
+def _opcodes(matches, n, m):
+    """Отличающиеся участки между общими участками matches"""
+    opcodes = []
+    i = j = 0
+    for match_i, match_j, size in sorted(matches) + [(n, m, 0)]:
+        if i < match_i and j < match_j:
+            opcodes.append(('replace', i, match_i, j, match_j))
+        elif i < match_i:
+            opcodes.append(('delete', i, match_i, j, match_j))
+        elif j < match_j:
+            opcodes.append(('insert', i, match_i, j, match_j))
+        i, j = match_i + size, match_j + size
+    return opcodes
@@ -0,0 +1,52 @@
+import os
+import re
+
+
+class IgnoreMatcher:
+    """
+    Шаблоны из CVSignore.txt, собранные в одно регулярное выражение
+    на каждый вид шаблона:
+      шаблон - имя файла,
+      шаблон/ - имя папки, папка не обходится,
+      /шаблон - путь к файлу от корня, /шаблон/ - путь к папке от корня.
+    Части пути разделяются '/'
+    """
+    def __init__(self, patterns):
+        groups = {(anchored, is_dir): []
+                  for anchored in (False, True) for is_dir in (False, True)}
+        for pattern in patterns:
+            pattern = pattern.rstrip('\r')
+            anchored = pattern.startswith('/')
+            if anchored:
+                pattern = pattern[1:]
+            is_dir = pattern.endswith('/')
+            if is_dir:
+                pattern = pattern[:-1]
+            if pattern:
+                groups[(anchored, is_dir)].append(pattern)
+        self._file_names = self._compile(groups[(False, False)])
+        self._file_paths = self._compile(groups[(True, False)])
+        self._dir_names = self._compile(groups[(False, True)])
+        self._dir_paths = self._compile(groups[(True, True)])
+
+    @staticmethod
+    def _compile(patterns):
+        if not patterns:
+            return None
+        return re.compile('|'.join(f'(?:{x})' for x in patterns))
+
+    @staticmethod
+    def _matches(regex, text):
+        return regex is not None and regex.fullmatch(text) is not None
+
+    def is_file_ignored(self, relative):
+        """Игнорируется ли файл, relative - путь от корня"""
+        return (self._matches(self._file_names, os.path.basename(relative))
+                or self._matches(self._file_paths,
+                                 relative.replace(os.sep, '/')))
+
+    def is_dir_ignored(self, relative):
+        """Пропускается ли папка при обходе, relative - путь от корня"""
+        return (self._matches(self._dir_names, os.path.basename(relative))
+                or self._matches(self._dir_paths,
+                                 relative.replace(os.sep, '/')))
@@ -0,0 +1,163 @@
+import os
+import time
+
+# журнал больше этого размера начинается заново с новой меткой
+JOURNAL_LIMIT = 1024 * 1024
+# столько секунд команда ждёт, пока наблюдатель увидит файл-метку
+COOKIE_TIMEOUT = 5
+
+
+class DirtyJournal:
+    """
+    Журнал путей основной папки, изменённых с момента запуска наблюдателя.
+    Первая строка - метка журнала, дальше по строке на запись:
+      +путь - изменённый файл или папка,
+      ?имя - наблюдатель увидел файл-метку имя в папке cookies,
+      !overflow - часть изменений потеряна.
+    Журнал пишет только наблюдатель. Команды записывают в journal_base.txt
+    метку и смещение в журнале, до которого все изменения уже отражены
+    в индексе last_state.
+    """
+    HEADER = b'CVSJ '
+
+    def __init__(self, repository):
+        self.file = os.path.join(repository, "journal.dat")
+        self.base_file = os.path.join(repository, "journal_base.txt")
+        self.cookies = os.path.join(repository, "cookies")
+        self._stream = None
+        self._inode = None
+
+    def snapshot(self):
+        """
+        Пути, изменённые после последней сверки, и позиция журнала,
+        которую можно записать как новую сверку.
+        Пути - None, если журналу нельзя доверять и нужен полный обход,
+        позиция - None, если наблюдатель не запущен
+        """
+        token, data = self._read()
+        if token is None:
+            return None, None
+        base = self._read_base()
+        if base is None or base[0] != token or base[1] > len(data):
+            return None, (token, len(data))
+        cookie = self._make_cookie()
+        try:
+            deadline = time.monotonic() + COOKIE_TIMEOUT
+            while True:
+                dirty_paths, end = self._dirty_paths(data, base[1], cookie)
+                if end is not None:
+                    return dirty_paths, (token, end)
+                if time.monotonic() > deadline:
+                    break
+                time.sleep(0.01)
+                new_token, data = self._read()
+                if new_token != token:
+                    if new_token is None:
+                        return None, None
+                    return None, (new_token, len(data))
+        finally:
+            self._remove(os.path.join(self.cookies, cookie))
+        # наблюдатель не ответил, журнал больше не ведётся
+        self._remove(self.file)
+        return None, None
+
+    def mark_clean(self, position):
+        """Запись сверки: изменения до позиции отражены в индексе"""
+        if position is None:
+            return
+        with open(self.base_file, 'w') as f:
+            f.write(f"{position[0]} {position[1]}")
+
+    def _read(self):
+        """Метка и всё содержимое журнала, (None, b''), если его нет"""
+        try:
+            with open(self.file, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None, b''
+        header, separator, _ = data.partition(b'\n')
+        if not separator or not header.startswith(self.HEADER):
+            return None, b''
+        return header[len(self.HEADER):].decode(), data
+
+    def _read_base(self):
+        try:
+            with open(self.base_file, 'r') as f:
+                token, offset = f.read().split()
+            return token, int(offset)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _dirty_paths(data, start, cookie):
+        """
+        Пути, записанные после смещения start до строки файла-метки,
+        и смещение конца этой строки, None, если её ещё нет
+        """
+        dirty_paths = set()
+        trusted = True
+        offset = start
+        while True:
+            end = data.find(b'\n', offset)
+            if end == -1:
+                return dirty_paths, None
+            line = os.fsdecode(data[offset:end])
+            offset = end + 1
+            if line.startswith('+'):
+                dirty_paths.add(line[1:])
+                if line[1:] == "CVSignore.txt":
+                    trusted = False
+            elif line.startswith('!'):
+                trusted = False
+            elif line == '?' + cookie:
+                return (dirty_paths if trusted else None), offset
+
+    def _make_cookie(self):
+        os.makedirs(self.cookies, exist_ok=True)
+        cookie = f"{os.getpid()}-{os.urandom(16).hex()}"
+        open(os.path.join(self.cookies, cookie), 'w').close()
+        return cookie
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def start(self):
+        """Новый пустой журнал с новой меткой"""
+        self.close()
+        temporary = self.file + ".part"
+        with open(temporary, 'wb') as f:
+            f.write(self.HEADER + os.urandom(16).hex().encode() + b'\n')
+        os.replace(temporary, self.file)
+        self._stream = open(self.file, 'ab')
+        self._inode = os.fstat(self._stream.fileno()).st_ino
+
+    def append(self, lines):
+        """
+        Запись строк в журнал. Если журнал удалён командой или слишком
+        разросся, он начинается заново
+        """
+        try:
+            replaced = os.stat(self.file).st_ino != self._inode
+        except OSError:
+            replaced = True
+        if replaced or self._stream.tell() > JOURNAL_LIMIT:
+            self.start()
+        for line in lines:
+            if '\n' in line:
+                line = '!overflow'
+            self._stream.write(os.fsencode(line) + b'\n')
+        self._stream.flush()
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+    def stop(self):
+        """Удаление журнала при остановке наблюдателя"""
+        self.close()
+        self._remove(self.file)
@@ -0,0 +1,618 @@
+import os
+import mmap
+import time
+import array
+import pickle
+import shutil
+import sqlite3
+import hashlib
+import tempfile
+import configparser
+import Tracing
+
+HASH_CHUNK = 1024 * 1024
+# файлы не меньше этого размера отображаются в память
+MMAP_THRESHOLD = 1024 * 1024
+
+
+def file_digest(path):
+    """
+    Хэш содержимого файла, большой файл хэшируется через отображение
+    в память без копирования, остальные читаются по частям
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        Tracing.count("files_hashed")
+        Tracing.count("bytes_read", size)
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                digest.update(mapped)
+            return digest.hexdigest()
+        while True:
+            chunk = f.read(HASH_CHUNK)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ObjectStore:
+    """
+    Хранилище содержимого файлов по хэшу. Блобы раскладываются
+    по подпапкам по первым двум символам хэша.
+    Блобы, на которые ссылается только last_state, лежат в подпапке state
+    и удаляются, когда last_state перестаёт на них ссылаться.
+    Блобы, на которые ссылается история (закреплённые), не удаляются.
+    """
+    STATE = "state"
+
+    def __init__(self, root):
+        self.root = root
+        self._state_root = os.path.join(root, self.STATE)
+
+    @staticmethod
+    def _fan_out(root, digest):
+        return os.path.join(root, digest[:2], digest[2:])
+
+    def path(self, digest):
+        """Путь к блобу, None, если блоба нет"""
+        pinned = self._fan_out(self.root, digest)
+        if os.path.isfile(pinned):
+            return pinned
+        loose = self._fan_out(self._state_root, digest)
+        if os.path.isfile(loose):
+            return loose
+        return None
+
+    def has(self, digest):
+        return self.path(digest) is not None
+
+    def put_file(self, path, pin=False):
+        """Сохранение файла в хранилище, возвращает хэш содержимого"""
+        digest = hashlib.sha1()
+        fd, tmp = tempfile.mkstemp(dir=self.root)
+        with open(path, 'rb') as src, os.fdopen(fd, 'wb') as dst:
+            while True:
+                chunk = src.read(HASH_CHUNK)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                dst.write(chunk)
+                Tracing.count("bytes_read", len(chunk))
+                Tracing.count("bytes_written", len(chunk))
+        return self._store_tmp(tmp, digest.hexdigest(), pin)
+
+    def put_bytes(self, data, pin=False):
+        digest = hashlib.sha1(data).hexdigest()
+        if self.has(digest):
+            if pin:
+                self.pin(digest)
+            return digest
+        fd, tmp = tempfile.mkstemp(dir=self.root)
+        with os.fdopen(fd, 'wb') as dst:
+            dst.write(data)
+        Tracing.count("bytes_written", len(data))
+        return self._store_tmp(tmp, digest, pin)
+
+    def _store_tmp(self, tmp, digest, pin):
+        if self.has(digest):
+            os.remove(tmp)
+            if pin:
+                self.pin(digest)
+            return digest
+        blob = self._fan_out(self.root if pin else self._state_root, digest)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        os.replace(tmp, blob)
+        return digest
+
+    def pin(self, digest):
+        """Закрепление блоба, на который ссылается история коммитов"""
+        loose = self._fan_out(self._state_root, digest)
+        if os.path.isfile(loose):
+            pinned = self._fan_out(self.root, digest)
+            os.makedirs(os.path.dirname(pinned), exist_ok=True)
+            os.replace(loose, pinned)
+
+    def release(self, digest):
+        """Удаление блоба, если на него ссылался только last_state"""
+        loose = self._fan_out(self._state_root, digest)
+        if os.path.isfile(loose):
+            os.remove(loose)
+
+    def read(self, digest):
+        with open(self.path(digest), 'rb') as f:
+            data = f.read()
+        Tracing.count("bytes_read", len(data))
+        return data
+
+    def copy_to(self, digest, destination):
+        shutil.copyfile(self.path(digest), destination)
+        if Tracing.is_enabled():
+            Tracing.count("bytes_written", os.path.getsize(destination))
+
+
+class TreeIndex:
+    """
+    Индекс состояния last_state: относительный путь к файлу ->
+    (размер, mtime_ns, inode, хэш содержимого).
+    Размер, время изменения и inode относятся к файлу основной папки
+    в момент добавления, хэш - к сохранённому содержимому.
+    """
+    SIZE, MTIME, INODE, DIGEST = range(4)
+
+    def __init__(self, index_file):
+        self.file = index_file
+        self.entries = {}
+        self._written_ns = 0
+
+    @classmethod
+    def load(cls, index_file):
+        """Загрузка индекса, None, если файла индекса нет"""
+        if not os.path.isfile(index_file):
+            return None
+        index = cls(index_file)
+        with Tracing.span("tree_index.load"), open(index_file, 'rb') as f:
+            try:
+                index.entries = pickle.load(f)
+            except EOFError:
+                pass
+            Tracing.count("pickle_loads")
+            Tracing.count("bytes_read", f.tell())
+        index._written_ns = os.stat(index_file).st_mtime_ns
+        return index
+
+    def save(self):
+        with Tracing.span("tree_index.save"), open(self.file, 'wb') as f:
+            pickle.dump(self.entries, f, pickle.HIGHEST_PROTOCOL)
+            Tracing.count("bytes_written", f.tell())
+        self._written_ns = os.stat(self.file).st_mtime_ns
+
+    @staticmethod
+    def make_entry(stat, digest):
+        return stat.st_size, stat.st_mtime_ns, stat.st_ino, digest
+
+    def is_stat_clean(self, path, stat):
+        """
+        True, если файл не изменился по сигнатуре stat.
+        Файлы, изменённые не раньше записи индекса, считаются
+        подозрительными: их изменение могло не отразиться на mtime.
+        """
+        entry = self.entries.get(path)
+        if entry is None:
+            return False
+        return (entry[self.SIZE] == stat.st_size and
+                entry[self.MTIME] == stat.st_mtime_ns and
+                entry[self.INODE] == stat.st_ino and
+                stat.st_mtime_ns < self._written_ns)
+
+    def digest(self, path):
+        return self.entries[path][self.DIGEST]
+
+    def size(self, path):
+        return self.entries[path][self.SIZE]
+
+    def digests(self):
+        return {entry[self.DIGEST] for entry in self.entries.values()}
+
+    def total_size(self):
+        return sum(entry[self.SIZE] for entry in self.entries.values())
+
+    def update(self, path, stat, digest):
+        self.entries[path] = self.make_entry(stat, digest)
+
+    def remove(self, path):
+        self.entries.pop(path, None)
+
+    def copy(self):
+        """Копия индекса, которую можно менять, не трогая исходный"""
+        index = TreeIndex(self.file)
+        index.entries = self.entries.copy()
+        index._written_ns = self._written_ns
+        return index
+
+    def __contains__(self, path):
+        return path in self.entries
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class MetadataStore:
+    """
+    Метаданные репозитория в базе sqlite3:
+    информация о коммитах хранится по имени коммита,
+    тэги - по имени тэга с индексом по коммиту,
+    снимки состояния папки - по имени коммита.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS commits (
+            name TEXT PRIMARY KEY,
+            info BLOB NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS tags (
+            name TEXT PRIMARY KEY,
+            commit_name TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS tags_by_commit ON tags (commit_name);
+        CREATE TABLE IF NOT EXISTS snapshots (
+            commit_name TEXT PRIMARY KEY,
+            manifest BLOB NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS commit_graph (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            parent INTEGER,
+            depth INTEGER NOT NULL,
+            jumps BLOB NOT NULL
+        );
+    """
+
+    def __init__(self, db_file):
+        self.file = db_file
+        self._connection = None
+        self.graph = CommitGraph(self)
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.file)
+            self._connection.executescript(self.SCHEMA)
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def get_commit(self, commit):
+        """Информация о коммите, KeyError, если коммита нет"""
+        row = self.connection.execute(
+            "SELECT info FROM commits WHERE name = ?", (commit,)).fetchone()
+        if row is None:
+            raise KeyError(commit)
+        Tracing.count("pickle_loads")
+        Tracing.count("bytes_read", len(row[0]))
+        return pickle.loads(row[0])
+
+    def put_commits(self, commit_infos):
+        """Добавление или обновление информации о коммитах"""
+        commit_infos = list(commit_infos)
+        rows = [(info.commit, pickle.dumps(info, pickle.HIGHEST_PROTOCOL))
+                for info in commit_infos]
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO commits (name, info) VALUES (?, ?)",
+                rows)
+            self.graph.add_commits((info.commit, info.prev_commit)
+                                   for info in commit_infos)
+
+    def iter_commits(self):
+        """Информация обо всех коммитах"""
+        for row in self.connection.execute("SELECT info FROM commits"):
+            yield pickle.loads(row[0])
+
+    def get_tag_commit(self, tag):
+        """Имя коммита по тэгу, None, если тэга нет"""
+        row = self.connection.execute(
+            "SELECT commit_name FROM tags WHERE name = ?", (tag,)).fetchone()
+        return None if row is None else row[0]
+
+    def get_commit_tags(self, commit):
+        """Список тэгов коммита"""
+        rows = self.connection.execute(
+            "SELECT name FROM tags WHERE commit_name = ? ORDER BY name",
+            (commit,))
+        return [row[0] for row in rows]
+
+    def put_tags(self, tag_to_commit):
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO tags (name, commit_name) VALUES (?, ?)",
+                tag_to_commit.items())
+
+    def has_snapshot(self, commit):
+        return self.connection.execute(
+            "SELECT 1 FROM snapshots WHERE commit_name = ?",
+            (commit,)).fetchone() is not None
+
+    def snapshot_size(self, commit):
+        """Размер снимка в байтах, None, если снимка нет"""
+        row = self.connection.execute(
+            "SELECT length(manifest) FROM snapshots WHERE commit_name = ?",
+            (commit,)).fetchone()
+        return None if row is None else row[0]
+
+    def get_snapshot(self, commit):
+        """Снимок: словарь относительный путь - (хэш, размер)"""
+        row = self.connection.execute(
+            "SELECT manifest FROM snapshots WHERE commit_name = ?",
+            (commit,)).fetchone()
+        if row is None:
+            raise KeyError(commit)
+        Tracing.count("pickle_loads")
+        Tracing.count("bytes_read", len(row[0]))
+        return pickle.loads(row[0])
+
+    def put_snapshot(self, commit, manifest):
+        data = pickle.dumps(manifest, pickle.HIGHEST_PROTOCOL)
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO snapshots (commit_name, manifest) "
+                "VALUES (?, ?)", (commit, data))
+
+    def commits_count(self):
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM commits").fetchone()[0]
+
+
+class CommitGraph:
+    """
+    Граф коммитов в базе метаданных: у каждого коммита номер, родитель,
+    глубина от первого коммита и таблица предков через 1, 2, 4, ...
+    коммитов. Родитель коммита не меняется ни веткой, ни сбросом,
+    поэтому строки графа только добавляются вместе с коммитами.
+    Путь между коммитами ищется через ближайшего общего предка
+    за O(log n) запросов, а не обходом всей истории.
+    """
+    # номера предков в таблице jumps, 8 байт на номер
+    JUMP_TYPE = 'q'
+
+    def __init__(self, store):
+        self._store = store
+
+    @property
+    def _connection(self):
+        return self._store.connection
+
+    def _node(self, key, by_name=False):
+        """(номер, имя, родитель, глубина, предки), KeyError, если нет"""
+        column = "name" if by_name else "id"
+        row = self._connection.execute(
+            f"SELECT id, name, parent, depth, jumps FROM commit_graph "
+            f"WHERE {column} = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        Tracing.count("graph_nodes_read")
+        return row[:4] + (array.array(self.JUMP_TYPE, row[4]),)
+
+    def __contains__(self, commit):
+        return self._connection.execute(
+            "SELECT 1 FROM commit_graph WHERE name = ?",
+            (commit,)).fetchone() is not None
+
+    def __len__(self):
+        return self._connection.execute(
+            "SELECT COUNT(*) FROM commit_graph").fetchone()[0]
+
+    def add_commits(self, commits):
+        """
+        Добавление пар коммит - родитель, которых ещё нет в графе,
+        родитель добавляется раньше потомка. Коммиты, родителя которых
+        нет ни в графе, ни среди пар, пропускаются до rebuild
+        """
+        parents = dict(commits)
+        pending = {commit: parent for commit, parent in parents.items()
+                   if commit not in self}
+        # узлы, добавленные в этом вызове, по номеру и по имени:
+        # предки новых коммитов обычно среди них
+        added = {}
+        for commit in list(pending):
+            chain = []
+            while commit in pending:
+                chain.append(commit)
+                commit = pending.pop(commit)
+            for commit in reversed(chain):
+                try:
+                    self._insert(commit, parents[commit], added)
+                except KeyError:
+                    break
+
+    def _cached_node(self, key, added, by_name=False):
+        node = added.get(key)
+        if node is None:
+            node = self._node(key, by_name)
+        return node
+
+    def _insert(self, commit, parent, added):
+        parent_id = None
+        if parent is None:
+            depth, jumps = 0, array.array(self.JUMP_TYPE)
+        else:
+            node = self._cached_node(parent, added, by_name=True)
+            parent_id = node[0]
+            depth = node[3] + 1
+            jumps = array.array(self.JUMP_TYPE, [node[0]])
+            # node - предок через 2^k коммитов, его предок через 2^k -
+            # предок нового коммита через 2^(k+1)
+            while len(node[4]) >= len(jumps):
+                jumps.append(node[4][len(jumps) - 1])
+                node = self._cached_node(jumps[-1], added)
+        cursor = self._connection.execute(
+            "INSERT INTO commit_graph (name, parent, depth, jumps) "
+            "VALUES (?, ?, ?, ?)", (commit, parent_id, depth,
+                                    jumps.tobytes()))
+        node = (cursor.lastrowid, commit, parent_id, depth, jumps)
+        added[node[0]] = added[commit] = node
+
+    def rebuild(self, commits):
+        """Построение графа заново по парам коммит - родитель"""
+        with self._connection:
+            self._connection.execute("DELETE FROM commit_graph")
+            self.add_commits(commits)
+
+    def _lift(self, node, depth):
+        """Предок узла node на глубине depth"""
+        while node[3] > depth:
+            step = (node[3] - depth).bit_length() - 1
+            node = self._node(node[4][step])
+        return node
+
+    def common_ancestor(self, first, second):
+        """Ближайший общий предок двух коммитов"""
+        return self._common_ancestor(self._node(first, by_name=True),
+                                     self._node(second, by_name=True))[1]
+
+    def _common_ancestor(self, first, second):
+        depth = min(first[3], second[3])
+        first = self._lift(first, depth)
+        second = self._lift(second, depth)
+        if first[0] == second[0]:
+            return first
+        for step in reversed(range(len(first[4]))):
+            if step < len(first[4]) and first[4][step] != second[4][step]:
+                first = self._node(first[4][step])
+                second = self._node(second[4][step])
+        return self._node(first[2])
+
+    def _chain(self, node, depth):
+        """Коммиты от node к корню выше глубины depth одним запросом"""
+        rows = self._connection.execute("""
+            WITH RECURSIVE chain(id, name, parent, depth) AS (
+                SELECT id, name, parent, depth FROM commit_graph
+                WHERE id = ? AND depth > ?
+                UNION ALL
+                SELECT g.id, g.name, g.parent, g.depth
+                FROM commit_graph g JOIN chain c ON g.id = c.parent
+                WHERE g.depth > ?
+            )
+            SELECT name FROM chain""", (node[0], depth, depth))
+        return [row[0] for row in rows]
+
+    def ancestors(self, commit, count):
+        """
+        Коммит и его предки по порядку, не больше count коммитов,
+        одним запросом
+        """
+        node = self._node(commit, by_name=True)
+        rows = self._connection.execute("""
+            WITH RECURSIVE chain(id, name, parent, number) AS (
+                SELECT id, name, parent, 1 FROM commit_graph WHERE id = ?
+                UNION ALL
+                SELECT g.id, g.name, g.parent, c.number + 1
+                FROM commit_graph g JOIN chain c ON g.id = c.parent
+                WHERE c.number < ?
+            )
+            SELECT name FROM chain""", (node[0], count))
+        return [row[0] for row in rows]
+
+    def path(self, start, finish):
+        """
+        Путь от коммита start к коммиту finish: коммиты, отменяемые
+        по пути назад от start до общего предка, и коммиты,
+        применяемые по пути вперёд от общего предка до finish
+        """
+        start_node = self._node(start, by_name=True)
+        finish_node = self._node(finish, by_name=True)
+        ancestor = self._common_ancestor(start_node, finish_node)
+        back = self._chain(start_node, ancestor[3])
+        forward = self._chain(finish_node, ancestor[3])
+        forward.reverse()
+        return back, forward
+
+
+class Settings:
+    """Настройки репозитория в файле config.ini"""
+    SECTION = "repository"
+    DEFAULTS = {
+        # снимок папки сохраняется каждые snapshot_interval коммитов,
+        # 0 - только когда цепочка изменений стала больше самой папки
+        "snapshot_interval": "50",
+        # сжатие файлов изменений: none, zlib или lzma, уровень 0-9
+        "compression": "zlib",
+        "compression_level": "6",
+        # число потоков, одновременно читающих папки при сравнении
+        "traversal_threads": "8",
+        # алгоритм сравнения строк файлов: histogram, myers или difflib
+        "diff_engine": "histogram",
+    }
+    CHOICES = {
+        "compression": ("none", "zlib", "lzma"),
+        "compression_level": tuple(str(x) for x in range(10)),
+        "diff_engine": ("histogram", "myers", "difflib"),
+    }
+
+    def __init__(self, config_file):
+        self.file = config_file
+        self._parser = configparser.ConfigParser()
+        self._parser.read_dict({self.SECTION: self.DEFAULTS})
+        if os.path.isfile(config_file):
+            self._parser.read(config_file)
+
+    def get(self, name):
+        return self._parser.get(self.SECTION, name)
+
+    def get_int(self, name):
+        return self._parser.getint(self.SECTION, name)
+
+    def items(self):
+        return self._parser.items(self.SECTION)
+
+    def set(self, name, value):
+        """
+        Изменение настройки, KeyError, если настройки нет,
+        ValueError, если у числовой настройки не числовое значение
+        или значение не из допустимых
+        """
+        if name not in self.DEFAULTS:
+            raise KeyError(name)
+        if self.DEFAULTS[name].isdigit():
+            value = str(int(value))
+        if name in self.CHOICES and value not in self.CHOICES[name]:
+            raise ValueError(value)
+        self._parser.set(self.SECTION, name, value)
+        with open(self.file, 'w') as config:
+            self._parser.write(config)
+
+
+class SignatureCache:
+    """
+    Значения, прочитанные из файлов, вместе с сигнатурами stat этих файлов.
+    Значение читается заново, если сигнатура изменилась или файл менялся
+    незадолго до чтения: такое изменение могло не отразиться на mtime
+    """
+    # файлы, изменённые не раньше, чем за столько наносекунд до чтения,
+    # считаются подозрительными
+    RACY_NS = 2 * 10 ** 9
+
+    def __init__(self):
+        self._values = {}
+
+    @staticmethod
+    def signature(files):
+        signature = []
+        for file in files:
+            try:
+                stat = os.stat(file)
+            except OSError:
+                signature.append(None)
+                continue
+            signature.append((stat.st_size, stat.st_mtime_ns,
+                              stat.st_ctime_ns, stat.st_ino))
+        return tuple(signature)
+
+    def get(self, key, files, load):
+        """Значение по ключу, load() - чтение значения из файлов files"""
+        signature = self.signature(files)
+        cached = self._values.get(key)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        value = load()
+        racy_ns = time.time_ns() - self.RACY_NS
+        if all(x is None or x[1] < racy_ns for x in signature):
+            self._values[key] = (signature, value)
+        else:
+            self._values.pop(key, None)
+        return value
+
+    def discard(self, predicate):
+        """Удаление значений, для которых predicate(значение) истинно"""
+        for key, (_, value) in list(self._values.items()):
+            if predicate(value):
+                del self._values[key]
+
+    def clear(self):
+        self._values.clear()
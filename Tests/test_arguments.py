@@ -0,0 +1,25 @@
+import os
+import unittest
+from contextlib import redirect_stderr
+from io import StringIO
+from CVS import parse_args
+
+
+class TestArguments(unittest.TestCase):
+    def test_jobs_before_and_after_path(self):
+        for argv in (["add", "-j", "4", "folder"],
+                     ["add", "folder", "-j", "4"]):
+            args = parse_args(argv)
+            self.assertEqual((args.command, args.path, args.jobs),
+                             (["add"], "folder", 4))
+        self.assertIsNone(parse_args(["add", "folder"]).jobs)
+        self.assertEqual(parse_args(["add", "-j", "0", "folder"]).jobs,
+                         os.cpu_count())
+
+    def test_jobs_need_a_number(self):
+        with redirect_stderr(StringIO()), self.assertRaises(SystemExit):
+            parse_args(["add", "-j", "folder"])
+
+
+if __name__ == '__main__':
+    unittest.main()
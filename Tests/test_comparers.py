@@ -1,8 +1,12 @@
 import sys
 import os
+import tempfile
 import unittest
-from Comparers import DirContentComparer, FilesComparer
+from Comparers import DirContentComparer, FilesComparer, BinaryComparer, \
+    BlockDelta, IgnoreMatcher
 import difflib
+import random
+from Storages import TreeIndex, file_digest
 
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
                              os.path.pardir))
@@ -45,6 +49,88 @@ class TestDirContentComparer(unittest.TestCase):
             self.assertTrue(file in deleted_list)
 
 
+class TestParallelTraversal(unittest.TestCase):
+    def test_same_order_as_serial(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for i in range(4):
+                for j in range(3):
+                    folder = os.path.join(tmp, f"dir{i}", f"sub{j}")
+                    os.makedirs(folder)
+                    for k in range(3):
+                        with open(os.path.join(folder, f"{k}.txt"), 'w'):
+                            pass
+            with open(os.path.join(tmp, "root.txt"), 'w'):
+                pass
+            os.makedirs(os.path.join(tmp, "repository"))
+            index = TreeIndex(os.path.join(tmp, "index.dat"))
+            serial = DirContentComparer(tmp, tree_index=index)
+            serial.compare()
+            parallel = DirContentComparer(tmp, tree_index=index, threads=4)
+            parallel.compare()
+            self.assertEqual(len(serial.added), 37)
+            self.assertEqual(parallel.added, serial.added)
+
+
+class TestIgnoreMatcher(unittest.TestCase):
+    def test_patterns(self):
+        matcher = IgnoreMatcher([r".*\.log", "node_modules/",
+                                 "/build/", "/docs/draft\\.txt", ""])
+        self.assertTrue(matcher.is_file_ignored("app.log"))
+        self.assertTrue(matcher.is_file_ignored(os.path.join("a", "b.log")))
+        self.assertFalse(matcher.is_file_ignored("node_modules"))
+        self.assertTrue(matcher.is_dir_ignored(
+            os.path.join("a", "node_modules")))
+        self.assertTrue(matcher.is_dir_ignored("build"))
+        self.assertFalse(matcher.is_dir_ignored(os.path.join("a", "build")))
+        self.assertTrue(matcher.is_file_ignored(
+            os.path.join("docs", "draft.txt")))
+        self.assertFalse(matcher.is_file_ignored("draft.txt"))
+
+    def test_ignored_folders_are_not_walked(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for folder in ("src", os.path.join("src", "node_modules", "pkg"),
+                           "build", os.path.join("src", "build")):
+                os.makedirs(os.path.join(tmp, folder))
+                for name in ("a.txt", "b.log"):
+                    with open(os.path.join(tmp, folder, name), 'w'):
+                        pass
+            os.makedirs(os.path.join(tmp, "repository", "last_state"))
+            patterns = [r".*\.log", "node_modules/", "/build/"]
+            expected = sorted([os.path.join("src", "a.txt"),
+                               os.path.join("src", "build", "a.txt")])
+            index = TreeIndex(os.path.join(tmp, "index.dat"))
+            for comparer in (DirContentComparer(tmp, patterns, index),
+                             DirContentComparer(tmp, patterns, index, 4),
+                             DirContentComparer(tmp, patterns)):
+                comparer.compare()
+                self.assertEqual(sorted(comparer.added), expected)
+
+    def test_ignored_indexed_files_are_not_deleted(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.makedirs(os.path.join(tmp, "build"))
+            os.makedirs(os.path.join(tmp, "repository", "last_state"))
+            index = TreeIndex(os.path.join(tmp, "repository", "index.dat"))
+            files = ["a.txt", "app.log", os.path.join("build", "b.txt")]
+            for file in files:
+                with open(os.path.join(tmp, file), 'w') as f:
+                    f.write(file)
+                index.entries[file] = index.make_entry(
+                    os.stat(os.path.join(tmp, file)),
+                    file_digest(os.path.join(tmp, file)))
+            index.entries["gone.txt"] = index.entries["a.txt"]
+            index.save()
+            # файлы индекса, игнорируемые после добавления
+            patterns = [r".*\.log", "/build/"]
+            dirty = set(files) | {"build", "gone.txt"}
+            for comparer, dirty_paths in [
+                    (DirContentComparer(tmp, patterns, index), None),
+                    (DirContentComparer(tmp, patterns, index, 4), None),
+                    (DirContentComparer(tmp, patterns, index), dirty)]:
+                comparer.compare(changed_paths=dirty_paths)
+                self.assertEqual(comparer.deleted, ["gone.txt"])
+                self.assertEqual(comparer.added + comparer.changed, [])
+
+
 class TestFileComparerRestoring(unittest.TestCase):
     def comparing(self, start, finish):
         diff = difflib.unified_diff(start, finish, n=0)
@@ -79,6 +165,119 @@ class TestFileComparerRestoring(unittest.TestCase):
                   "six", "seven", "eight", "nine", "5"]
         self.comparing(start, finish)
 
+    def test_restore_changes_at_borders(self):
+        self.comparing(["one", "two"], ["zero", "one", "two", "three"])
+        self.comparing(["one", "two", "three"], ["two"])
+        self.comparing([], ["one"])
+        self.comparing(["one"], [])
+
+    def test_restore_random_changes(self):
+        rand = random.Random(0)
+        for _ in range(50):
+            start = [str(rand.randint(0, 9)) for _ in range(40)]
+            finish = list(start)
+            for _ in range(rand.randint(1, 15)):
+                position = rand.randint(0, len(finish))
+                if rand.random() < 0.5 and position < len(finish):
+                    del finish[position]
+                else:
+                    finish.insert(position, str(rand.randint(0, 20)))
+            self.comparing(start, finish)
+
+
+class TestParallelFilesComparer(unittest.TestCase):
+    def test_same_result_as_serial(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            pairs = []
+            for i in range(6):
+                old = os.path.join(tmp, f"old{i}.txt")
+                new = os.path.join(tmp, f"new{i}.txt")
+                with open(old, 'w') as f:
+                    f.writelines(f"{x}\n" for x in range(i * 100))
+                with open(new, 'w') as f:
+                    f.writelines(f"{x * 2}\n" for x in range(i * 100))
+                pairs.append([old, new])
+            serial = FilesComparer(pairs).compareFiles()
+            parallel = FilesComparer(pairs, jobs=3).compareFiles()
+            self.assertEqual(list(parallel), list(serial))
+            for name in serial:
+                self.assertEqual(
+                    [(x.old_start, x.old_lines, x.new_lines)
+                     for x in parallel[name]],
+                    [(x.old_start, x.old_lines, x.new_lines)
+                     for x in serial[name]])
+
+
+class TestMappedFilesComparer(unittest.TestCase):
+    LINES = 120000
+
+    def restoring(self, old, new):
+        """Изменения больших файлов восстанавливают новую версию"""
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = [os.path.join(tmp, "old.txt"),
+                     os.path.join(tmp, "new.txt")]
+            for path, data in zip(paths, (old, new)):
+                with open(path, 'wb') as f:
+                    f.write(data)
+            delta = FilesComparer([paths]).compareFiles()[paths[1]]
+            with open(paths[0], 'r') as f:
+                old_lines = f.readlines()
+            with open(paths[1], 'r') as f:
+                new_lines = f.readlines()
+        self.assertEqual(FilesComparer.next_file_version(old_lines, delta),
+                         new_lines)
+        self.assertEqual(
+            FilesComparer.previous_file_version(new_lines, delta), old_lines)
+        return delta
+
+    def test_changes_in_large_files(self):
+        lines = [f"line {i}\n".encode() for i in range(self.LINES)]
+        old = b''.join(lines)
+        middle = len(lines) // 2
+        self.assertEqual(self.restoring(old, old), [])
+        delta = self.restoring(
+            old, b''.join(lines[:middle] + [b"new\n"] + lines[middle + 1:]))
+        self.assertEqual(len(delta), 1)
+        self.assertEqual(delta[0].old_start, middle + 1)
+        self.restoring(old, b"first\n" + old + b"last")
+        self.restoring(old, old[:-3])
+        self.restoring(old.replace(b"\n", b"\r\n"),
+                       old.replace(b"\n", b"\r\n")[10:])
+        lone_cr = old[:100] + b"\r" + old[100:]
+        self.restoring(lone_cr, lone_cr + b"appended\n")
+
+
+class TestBinaryComparer(unittest.TestCase):
+    def restoring(self, basis, target):
+        ops = BinaryComparer.block_delta(basis, target)
+        self.assertEqual(BinaryComparer.apply(basis, ops), target)
+        return ops
+
+    def test_small_edit_costs_little(self):
+        rand = random.Random(0)
+        basis = bytes(rand.getrandbits(8) for _ in range(200000))
+        target = basis[:1000] + b"inserted" + basis[1000:150000] + \
+            basis[150100:]
+        ops = self.restoring(basis, target)
+        inserted = sum(len(op[1]) for op in ops
+                       if op[0] == BlockDelta.INSERT)
+        self.assertLess(inserted, 3 * BinaryComparer.block_size(len(basis)))
+
+    def test_restore_random_changes(self):
+        rand = random.Random(1)
+        for _ in range(20):
+            basis = bytearray(rand.getrandbits(8) for _ in range(10000))
+            target = bytearray(basis)
+            for _ in range(rand.randint(1, 5)):
+                position = rand.randint(0, len(target))
+                if rand.random() < 0.5:
+                    del target[position:position + rand.randint(1, 3000)]
+                else:
+                    target[position:position] = bytes(rand.randint(0, 3000))
+            self.restoring(bytes(basis), bytes(target))
+        self.restoring(b"", b"\0data")
+        self.restoring(b"\0data", b"")
+
 
 if __name__ == '__main__':
     unittest.main()
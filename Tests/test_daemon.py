@@ -0,0 +1,57 @@
+import io
+import sys
+import os
+import socket
+import tempfile
+import threading
+import unittest
+import argparse
+import contextlib
+from Daemon import CommandServer, run_in_daemon
+from Storages import SignatureCache
+
+
+@unittest.skipUnless(hasattr(socket, 'AF_UNIX'), "Unix sockets are required")
+class TestCommandServer(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        os.mkdir(os.path.join(self.tmp.name, "repository"))
+        self.executed = []
+        server = CommandServer(self.tmp.name, self.execute, SignatureCache())
+        threading.Thread(target=server.serve, daemon=True).start()
+        socket_file = os.path.join(self.tmp.name, "repository",
+                                   "daemon.sock")
+        while not os.path.exists(socket_file):
+            pass
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def execute(self, args):
+        self.executed.append(args)
+        print(f"{args.command[0]} in daemon")
+        if args.command[0] == "fail":
+            sys.exit("Failed")
+
+    def run_command(self, command, path=None):
+        args = argparse.Namespace(command=[command],
+                                  path=path or self.tmp.name)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            served = run_in_daemon(args)
+        return served, output.getvalue()
+
+    def test_commands_are_served(self):
+        self.assertEqual(self.run_command("status"),
+                         (True, "status in daemon\n"))
+        self.assertEqual(self.executed[0].path,
+                         os.path.abspath(self.tmp.name))
+        with self.assertRaises(SystemExit) as e:
+            self.run_command("fail")
+        self.assertEqual(e.exception.code, "Failed")
+        self.assertEqual(self.run_command("init"), (False, ""))
+        self.assertEqual(len(self.executed), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
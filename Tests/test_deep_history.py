@@ -0,0 +1,128 @@
+import time
+import queue
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from CommitInfo import CommitInfo
+from Commands.CommitsPathSeeker import CommitsPathSeeker
+from Commands.init import RepoInit
+from Commands.reset import ResetRepo
+
+COMMITS = 100000
+BRANCH_START = 50000
+BRANCH_COMMITS = 1000
+# поиск пути по истории любой длины должен укладываться в секунду
+LIMIT = 1
+
+
+class TestDeepHistory(unittest.TestCase):
+    """
+    Навигация по истории из COMMITS коммитов ветки main и ветки side,
+    отходящей от коммита BRANCH_START. Изменения коммитов не читаются,
+    проверяется только поиск коммитов пути
+    """
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        with redirect_stdout(StringIO()):
+            RepoInit(cls.tmp.name).init()
+        repo = ResetRepo(cls.tmp.name)
+        infos = []
+        previous = None
+        for number in range(COMMITS):
+            info = CommitInfo()
+            if previous is None:
+                info.set_init_commit(str(number))
+            else:
+                info.set_next_commit_on_branch(previous, str(number))
+            infos.append(info)
+            previous = info
+        previous = infos[BRANCH_START]
+        previous.set_new_branch('side')
+        for number in range(COMMITS, COMMITS + BRANCH_COMMITS):
+            info = CommitInfo()
+            info.set_next_commit_on_branch(previous, str(number))
+            infos.append(info)
+            previous = info
+        repo.metadata_store.put_commits(infos)
+        repo.metadata_store.put_tags({'v10': '10',
+                                      'side': str(COMMITS +
+                                                  BRANCH_COMMITS - 1)})
+        repo.rewrite_head(str(COMMITS - 1))
+        repo.rewrite_branch_head(infos[COMMITS - 1])
+        repo.rewrite_branch_head(infos[-1])
+        repo.flush()
+        repo.metadata_store.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def setUp(self):
+        self.repo = ResetRepo(self.tmp.name)
+        self.seeker = CommitsPathSeeker(self.repo)
+        self.start = time.perf_counter()
+
+    def tearDown(self):
+        self.repo.metadata_store.close()
+
+    def assert_fast(self):
+        self.assertLess(time.perf_counter() - self.start, LIMIT)
+
+    @staticmethod
+    def to_list(track):
+        return [track.get() for _ in range(track.qsize())]
+
+    def test_steps_back(self):
+        track = queue.Queue()
+        self.seeker.get_switch_back_track_by_steps(track, self.repo.head,
+                                                   COMMITS - 1)
+        self.assert_fast()
+        track = self.to_list(track)
+        self.assertEqual(len(track), COMMITS - 1)
+        self.assertEqual((track[0], track[-1]), (str(COMMITS - 1), '1'))
+        # первый коммит не отменяется
+        with self.assertRaises(self.repo.SwitchingException):
+            self.seeker.get_switch_back_track_by_steps(
+                queue.Queue(), self.repo.head, COMMITS)
+
+    def test_steps_forward(self):
+        track = queue.Queue()
+        self.seeker.get_switch_forward_track_by_steps(track, '10', 'main',
+                                                      COMMITS - 11)
+        track = self.to_list(track)
+        self.assertEqual((track[0], track[-1]), ('11', str(COMMITS - 1)))
+        track = queue.Queue()
+        self.seeker.get_switch_forward_track_by_steps(track, '10', 'side',
+                                                      BRANCH_START - 9)
+        self.assert_fast()
+        self.assertEqual(self.to_list(track)[-1], str(COMMITS))
+
+    def test_tag_path_through_branches(self):
+        side = self.repo.get_commit_info(self.repo.get_tag_commit('side'))
+        paths = self.seeker.get_paths_through_branches(self.repo.head, side)
+        self.assert_fast()
+        (back, is_back), (forward, is_forward_back) = \
+            [(self.to_list(track), flag) for track, flag in paths]
+        self.assertEqual((is_back, is_forward_back), (True, False))
+        self.assertEqual(len(back), COMMITS - 1 - BRANCH_START)
+        self.assertEqual(back[-1], str(BRANCH_START + 1))
+        self.assertEqual(len(forward), BRANCH_COMMITS)
+        self.assertEqual(forward[0], str(COMMITS))
+
+    def test_reset_by_tag(self):
+        track = queue.Queue()
+        self.repo.get_resets_track_by_tag(track, self.repo.head,
+                                          self.repo.get_tag_commit('v10'))
+        self.assert_fast()
+        track = self.to_list(track)
+        self.assertEqual(len(track), COMMITS - 11)
+        self.assertEqual(track[-1], '11')
+        with self.assertRaises(self.repo.SwitchingException):
+            self.repo.get_resets_track_by_tag(
+                queue.Queue(), '10', self.repo.get_tag_commit('side'))
+
+
+if __name__ == '__main__':
+    unittest.main()
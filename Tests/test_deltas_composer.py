@@ -0,0 +1,150 @@
+import os
+import difflib
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from Commands.DeltasComposer import DeltasComposer
+from Commands.init import RepoInit
+from Commands.switch import SwitchingRepo
+from Comparers import FilesComparer
+from Storages import TreeIndex
+
+
+class FakeDeltas:
+    def __init__(self, added=None, deleted=None, changed=None):
+        self.added = added or {}
+        self.deleted = deleted or {}
+        self.changed = changed or {}
+
+
+class TestDeltasComposer(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        with redirect_stdout(StringIO()):
+            RepoInit(self.dir).init()
+        self.repo = SwitchingRepo(self.dir)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def read(self, file):
+        with open(os.path.join(self.dir, file), 'r') as f:
+            return f.readlines()
+
+    @staticmethod
+    def diff(start, finish):
+        return list(difflib.unified_diff(start, finish, n=0))
+
+    def test_added_then_deleted_file_is_not_created(self):
+        digest = self.repo.object_store.put_bytes(b"temporary\n")
+        composer = DeltasComposer(self.repo)
+        composer.next_state(FakeDeltas(added={"tmp.txt": digest}))
+        composer.next_state(FakeDeltas(deleted={"tmp.txt": digest}))
+        composer.flush()
+        self.assertFalse(os.path.exists(os.path.join(self.dir, "tmp.txt")))
+
+    def test_changes_are_composed(self):
+        versions = [["one\n"], ["one\n", "two\n"],
+                    ["zero\n", "one\n", "two\n"]]
+        with open(os.path.join(self.dir, "file.txt"), 'w') as f:
+            f.writelines(versions[0])
+        deltas = [FakeDeltas(changed={"file.txt": self.diff(versions[i],
+                                                            versions[i + 1])})
+                  for i in range(2)]
+        composer = DeltasComposer(self.repo)
+        for delta in deltas:
+            composer.next_state(delta)
+        self.assertEqual(self.read("file.txt"), versions[0])
+        composer.flush()
+        self.assertEqual(self.read("file.txt"), versions[2])
+
+        composer = DeltasComposer(self.repo)
+        for delta in reversed(deltas):
+            composer.previous_state(delta)
+        composer.flush()
+        self.assertEqual(self.read("file.txt"), versions[0])
+
+    def test_change_of_added_file(self):
+        digest = self.repo.object_store.put_bytes(b"a\n")
+        composer = DeltasComposer(self.repo)
+        composer.next_state(FakeDeltas(added={"new.txt": digest}))
+        composer.next_state(FakeDeltas(
+            changed={"new.txt": self.diff(["a\n"], ["a\n", "b\n"])}))
+        self.assertEqual(composer.affected_files, ["new.txt"])
+        composer.flush()
+        self.assertEqual(self.read("new.txt"), ["a\n", "b\n"])
+
+    def test_binary_changes(self):
+        versions = [b"\0first", b"\0second\0", b"\0second\0third"]
+        path = os.path.join(self.dir, "file.bin")
+        deltas = []
+        for i in range(2):
+            for version, name in [(versions[i], "old.bin"),
+                                  (versions[i + 1], path)]:
+                with open(os.path.join(self.dir, name), 'wb') as f:
+                    f.write(version)
+            comparer = FilesComparer([[os.path.join(self.dir, "old.bin"),
+                                       path]])
+            deltas.append(FakeDeltas(changed={"file.bin":
+                                              comparer.compareFiles()[path]}))
+        os.remove(os.path.join(self.dir, "old.bin"))
+        with open(path, 'wb') as f:
+            f.write(versions[0])
+        composer = DeltasComposer(self.repo)
+        for delta in deltas:
+            composer.next_state(delta)
+        composer.flush()
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), versions[2])
+
+        composer = DeltasComposer(self.repo)
+        for delta in reversed(deltas):
+            composer.previous_state(delta)
+        composer.flush()
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), versions[0])
+
+    def test_restore_snapshot(self):
+        for file, content in [("same.txt", "same\n"), ("old.txt", "old\n"),
+                              ("changed.txt", "before\n")]:
+            with open(os.path.join(self.dir, file), 'w') as f:
+                f.write(content)
+        self.repo.update_last_state()
+        same = self.repo.object_store.put_bytes(b"same\n")
+        changed = self.repo.object_store.put_bytes(b"after\n")
+        manifest = {"same.txt": (same, 5), "changed.txt": (changed, 6)}
+        composer = DeltasComposer(self.repo)
+        composer.restore_snapshot(manifest,
+                                  TreeIndex.load(self.repo.tree_index))
+        self.assertEqual(sorted(composer.affected_files),
+                         ["changed.txt", "old.txt"])
+        composer.flush()
+        self.assertEqual(self.read("changed.txt"), ["after\n"])
+        self.assertFalse(os.path.exists(os.path.join(self.dir, "old.txt")))
+
+    def test_update_last_state_checks_only_written_files(self):
+        for file, content in [("same.txt", "same\n"), ("old.txt", "old\n")]:
+            with open(os.path.join(self.dir, file), 'w') as f:
+                f.write(content)
+        self.repo.update_last_state()
+        new = self.repo.object_store.put_bytes(b"new\n")
+        composer = DeltasComposer(self.repo)
+        composer.next_state(FakeDeltas(added={"new.txt": new},
+                                       deleted={"old.txt": None}))
+        self.repo.applied_files.update(composer.affected_files)
+        composer.flush()
+        # файл вне записанных путей не сверяется
+        with open(os.path.join(self.dir, "same.txt"), 'w') as f:
+            f.write("edited\n")
+        self.repo.update_last_state(changed_paths=self.repo.applied_files)
+        index = TreeIndex.load(self.repo.tree_index)
+        self.assertEqual(sorted(index), ["new.txt", "same.txt"])
+        self.assertEqual(index.digest("new.txt"), new)
+        self.assertEqual(self.repo.compare_with_last_state().changed,
+                         ["same.txt"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import io
+import os
+import difflib
+import tempfile
+import unittest
+from Comparers import Deltas, FilesComparer, BinaryComparer, BlockDelta
+from DeltasFormat import DeltasWriter, DeltasReader, DeltasFormatException, \
+    append_deltas, read_deltas, is_deltas_file, is_compressed, \
+    rewrite_deltas, convert_legacy_deltas, DeltasAppender
+from Storages import ObjectStore
+
+
+class TestDeltasFormat(unittest.TestCase):
+    @staticmethod
+    def changed(start, finish):
+        comparer = FilesComparer()
+        comparer.compare(start, finish, 'file')
+        return comparer.deltas['file']
+
+    def round_trip(self, deltas_list):
+        stream = io.BytesIO()
+        writer = DeltasWriter(stream)
+        writer.write_header()
+        for deltas in deltas_list:
+            writer.write_deltas(deltas)
+        stream.seek(0)
+        reader = DeltasReader(stream)
+        reader.read_header()
+        return list(reader)
+
+    def test_round_trip(self):
+        start = ["one\n", "two\n", "three"]
+        finish = ["zero\n", "one\n", "three\n", "four"]
+        hunks = self.changed(start, finish)
+        deltas = Deltas.from_parts({'added.txt': 'a' * 40},
+                                   {'deleted.txt': 'b' * 40},
+                                   {os.path.join('dir', 'file'): hunks})
+        read = self.round_trip([deltas, Deltas.from_parts({}, {}, {})])
+        self.assertEqual(len(read), 2)
+        self.assertEqual(read[0].added, deltas.added)
+        self.assertEqual(read[0].deleted, deltas.deleted)
+        read_hunks = read[0].changed[os.path.join('dir', 'file')]
+        self.assertEqual(FilesComparer.next_file_version(start, read_hunks),
+                         finish)
+        self.assertEqual(
+            FilesComparer.previous_file_version(finish, read_hunks), start)
+
+    def test_lines_which_can_not_be_joined(self):
+        start = ["one\n", "two", "", "three\n"]
+        finish = ["one\n", "two\nand a half\n", "three\n"]
+        hunks = self.changed(start, finish)
+        read = self.round_trip([Deltas.from_parts({}, {}, {'f': hunks})])
+        read_hunks = read[0].changed['f']
+        self.assertEqual(FilesComparer.next_file_version(start, read_hunks),
+                         finish)
+        self.assertEqual(
+            FilesComparer.previous_file_version(finish, read_hunks), start)
+
+    def test_binary_round_trip(self):
+        start = b"\0" * 5000 + b"middle" + b"\1" * 5000
+        finish = b"\0" * 5000 + b"new middle" + b"\1" * 4000
+        delta = BlockDelta(BinaryComparer.block_delta(start, finish),
+                           BinaryComparer.block_delta(finish, start))
+        read = self.round_trip([Deltas.from_parts({}, {}, {'bin': delta})])
+        read_delta = read[0].changed['bin']
+        self.assertEqual(BinaryComparer.apply(start, read_delta.forward),
+                         finish)
+        self.assertEqual(BinaryComparer.apply(finish, read_delta.backward),
+                         start)
+
+    def test_not_deltas_file(self):
+        reader = DeltasReader(io.BytesIO(b'not deltas'))
+        with self.assertRaises(DeltasFormatException):
+            reader.read_header()
+
+    def test_append_and_convert_legacy(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = ObjectStore(tmp)
+            unified = list(difflib.unified_diff(["a\n"], ["b\n"], n=0))
+            legacy = Deltas.from_parts(
+                {'added.txt': ["line\n"]}, {},
+                {os.path.join(tmp, 'changed.txt'): unified})
+            converted = convert_legacy_deltas(legacy, tmp, store)
+            digest = converted.added['added.txt']
+            self.assertEqual(store.read(digest), b"line\n")
+            self.assertEqual(list(converted.changed), ['changed.txt'])
+
+            deltas_file = os.path.join(tmp, 'index.dat')
+            open(deltas_file, 'wb').close()
+            self.assertTrue(is_deltas_file(deltas_file))
+            self.assertEqual(read_deltas(deltas_file), [])
+            append_deltas(deltas_file, converted)
+            append_deltas(deltas_file, converted)
+            read = read_deltas(deltas_file)
+            self.assertEqual(len(read), 2)
+            self.assertEqual(
+                FilesComparer.next_file_version(
+                    ["a\n"], read[1].changed['changed.txt']), ["b\n"])
+
+    def test_compressed_parts(self):
+        lines = [f"line {i}\n" for i in range(5000)]
+        hunks = self.changed(lines, lines[::2])
+        deltas = Deltas.from_parts({}, {}, {'f': hunks})
+        with tempfile.TemporaryDirectory() as tmp:
+            plain_file = os.path.join(tmp, 'plain.dat')
+            append_deltas(plain_file, deltas)
+            deltas_file = os.path.join(tmp, 'index.dat')
+            append_deltas(deltas_file, deltas, 'zlib')
+            self.assertLess(os.path.getsize(deltas_file),
+                            os.path.getsize(plain_file))
+            append_deltas(deltas_file, deltas, 'lzma', 1)
+            append_deltas(deltas_file, deltas, 'none')
+            self.assertTrue(is_deltas_file(deltas_file))
+            self.assertTrue(is_compressed(deltas_file))
+            read = read_deltas(deltas_file)
+            self.assertEqual(len(read), 3)
+            for read_deltas_info in read:
+                self.assertEqual(FilesComparer.next_file_version(
+                    lines, read_deltas_info.changed['f']), lines[::2])
+
+            rewrite_deltas(deltas_file, 'none')
+            self.assertFalse(is_compressed(deltas_file))
+            self.assertEqual(len(read_deltas(deltas_file)), 3)
+            rewrite_deltas(plain_file, 'lzma')
+            self.assertTrue(is_compressed(plain_file))
+            self.assertEqual(len(read_deltas(plain_file)), 1)
+
+    def test_appender_writes_records_one_by_one(self):
+        hunks = self.changed(["a\n"], ["b\n"])
+        for codec in ('none', 'zlib'):
+            with tempfile.TemporaryDirectory() as tmp:
+                deltas_file = os.path.join(tmp, 'index.dat')
+                with DeltasAppender(deltas_file, codec) as appender:
+                    appender.write_change('added', 'new.txt', 'a' * 40)
+                    appender.write_change('changed', 'file.txt', hunks)
+                size = os.path.getsize(deltas_file)
+                with self.assertRaises(RuntimeError):
+                    with DeltasAppender(deltas_file, codec) as appender:
+                        appender.write_change('deleted', 'new.txt', 'a' * 40)
+                        raise RuntimeError()
+                self.assertEqual(os.path.getsize(deltas_file), size)
+                read = read_deltas(deltas_file)
+                self.assertEqual(len(read), 1)
+                self.assertEqual(read[0].added, {'new.txt': 'a' * 40})
+                self.assertEqual(list(read[0].changed), ['file.txt'])
+
+
+if __name__ == '__main__':
+    unittest.main()
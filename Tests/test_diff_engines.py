@@ -0,0 +1,69 @@
+import random
+import unittest
+from DiffEngines import ENGINES
+
+
+class TestDiffEngines(unittest.TestCase):
+    @staticmethod
+    def apply(a, b, opcodes):
+        result = []
+        position = 0
+        for _, i1, i2, j1, j2 in opcodes:
+            result.extend(a[position:i1])
+            result.extend(b[j1:j2])
+            position = i2
+        result.extend(a[position:])
+        return result
+
+    @staticmethod
+    def changed_lines(opcodes):
+        return sum(i2 - i1 + j2 - j1 for _, i1, i2, j1, j2 in opcodes)
+
+    def test_random_changes(self):
+        rand = random.Random(0)
+        for _ in range(300):
+            a = [f"{rand.randint(0, 4)}\n" for _ in range(rand.randint(0, 40))]
+            if rand.random() < 0.5:
+                b = [f"{rand.randint(0, 4)}\n"
+                     for _ in range(rand.randint(0, 40))]
+            else:
+                b = [x for x in a if rand.random() < 0.8] + ["new\n"]
+            for name, engine in ENGINES.items():
+                opcodes = engine(a, b)
+                self.assertEqual(self.apply(a, b, opcodes), b, name)
+                self.assertTrue(all(x[0] != 'equal' for x in opcodes))
+
+    def test_myers_is_minimal(self):
+        rand = random.Random(1)
+        for _ in range(100):
+            a = [rand.randint(0, 3) for _ in range(30)]
+            b = [rand.randint(0, 3) for _ in range(30)]
+            self.assertLessEqual(
+                self.changed_lines(ENGINES["myers"](a, b)),
+                self.changed_lines(ENGINES["difflib"](a, b)))
+
+    def test_repeated_lines(self):
+        a = ["{\n", "}\n"] * 500
+        b = list(a)
+        b[500:500] = ["inserted\n"]
+        del b[100]
+        for name in ("myers", "histogram"):
+            self.assertEqual(self.changed_lines(ENGINES[name](a, b)), 2)
+
+
+    def test_bounded_search_on_skewed_sizes(self):
+        # поиск обрывается на MAX_COST, когда одна сторона много длиннее
+        rand = random.Random(2)
+        for _ in range(20):
+            a = [f"row {rand.randint(0, 1)}\n" for _ in range(600)]
+            b = [f"row {rand.randint(0, 1)}\n"
+                 for _ in range(rand.randint(1, 10))]
+            for first, second in ((a, b), (b, a)):
+                for name in ("myers", "histogram"):
+                    opcodes = ENGINES[name](first, second)
+                    self.assertEqual(self.apply(first, second, opcodes),
+                                     second, name)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from Commands.RepositoryInfo import RepositoryInfo
+from Commands.init import RepoInit
+
+
+class TestRepositorySession(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        with redirect_stdout(StringIO()):
+            RepoInit(self.tmp.name).init()
+        self.repo = RepositoryInfo(self.tmp.name)
+
+    def tearDown(self):
+        self.repo.metadata_store.close()
+        self.tmp.cleanup()
+
+    def test_changes_are_written_on_flush(self):
+        self.repo.set_new_commit('0')
+        self.repo.session.add_tag('first', '0')
+        self.assertEqual(self.repo.head, '0')
+        self.assertEqual(self.repo.get_tag_commit('first'), '0')
+        self.assertEqual(os.path.getsize(self.repo.branches), 0)
+        self.assertEqual(self.repo.metadata_store.commits_count(), 0)
+
+        self.repo.flush()
+        reopened = RepositoryInfo(self.tmp.name)
+        self.assertEqual(reopened.head, '0')
+        self.assertEqual(reopened.get_branch_head_commit('main'), '0')
+        self.assertEqual(reopened.get_tag_commit('first'), '0')
+        self.assertEqual(reopened.get_commit_info('0').branch, 'main')
+        reopened.metadata_store.close()
+
+    def test_commit_info_is_read_once(self):
+        self.repo.set_new_commit('0')
+        self.repo.flush()
+        repo = RepositoryInfo(self.tmp.name)
+        info = repo.get_commit_info('0')
+        self.assertIs(repo.get_commit_info('0'), info)
+        self.assertIs(repo.get_head_commit_info(), info)
+        repo.metadata_store.close()
+
+    def test_head_set_to_none_is_not_reread(self):
+        self.repo.set_new_commit('0')
+        self.repo.flush()
+        repo = RepositoryInfo(self.tmp.name)
+        repo.rewrite_head(None)
+        self.assertIsNone(repo.head)
+        self.assertTrue(repo.session.is_dirty)
+        repo.metadata_store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import os
+import sys
+import tempfile
+import subprocess
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             os.path.pardir, "Benchmarks"))
+from startup import CVS, import_times  # noqa: E402
+from startup import HEAVY_MODULES, LIGHT_COMMANDS  # noqa: E402
+
+
+class TestStartup(unittest.TestCase):
+    """
+    Команды без сравнения файлов не загружают модули сравнения,
+    время загрузки проверяется в Benchmarks/startup.py
+    """
+    def test_light_commands_skip_heavy_modules(self):
+        with tempfile.TemporaryDirectory() as path:
+            subprocess.run([sys.executable, CVS, "init", path],
+                           stdout=subprocess.DEVNULL, check=True)
+            for command in LIGHT_COMMANDS:
+                with self.subTest(command=command):
+                    times = import_times(command, path)
+                    self.assertIn("Commands", times)
+                    self.assertEqual(
+                        [x for x in HEAVY_MODULES if x in times], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,229 @@
+import os
+import time
+import tempfile
+import unittest
+from Comparers import DirContentComparer
+from CommitInfo import CommitInfo
+from Storages import ObjectStore, TreeIndex, MetadataStore, Settings, \
+    SignatureCache, file_digest
+
+
+class TestTreeIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        os.mkdir(os.path.join(self.dir, "repository"))
+        os.mkdir(os.path.join(self.dir, "Folder"))
+        for file in ["Same.txt", "Changed.txt", "Deleted.txt",
+                     os.path.join("Folder", "Same.txt")]:
+            self.write(file, "111")
+        self.index = TreeIndex(os.path.join(self.dir, "repository",
+                                            "tree_index.dat"))
+        for file in ["Same.txt", "Changed.txt", "Deleted.txt",
+                     os.path.join("Folder", "Same.txt")]:
+            absolute_file = os.path.join(self.dir, file)
+            self.index.update(file, os.stat(absolute_file),
+                              file_digest(absolute_file))
+        self.index.save()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, file, content):
+        with open(os.path.join(self.dir, file), 'w') as f:
+            f.write(content)
+
+    def compare(self):
+        comparer = DirContentComparer(self.dir,
+                                      tree_index=TreeIndex.load(
+                                          self.index.file))
+        comparer.compare()
+        return comparer
+
+    def test_save_and_load(self):
+        loaded = TreeIndex.load(self.index.file)
+        self.assertEqual(loaded.entries, self.index.entries)
+        self.assertIsNone(TreeIndex.load(os.path.join(self.dir, "no.dat")))
+
+    def test_index_compare(self):
+        os.remove(os.path.join(self.dir, "Deleted.txt"))
+        self.write("Changed.txt", "222")
+        self.write("Added.txt", "")
+        comparer = self.compare()
+        self.assertEqual(comparer.added, ["Added.txt"])
+        self.assertEqual(comparer.changed, ["Changed.txt"])
+        self.assertEqual(comparer.deleted, ["Deleted.txt"])
+
+    def test_racily_clean_file_is_checked(self):
+        path = os.path.join(self.dir, "Changed.txt")
+        future = os.stat(self.index.file).st_mtime_ns + 10 ** 9
+        os.utime(path, ns=(future, future))
+        self.index.update("Changed.txt", os.stat(path), file_digest(path))
+        self.index.save()
+        self.write("Changed.txt", "222")
+        os.utime(path, ns=(future, future))
+        self.assertEqual(self.compare().changed, ["Changed.txt"])
+
+    def test_touched_file_is_refreshed(self):
+        path = os.path.join(self.dir, "Same.txt")
+        os.utime(path, ns=(0, 0))
+        comparer = self.compare()
+        self.assertEqual(comparer.changed, [])
+        self.assertEqual(comparer.refreshed, ["Same.txt"])
+
+
+class TestObjectStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = ObjectStore(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_identical_content_is_stored_once(self):
+        first = self.store.put_bytes(b"content")
+        file = os.path.join(self.tmp.name, "file.txt")
+        with open(file, 'wb') as f:
+            f.write(b"content")
+        self.assertEqual(self.store.put_file(file), first)
+        self.assertEqual(self.store.read(first), b"content")
+        blobs = [name for _, _, files in os.walk(self.tmp.name)
+                 for name in files if name != "file.txt"]
+        self.assertEqual(len(blobs), 1)
+
+    def test_release_keeps_pinned_blobs(self):
+        loose = self.store.put_bytes(b"loose")
+        pinned = self.store.put_bytes(b"pinned")
+        self.store.pin(pinned)
+        self.store.release(loose)
+        self.store.release(pinned)
+        self.assertFalse(self.store.has(loose))
+        self.assertTrue(self.store.has(pinned))
+
+
+class TestMetadataStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = MetadataStore(os.path.join(self.tmp.name, "meta.db"))
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def test_put_and_get_commit(self):
+        first = CommitInfo()
+        first.set_init_commit('0')
+        second = CommitInfo()
+        second.set_next_commit_on_branch(first, '1')
+        self.store.put_commits([first, second])
+        self.assertEqual(self.store.get_commit('0').next_on_branch, '1')
+        self.assertEqual(self.store.get_commit('1').prev_commit, '0')
+        self.assertEqual(self.store.commits_count(), 2)
+        with self.assertRaises(KeyError):
+            self.store.get_commit('2')
+
+    def test_commit_is_rewritten(self):
+        info = CommitInfo()
+        info.set_init_commit('0')
+        self.store.put_commits([info])
+        info.set_new_branch('branch')
+        self.store.put_commits([info])
+        self.assertEqual(self.store.get_commit('0').branch, 'branch')
+        self.assertEqual(self.store.commits_count(), 1)
+
+    def test_tags_lookup(self):
+        self.store.put_tags({'v1': '0', 'build-2': '1', 'build-1': '1'})
+        self.assertEqual(self.store.get_tag_commit('v1'), '0')
+        self.assertIsNone(self.store.get_tag_commit('v2'))
+        self.assertEqual(self.store.get_commit_tags('1'),
+                         ['build-1', 'build-2'])
+        self.assertEqual(self.store.get_commit_tags('2'), [])
+
+    def test_snapshots(self):
+        self.assertIsNone(self.store.snapshot_size('0'))
+        self.store.put_snapshot('0', {'file.txt': ('digest', 3)})
+        self.assertTrue(self.store.has_snapshot('0'))
+        self.assertFalse(self.store.has_snapshot('1'))
+        self.assertGreater(self.store.snapshot_size('0'), 0)
+        self.assertEqual(self.store.get_snapshot('0'),
+                         {'file.txt': ('digest', 3)})
+
+    def test_commit_graph_paths(self):
+        # 0 - 1 - 2 - 3 - 4
+        #      \- 5 - 6
+        parents = {'0': None, '1': '0', '2': '1', '3': '2', '4': '3',
+                   '5': '1', '6': '5'}
+        infos = []
+        for commit, parent in reversed(list(parents.items())):
+            info = CommitInfo()
+            info.commit, info.prev_commit = commit, parent
+            infos.append(info)
+        self.store.put_commits(infos)
+        graph = self.store.graph
+        self.assertEqual(len(graph), 7)
+        self.assertEqual(graph.common_ancestor('4', '6'), '1')
+        self.assertEqual(graph.common_ancestor('3', '1'), '1')
+        self.assertEqual(graph.path('4', '6'), (['4', '3', '2'], ['5', '6']))
+        self.assertEqual(graph.path('1', '3'), ([], ['2', '3']))
+        self.assertEqual(graph.path('6', '0'), (['6', '5', '1'], []))
+        self.assertEqual(graph.path('2', '2'), ([], []))
+
+        graph.rebuild([('0', None), ('1', '0')])
+        self.assertEqual(len(graph), 2)
+        with self.assertRaises(KeyError):
+            graph.path('0', '4')
+
+
+class TestSettings(unittest.TestCase):
+    def test_set_and_reload(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            config = os.path.join(tmp, "config.ini")
+            settings = Settings(config)
+            self.assertEqual(settings.get_int("snapshot_interval"), 50)
+            settings.set("snapshot_interval", "7")
+            self.assertEqual(Settings(config).get_int("snapshot_interval"), 7)
+            with self.assertRaises(KeyError):
+                settings.set("unknown", "1")
+            with self.assertRaises(ValueError):
+                settings.set("snapshot_interval", "many")
+
+    def test_choices(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            settings = Settings(os.path.join(tmp, "config.ini"))
+            settings.set("compression", "lzma")
+            self.assertEqual(settings.get("compression"), "lzma")
+            with self.assertRaises(ValueError):
+                settings.set("compression", "gzip")
+            with self.assertRaises(ValueError):
+                settings.set("compression_level", "10")
+
+
+
+class TestSignatureCache(unittest.TestCase):
+    def test_value_is_read_again_after_change(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            file = os.path.join(tmp, "value.txt")
+            with open(file, 'w') as f:
+                f.write("1")
+            old = time.time_ns() - 10 * SignatureCache.RACY_NS
+            os.utime(file, ns=(old, old))
+            cache = SignatureCache()
+            loads = []
+
+            def load():
+                loads.append(1)
+                with open(file) as f:
+                    return f.read()
+            self.assertEqual(cache.get("value", [file], load), "1")
+            self.assertEqual(cache.get("value", [file], load), "1")
+            self.assertEqual(len(loads), 1)
+            with open(file, 'w') as f:
+                f.write("22")
+            self.assertEqual(cache.get("value", [file], load), "22")
+            # только что изменённый файл не кэшируется
+            self.assertEqual(cache.get("value", [file], load), "22")
+            self.assertEqual(len(loads), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
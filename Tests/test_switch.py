@@ -0,0 +1,90 @@
+import os
+import tempfile
+import argparse
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from Commands import execute
+from Commands.add import AddRepo
+
+
+class TestSwitch(unittest.TestCase):
+    """Переходы switch и reset по истории через команды CVS"""
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.run_command("init")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, file, content):
+        with open(os.path.join(self.dir, file), 'w') as f:
+            f.write(content)
+
+    def read(self, file):
+        with open(os.path.join(self.dir, file)) as f:
+            return f.read()
+
+    def run_command(self, *command, tag=None):
+        args = argparse.Namespace(command=list(command), path=self.dir,
+                                  branchname=None, tag=tag, comment=None,
+                                  jobs=None)
+        output = StringIO()
+        with redirect_stdout(output):
+            execute(args)
+        return output.getvalue()
+
+    def commit(self, file, content, tag=None):
+        self.write(file, content)
+        self.run_command("add")
+        self.run_command("commit", tag=tag)
+
+    def head(self):
+        repo = AddRepo(self.dir)
+        head = repo.head
+        repo.metadata_store.close()
+        return head
+
+    def assert_clean(self):
+        self.assertIn("Nothing to add", self.run_command("status"))
+
+    def test_tag_switch_after_reset(self):
+        self.commit("f.txt", "0\n")
+        self.commit("f.txt", "1\n")
+        self.commit("f.txt", "2\n", tag="t2")
+        self.run_command("reset", "1")
+        self.commit("g.txt", "g\n")
+        # путь к t2 идёт назад через новый коммит и вперёд к отрезанному
+        self.run_command("switch", tag="t2")
+        self.assertEqual(self.head(), "2")
+        self.assertEqual(self.read("f.txt"), "2\n")
+        self.assertFalse(os.path.exists(os.path.join(self.dir, "g.txt")))
+        self.assert_clean()
+
+    def test_first_commit_is_not_reverted(self):
+        self.commit("f.txt", "0\n", tag="t0")
+        for command in (("switch", "-1"), ("reset", "1")):
+            output = self.run_command(*command)
+            self.assertIn("Rollback is impossible", output)
+            self.assertEqual(self.head(), "0")
+            self.assertEqual(self.read("f.txt"), "0\n")
+        self.assert_clean()
+
+    def test_steps_must_be_positive(self):
+        self.commit("f.txt", "0\n")
+        self.commit("f.txt", "1\n")
+        with open(os.path.join(self.dir, "repository", "logs.txt")) as f:
+            logs = f.read()
+        for command in (("switch", "-0"), ("switch", "+0"),
+                        ("switch", "--1"), ("reset", "-1")):
+            output = self.run_command(*command)
+            self.assertIn("Put a positive amount of steps", output)
+            self.assertNotIn("finished", output)
+        self.assertEqual(self.head(), "1")
+        with open(os.path.join(self.dir, "repository", "logs.txt")) as f:
+            self.assertEqual(f.read(), logs)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import os
+import json
+import tempfile
+import threading
+import unittest
+import Tracing
+
+
+class TestTracing(unittest.TestCase):
+    def tearDown(self):
+        Tracing.stop()
+
+    def test_disabled(self):
+        Tracing.start()
+        Tracing.stop()
+        self.assertIs(Tracing.span("phase"), Tracing.NULL_SPAN)
+        with Tracing.span("phase"):
+            Tracing.count("files")
+        self.assertEqual(Tracing.spans(), [])
+        self.assertEqual(Tracing.totals(), {})
+
+    def test_counters_go_to_innermost_span(self):
+        Tracing.start()
+        with Tracing.span("command"):
+            Tracing.count("pickle_loads")
+            for _ in range(2):
+                with Tracing.span("compare"):
+                    Tracing.count("files", 3)
+        worker = threading.Thread(target=Tracing.count, args=("files", 1))
+        worker.start()
+        worker.join()
+        Tracing.stop()
+        spans = {x.name: x for x in Tracing.spans()}
+        self.assertEqual(spans["command"].counters, {"pickle_loads": 1})
+        self.assertEqual(spans["compare"].counters, {"files": 3})
+        self.assertEqual(Tracing.totals(), {"pickle_loads": 1, "files": 7})
+        self.assertGreaterEqual(spans["command"].children,
+                                spans["compare"].end - spans["compare"].start)
+        lines = Tracing.summary().splitlines()
+        self.assertTrue(lines[1].startswith("command"))
+        self.assertIn("files=6", lines[2])
+        self.assertEqual(lines[-1], "total: files=7, pickle_loads=1")
+
+    def test_chrome_trace(self):
+        Tracing.start()
+        with Tracing.span("command"):
+            with Tracing.span("compare"):
+                Tracing.count("files")
+        Tracing.stop()
+        with tempfile.TemporaryDirectory() as tmp:
+            file = os.path.join(tmp, "trace.json")
+            Tracing.write_chrome_trace(file)
+            with open(file) as f:
+                events = json.load(f)["traceEvents"]
+        self.assertEqual([x["name"] for x in events], ["command", "compare"])
+        self.assertEqual(events[1]["args"], {"files": 1})
+        self.assertTrue(all(x["ph"] == "X" for x in events))
+        self.assertLessEqual(events[0]["ts"], events[1]["ts"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,207 @@
+import os
+import tempfile
+import threading
+import argparse
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from Comparers import DirContentComparer, IgnoreMatcher
+from Storages import TreeIndex, file_digest
+from Journal import DirtyJournal
+from Watcher import PollingWatcher, InotifyWatcher
+from Commands import execute
+from Commands.add import AddRepo
+
+
+class TestDirtyJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.repository = os.path.join(self.dir, "repository")
+        os.makedirs(os.path.join(self.dir, "Folder", "Inner"))
+        os.mkdir(self.repository)
+        for file in ["Same.txt", "Changed.txt", "Deleted.txt",
+                     os.path.join("Folder", "Inner", "Same.txt")]:
+            self.write(file, "111")
+        self.index = TreeIndex(os.path.join(self.repository,
+                                            "tree_index.dat"))
+        for file in ["Same.txt", "Changed.txt", "Deleted.txt",
+                     os.path.join("Folder", "Inner", "Same.txt")]:
+            absolute_file = os.path.join(self.dir, file)
+            self.index.update(file, os.stat(absolute_file),
+                              file_digest(absolute_file))
+        self.index.save()
+        self.journal = DirtyJournal(self.repository)
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def tearDown(self):
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+        self.journal.stop()
+        self.tmp.cleanup()
+
+    def write(self, file, content):
+        with open(os.path.join(self.dir, file), 'w') as f:
+            f.write(content)
+
+    def start_watcher(self):
+        os.makedirs(self.journal.cookies, exist_ok=True)
+        watcher = PollingWatcher(self.dir, IgnoreMatcher([]),
+                                 self.journal.cookies)
+        self.journal.start()
+
+        def run():
+            while not self.stopped.is_set():
+                lines = watcher.read(0.01)
+                if lines:
+                    self.journal.append(lines)
+        self.thread = threading.Thread(target=run)
+        self.thread.start()
+
+    def compare(self, journal=None):
+        comparer = DirContentComparer(
+            self.dir, tree_index=TreeIndex.load(self.index.file),
+            journal=journal)
+        comparer.compare()
+        return comparer
+
+    def test_without_watcher(self):
+        self.assertEqual(self.journal.snapshot(), (None, None))
+
+    def test_journal_compare_matches_full_compare(self):
+        self.start_watcher()
+        comparer = self.compare(self.journal)
+        self.assertEqual(comparer.added, [])
+        self.journal.mark_clean(comparer.journal_position)
+
+        os.remove(os.path.join(self.dir, "Deleted.txt"))
+        self.write("Changed.txt", "222")
+        self.write(os.path.join("Folder", "Added.txt"), "")
+        os.rename(os.path.join(self.dir, "Folder", "Inner"),
+                  os.path.join(self.dir, "Folder", "Moved"))
+        dirty_paths, _ = self.journal.snapshot()
+        self.assertNotIn("Same.txt", dirty_paths)
+        journal_comparer = self.compare(self.journal)
+        full_comparer = self.compare()
+        for attribute in ("added", "changed", "deleted"):
+            self.assertEqual(getattr(journal_comparer, attribute),
+                             getattr(full_comparer, attribute))
+        self.assertEqual(journal_comparer.deleted,
+                         ["Deleted.txt",
+                          os.path.join("Folder", "Inner", "Same.txt")])
+
+    def test_overflow_and_ignore_change_need_full_compare(self):
+        self.start_watcher()
+        _, position = self.journal.snapshot()
+        self.journal.mark_clean(position)
+        self.assertEqual(self.journal.snapshot()[0], set())
+        self.journal.append(['!overflow'])
+        self.assertIsNone(self.journal.snapshot()[0])
+        _, position = self.journal.snapshot()
+        self.journal.mark_clean(position)
+        self.write("CVSignore.txt", "")
+        self.assertIsNone(self.journal.snapshot()[0])
+
+    @unittest.skipUnless(hasattr(os, 'O_CLOEXEC'), "inotify is Linux only")
+    def test_inotify_events(self):
+        os.makedirs(self.journal.cookies)
+        try:
+            watcher = InotifyWatcher(self.dir, IgnoreMatcher(["Skip/"]),
+                                     self.journal.cookies)
+        except (OSError, AttributeError):
+            self.skipTest("inotify is not available")
+        try:
+            self.write("Changed.txt", "222")
+            os.makedirs(os.path.join(self.dir, "New", "Skip"))
+            lines = []
+            while "+New" not in lines:
+                lines.extend(watcher.read(1))
+            self.write(os.path.join("New", "Skip", "Skipped.txt"), "")
+            self.write(os.path.join("New", "Added.txt"), "")
+            open(os.path.join(self.journal.cookies, "cookie"), 'w').close()
+            while "?cookie" not in lines:
+                lines.extend(watcher.read(1))
+        finally:
+            watcher.close()
+        self.assertIn("+Changed.txt", lines)
+        self.assertIn("+New", lines)
+        self.assertIn("+" + os.path.join("New", "Added.txt"), lines)
+        self.assertNotIn("+" + os.path.join("New", "Skip", "Skipped.txt"),
+                         lines)
+
+
+
+class TestCheckoutWithJournal(unittest.TestCase):
+    """
+    Checkout не проверяет папку на несохранённые изменения:
+    с наблюдателем и без него они остаются видны в status
+    """
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.run_command("init")
+        for file in ("kept.txt", "switched.txt"):
+            self.write(file, "main\n")
+        self.run_command("add")
+        self.run_command("commit")
+        self.run_command("branch", branchname="side")
+        self.write("switched.txt", "side\n")
+        self.run_command("add")
+        self.run_command("commit")
+        self.stopped = threading.Event()
+        self.thread = None
+        self.journal = AddRepo(self.dir).journal
+
+    def tearDown(self):
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+        self.journal.stop()
+        self.tmp.cleanup()
+
+    def write(self, file, content):
+        with open(os.path.join(self.dir, file), 'w') as f:
+            f.write(content)
+
+    def run_command(self, command, branchname=None):
+        args = argparse.Namespace(command=[command], path=self.dir,
+                                  branchname=branchname, tag=None,
+                                  comment=None, jobs=None)
+        with redirect_stdout(StringIO()):
+            execute(args)
+
+    def start_watcher(self):
+        os.makedirs(self.journal.cookies, exist_ok=True)
+        watcher = PollingWatcher(self.dir, IgnoreMatcher([]),
+                                 self.journal.cookies)
+        self.journal.start()
+
+        def run():
+            while not self.stopped.is_set():
+                lines = watcher.read(0.01)
+                if lines:
+                    self.journal.append(lines)
+        self.thread = threading.Thread(target=run)
+        self.thread.start()
+
+    def checkout_with_edit(self):
+        self.write("kept.txt", "uncommitted\n")
+        self.run_command("checkout", branchname="main")
+        with open(os.path.join(self.dir, "switched.txt")) as f:
+            self.assertEqual(f.read(), "main\n")
+        return AddRepo(self.dir).compare_with_last_state().changed
+
+    def test_without_journal(self):
+        self.assertEqual(self.checkout_with_edit(), ["kept.txt"])
+
+    def test_with_journal(self):
+        self.start_watcher()
+        # сверка, от которой журнал отсчитывает изменения
+        AddRepo(self.dir).is_last_state_relevant()
+        self.assertEqual(self.checkout_with_edit(), ["kept.txt"])
+
+
+if __name__ == '__main__':
+    unittest.main()
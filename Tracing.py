@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import threading
+
+# пока трассировка не включена, span возвращает общий пустой участок,
+# а count ничего не считает, поэтому замеры почти ничего не стоят
+_enabled = False
+_local = threading.local()
+_lock = threading.Lock()
+# завершённые участки в порядке завершения
+_finished = []
+# счётчики всей команды, в том числе посчитанные вне участков
+_totals = {}
+_started_ns = 0
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """
+    Участок выполнения команды: время начала и конца, поток,
+    время вложенных участков и счётчики, посчитанные внутри него,
+    но не во вложенных участках
+    """
+    __slots__ = ('name', 'start', 'end', 'thread', 'children', 'counters')
+
+    def __init__(self, name):
+        self.name = name
+        self.start = 0
+        self.end = 0
+        self.thread = threading.get_ident()
+        self.children = 0
+        self.counters = {}
+
+    def __enter__(self):
+        _stack().append(self)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.end = time.perf_counter_ns()
+        stack = _stack()
+        stack.pop()
+        if stack:
+            stack[-1].children += self.end - self.start
+        with _lock:
+            _finished.append(self)
+        return False
+
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def is_enabled():
+    return _enabled
+
+
+def start():
+    """Включение трассировки, замеры прошлого запуска сбрасываются"""
+    global _enabled, _started_ns
+    with _lock:
+        _finished.clear()
+        _totals.clear()
+    _started_ns = time.perf_counter_ns()
+    _enabled = True
+
+
+def stop():
+    global _enabled
+    _enabled = False
+
+
+def span(name):
+    """Контекст участка name, пустой, если трассировка выключена"""
+    if not _enabled:
+        return NULL_SPAN
+    return Span(name)
+
+
+def count(name, value=1):
+    """Прибавление value к счётчику name текущего участка и всей команды"""
+    if not _enabled:
+        return
+    stack = getattr(_local, 'stack', None)
+    with _lock:
+        _totals[name] = _totals.get(name, 0) + value
+        if stack:
+            counters = stack[-1].counters
+            counters[name] = counters.get(name, 0) + value
+
+
+def spans():
+    with _lock:
+        return list(_finished)
+
+
+def totals():
+    with _lock:
+        return dict(_totals)
+
+
+def summary():
+    """
+    Таблица участков в порядке первого входа: число входов,
+    общее и собственное время в мс и счётчики, затем счётчики всей команды
+    """
+    rows = {}
+    for finished in sorted(spans(), key=lambda x: x.start):
+        row = rows.setdefault(finished.name, [0, 0, 0, {}])
+        row[0] += 1
+        row[1] += finished.end - finished.start
+        row[2] += finished.end - finished.start - finished.children
+        for name, value in finished.counters.items():
+            row[3][name] = row[3].get(name, 0) + value
+    width = max([len(name) for name in rows] + [len("phase")])
+    lines = [f"{'phase':<{width}} {'calls':>6} {'total, ms':>10} "
+             f"{'self, ms':>10}  counters"]
+    for name, (calls, total, own, counters) in rows.items():
+        lines.append(f"{name:<{width}} {calls:>6} {total / 1e6:>10.1f} "
+                     f"{own / 1e6:>10.1f}  {_format_counters(counters)}")
+    lines.append(f"total: {_format_counters(totals())}")
+    return '\n'.join(lines)
+
+
+def _format_counters(counters):
+    return ', '.join(f"{name}={value}"
+                     for name, value in sorted(counters.items()))
+
+
+def chrome_trace():
+    """Участки в формате Chrome trace: события с длительностью в мкс"""
+    pid = os.getpid()
+    events = [{"name": finished.name, "ph": "X", "pid": pid,
+               "tid": finished.thread,
+               "ts": (finished.start - _started_ns) / 1000,
+               "dur": (finished.end - finished.start) / 1000,
+               "args": finished.counters}
+              for finished in spans()]
+    events.sort(key=lambda x: x["ts"])
+    return {"traceEvents": events, "displayTimeUnit": "ms",
+            "otherData": {"counters": totals()}}
+
+
+def write_chrome_trace(file):
+    """Запись трассировки в файл, который открывается в chrome://tracing"""
+    with open(file, 'w') as f:
+        json.dump(chrome_trace(), f)
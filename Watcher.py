@@ -0,0 +1,259 @@
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+from IgnorePatterns import IgnoreMatcher
+
+# раз во столько секунд наблюдатель без inotify обходит папку
+POLL_INTERVAL = 1
+
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_EXCL_UNLINK = 0x4000000
+IN_ISDIR = 0x40000000
+INOTIFY_EVENT = struct.Struct('iIII')
+
+
+class InotifyWatcher:
+    """Наблюдение за папкой через inotify, только Linux"""
+    MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM |
+            IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF |
+            IN_MOVE_SELF | IN_EXCL_UNLINK)
+    DIR_CHANGES = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+
+    def __init__(self, root, ignore, cookies):
+        self._root = root
+        self._ignore = ignore
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'),
+                                 use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._paths = {}
+        self._watches = {}
+        try:
+            self._cookies = self._add_watch(cookies, IN_CREATE)
+            self._add_tree('')
+        except OSError:
+            self.close()
+            raise
+
+    def _add_watch(self, path, mask):
+        watch = self._libc.inotify_add_watch(self._fd, os.fsencode(path),
+                                             mask)
+        if watch < 0:
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed",
+                          path)
+        return watch
+
+    def _add_tree(self, relative):
+        """Наблюдение за папкой и всеми её подпапками"""
+        try:
+            watch = self._add_watch(os.path.join(self._root, relative),
+                                    self.MASK)
+        except OSError as e:
+            if e.errno in (errno.ENOENT, errno.ENOTDIR):
+                return
+            raise
+        self._paths[watch] = relative
+        self._watches[relative] = watch
+        try:
+            entries = list(os.scandir(os.path.join(self._root, relative)))
+        except OSError:
+            return
+        for entry in entries:
+            path = os.path.join(relative, entry.name)
+            if entry.is_dir(follow_symlinks=False) and \
+                    self._is_watched_dir(path):
+                self._add_tree(path)
+
+    def _remove_tree(self, relative):
+        for path, watch in list(self._watches.items()):
+            if path == relative or path.startswith(relative + os.sep):
+                self._libc.inotify_rm_watch(self._fd, watch)
+                del self._watches[path]
+                self._paths.pop(watch, None)
+
+    def _is_watched_dir(self, relative):
+        return relative != "repository" and \
+            not self._ignore.is_dir_ignored(relative)
+
+    def read(self, timeout):
+        """Строки журнала для событий, пришедших за время ожидания"""
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return []
+        lines = []
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                watch, mask, _, length = INOTIFY_EVENT.unpack_from(data,
+                                                                   offset)
+                start = offset + INOTIFY_EVENT.size
+                name = os.fsdecode(data[start:start + length].rstrip(b'\0'))
+                offset = start + length
+                lines.extend(self._event_lines(watch, mask, name))
+        return lines
+
+    def _event_lines(self, watch, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            return ['!overflow']
+        if watch == self._cookies:
+            return ['?' + name] if mask & IN_CREATE and name else []
+        if mask & IN_IGNORED:
+            path = self._paths.pop(watch, None)
+            if path is not None:
+                self._watches.pop(path, None)
+            return ['!overflow'] if path == '' else []
+        parent = self._paths.get(watch)
+        if parent is None:
+            return []
+        if not name:
+            # сама папка удалена или перемещена, об этом сообщит родитель
+            return ['!overflow'] if parent == '' and \
+                mask & (IN_DELETE_SELF | IN_MOVE_SELF) else []
+        path = os.path.join(parent, name)
+        if mask & IN_ISDIR:
+            if not mask & self.DIR_CHANGES or \
+                    not self._is_watched_dir(path):
+                return []
+            if mask & (IN_MOVED_FROM | IN_DELETE):
+                self._remove_tree(path)
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                self._add_tree(path)
+        elif parent == '' and name == "repository":
+            return []
+        return ['+' + path]
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class PollingWatcher:
+    """
+    Наблюдение за папкой обходом раз в POLL_INTERVAL секунд,
+    если inotify недоступен
+    """
+    def __init__(self, root, ignore, cookies):
+        self._root = root
+        self._ignore = ignore
+        self._cookies = cookies
+        self._state = self._scan()
+
+    def _scan(self):
+        """Относительный путь -> (папка ли, mtime_ns, размер, inode)"""
+        state = {}
+        folders = ['']
+        while folders:
+            relative = folders.pop()
+            try:
+                entries = list(os.scandir(os.path.join(self._root,
+                                                       relative)))
+            except OSError:
+                continue
+            for entry in entries:
+                path = os.path.join(relative, entry.name)
+                try:
+                    stat = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                is_dir = entry.is_dir(follow_symlinks=False)
+                if is_dir:
+                    if path == "repository" or \
+                            self._ignore.is_dir_ignored(path):
+                        continue
+                    folders.append(path)
+                state[path] = (is_dir, stat.st_mtime_ns, stat.st_size,
+                               stat.st_ino)
+        return state
+
+    def read(self, timeout):
+        """
+        Строки журнала для изменений, найденных обходом. Файлы-метки
+        читаются до обхода, значит изменения до их появления уже найдены
+        """
+        time.sleep(timeout)
+        try:
+            cookies = sorted(os.listdir(self._cookies))
+        except OSError:
+            cookies = []
+        state = self._scan()
+        lines = []
+        for path in sorted(self._state.keys() | state.keys()):
+            old, new = self._state.get(path), state.get(path)
+            if old == new:
+                continue
+            # у папки меняется mtime, когда меняется её содержимое,
+            # но содержимое и так попадёт в журнал
+            if old is not None and new is not None and old[0] and new[0]:
+                continue
+            lines.append('+' + path)
+        self._state = state
+        return lines + ['?' + cookie for cookie in cookies]
+
+    def close(self):
+        pass
+
+
+def watch_folder(root, journal, ignore_file, log=print, stopped=None):
+    """
+    Ведение журнала изменений папки root, пока процесс не прервут
+    или не установят событие stopped.
+    После изменения CVSignore.txt наблюдение начинается заново,
+    если inotify отказал, папка дальше обходится раз в POLL_INTERVAL секунд
+    """
+    os.makedirs(journal.cookies, exist_ok=True)
+    use_inotify = True
+    try:
+        while stopped is None or not stopped.is_set():
+            patterns = []
+            if os.path.isfile(ignore_file):
+                with open(ignore_file, 'r') as f:
+                    patterns = f.read().split('\n')
+            ignore = IgnoreMatcher(patterns)
+            watcher = None
+            if use_inotify:
+                try:
+                    watcher = InotifyWatcher(root, ignore, journal.cookies)
+                    log("Watching with inotify.")
+                except (OSError, AttributeError, TypeError):
+                    use_inotify = False
+            if watcher is None:
+                watcher = PollingWatcher(root, ignore, journal.cookies)
+                log(f"Watching by scanning every {POLL_INTERVAL} s.")
+            # журнал начинается после установки наблюдения,
+            # до этого команды обходят папку целиком
+            journal.start()
+            try:
+                while stopped is None or not stopped.is_set():
+                    try:
+                        lines = watcher.read(POLL_INTERVAL)
+                    except OSError:
+                        use_inotify = False
+                        break
+                    if lines:
+                        journal.append(lines)
+                    if '+CVSignore.txt' in lines:
+                        break
+            finally:
+                watcher.close()
+    finally:
+        journal.stop()